@@ -0,0 +1,175 @@
+"""
+Graph backends for the Reasoning Engine.
+
+Every backend answers the same common-neighbor link prediction query, so
+the API can run against Neo4j in production or an in-process adjacency
+(e.g. a SemanticKnowledgeGraph export) for local testing.
+
+All methods are blocking; the API calls them from a thread pool.
+"""
+import json
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    from neo4j import GraphDatabase
+    from neo4j.exceptions import ServiceUnavailable
+    NEO4J_AVAILABLE = True
+except ImportError:
+    NEO4J_AVAILABLE = False
+    ServiceUnavailable = ConnectionError
+
+# (candidate node id, number of common neighbors)
+Candidates = List[Tuple[str, int]]
+
+
+class GraphUnavailable(Exception):
+    """The graph store cannot be reached."""
+
+
+class GraphBackend:
+    """Interface shared by all graph backends."""
+
+    def verify_connectivity(self) -> bool:
+        raise NotImplementedError
+
+    def common_neighbors(self, node_id: str, top_k: int) -> Candidates:
+        """Unconnected nodes sharing out-neighbors with node_id, best first."""
+        return self.common_neighbors_many([node_id], top_k)[node_id]
+
+    def common_neighbors_many(self, node_ids: List[str], top_k: int) -> Dict[str, Candidates]:
+        return {node_id: self.common_neighbors(node_id, top_k) for node_id in node_ids}
+
+    def add_relation(self, source_id: str, target_id: str):
+        raise NotImplementedError
+
+    def predecessors(self, node_id: str) -> Set[str]:
+        """Nodes with a RELATED_TO edge into node_id."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class Neo4jBackend(GraphBackend):
+    """Concept graph stored in Neo4j."""
+
+    COMMON_NEIGHBORS_QUERY = """
+    UNWIND $nodeIds AS nodeId
+    MATCH (source:Concept {id: nodeId})
+    CALL {
+        WITH source
+        MATCH (source)-[:RELATED_TO]->(common)<-[:RELATED_TO]-(candidate:Concept)
+        WHERE NOT (source)-[:RELATED_TO]-(candidate) AND source <> candidate
+        WITH candidate, count(common) as common_neighbors
+        WHERE common_neighbors >= 1
+        RETURN candidate.id as target, common_neighbors
+        ORDER BY common_neighbors DESC
+        LIMIT $topK
+    }
+    RETURN nodeId as source, target, common_neighbors
+    """
+
+    ADD_RELATION_QUERY = """
+    MERGE (source:Concept {id: $sourceId})
+    MERGE (target:Concept {id: $targetId})
+    MERGE (source)-[:RELATED_TO]->(target)
+    """
+
+    PREDECESSORS_QUERY = """
+    MATCH (other:Concept)-[:RELATED_TO]->(:Concept {id: $nodeId})
+    RETURN other.id as id
+    """
+
+    def __init__(self, uri: str, user: str, password: str):
+        if not NEO4J_AVAILABLE:
+            raise ImportError("neo4j driver not installed. Run: pip install neo4j")
+        # Local Docker connections often fail handshake if encryption is on by default
+        self.driver = GraphDatabase.driver(uri, auth=(user, password), encrypted=False)
+
+    def close(self):
+        self.driver.close()
+
+    def verify_connectivity(self) -> bool:
+        try:
+            self.driver.verify_connectivity()
+            return True
+        except Exception as e:
+            print(f"Connection Error: {e}")
+            return False
+
+    def _run(self, query: str, **params) -> list:
+        try:
+            with self.driver.session() as session:
+                return list(session.run(query, **params))
+        except ServiceUnavailable as e:
+            raise GraphUnavailable(str(e)) from e
+
+    def common_neighbors_many(self, node_ids: List[str], top_k: int) -> Dict[str, Candidates]:
+        results: Dict[str, Candidates] = {node_id: [] for node_id in node_ids}
+        for record in self._run(self.COMMON_NEIGHBORS_QUERY, nodeIds=list(node_ids), topK=top_k):
+            results[record["source"]].append((record["target"], record["common_neighbors"]))
+        return results
+
+    def add_relation(self, source_id: str, target_id: str):
+        self._run(self.ADD_RELATION_QUERY, sourceId=source_id, targetId=target_id)
+
+    def predecessors(self, node_id: str) -> Set[str]:
+        return {record["id"] for record in self._run(self.PREDECESSORS_QUERY, nodeId=node_id)}
+
+
+class InMemoryGraphBackend(GraphBackend):
+    """
+    Directed RELATED_TO graph held in process.
+
+    Accepts a SemanticKnowledgeGraph-style adjacency
+    ({source: [(target, relation), ...]}) or plain {source: [target, ...]}.
+    """
+
+    def __init__(self, adjacency: Optional[Dict[str, Iterable]] = None):
+        self._lock = threading.RLock()
+        self.successors: Dict[str, Set[str]] = defaultdict(set)
+        self.incoming: Dict[str, Set[str]] = defaultdict(set)
+
+        for source_id, targets in (adjacency or {}).items():
+            for target in targets:
+                self.add_relation(source_id, target[0] if isinstance(target, (tuple, list)) else target)
+
+    @classmethod
+    def from_edges_file(cls, path: Path) -> "InMemoryGraphBackend":
+        """Load a SemanticKnowledgeGraph edges.json ([{source, target, ...}])."""
+        with open(path) as f:
+            edges = json.load(f)
+
+        backend = cls()
+        for edge in edges:
+            backend.add_relation(edge["source"], edge["target"])
+        return backend
+
+    def verify_connectivity(self) -> bool:
+        return True
+
+    def common_neighbors(self, node_id: str, top_k: int) -> Candidates:
+        with self._lock:
+            out = self.successors.get(node_id, set())
+            connected = out | self.incoming.get(node_id, set())
+
+            counts: Dict[str, int] = defaultdict(int)
+            for common in out:
+                for candidate in self.incoming.get(common, ()):
+                    if candidate != node_id and candidate not in connected:
+                        counts[candidate] += 1
+
+        ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:top_k]
+
+    def add_relation(self, source_id: str, target_id: str):
+        with self._lock:
+            self.successors[source_id].add(target_id)
+            self.incoming[target_id].add(source_id)
+
+    def predecessors(self, node_id: str) -> Set[str]:
+        with self._lock:
+            return set(self.incoming.get(node_id, set()))
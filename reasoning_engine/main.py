@@ -1,9 +1,14 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from neo4j import GraphDatabase
 import os
+import time
+import threading
+from collections import OrderedDict
 from dotenv import load_dotenv
 
+from graph_backend import GraphBackend, GraphUnavailable, InMemoryGraphBackend, Neo4jBackend
+
 # Load Environment Variables
 load_dotenv()
 
@@ -18,34 +23,94 @@ NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687") # Use localhost for
 NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "silhouette_graph_2035")
 
-# Database Connection Helper
-class GraphConnection:
-    def __init__(self, uri, user, password):
-        # Local Docker connections often fail handshake if encryption is on by default
-        self.driver = GraphDatabase.driver(uri, auth=(user, password), encrypted=False)
+# "neo4j" (default) or "memory" (in-process graph, optionally loaded from a
+# SemanticKnowledgeGraph edges.json) for local testing without Neo4j
+GRAPH_BACKEND = os.getenv("GRAPH_BACKEND", "neo4j")
+GRAPH_EDGES_FILE = os.getenv("GRAPH_EDGES_FILE", "")
 
-    def close(self):
-        self.driver.close()
+# Link prediction cache
+LINK_CACHE_SIZE = int(os.getenv("LINK_CACHE_SIZE", "10000"))
+LINK_CACHE_TTL = float(os.getenv("LINK_CACHE_TTL", "300"))
+
+
+class LinkPredictionCache:
+    """
+    TTL + LRU cache of common-neighbor candidates keyed by node id.
+
+    Each entry remembers the top_k it was fetched with, so smaller
+    requests are served by slicing and larger ones refetch.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # node_id -> (expires_at, top_k, candidates)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, node_id: str, top_k: int):
+        with self._lock:
+            entry = self._entries.get(node_id)
+            if entry is not None:
+                expires_at, fetched_k, candidates = entry
+                # A short list is complete, so it answers any top_k
+                if time.monotonic() < expires_at and (top_k <= fetched_k or len(candidates) < fetched_k):
+                    self._entries.move_to_end(node_id)
+                    self.hits += 1
+                    return candidates[:top_k]
+                if time.monotonic() >= expires_at:
+                    del self._entries[node_id]
+            self.misses += 1
+            return None
+
+    def put(self, node_id: str, top_k: int, candidates):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[node_id] = (time.monotonic() + self.ttl, top_k, candidates)
+            self._entries.move_to_end(node_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, node_ids):
+        with self._lock:
+            for node_id in node_ids:
+                self._entries.pop(node_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
 
-    def verify_connectivity(self):
-        try:
-            self.driver.verify_connectivity()
-            return True
-        except Exception as e:
-            print(f"Connection Error: {e}")
-            return False
 
-graph_db = None
+def create_backend() -> GraphBackend:
+    if GRAPH_BACKEND == "memory":
+        if GRAPH_EDGES_FILE:
+            print(f"Loading in-memory graph from {GRAPH_EDGES_FILE}...")
+            return InMemoryGraphBackend.from_edges_file(GRAPH_EDGES_FILE)
+        return InMemoryGraphBackend()
+    print(f"Connecting to Neo4j at {NEO4J_URI}...")
+    return Neo4jBackend(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
+
+
+graph_db: GraphBackend = None
+link_cache = LinkPredictionCache(LINK_CACHE_SIZE, LINK_CACHE_TTL)
 
 @app.on_event("startup")
 async def startup_event():
     global graph_db
-    print(f"Connecting to Neo4j at {NEO4J_URI}...")
-    graph_db = GraphConnection(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
-    if graph_db.verify_connectivity():
-        print("✅ Connected to Neo4j Graph.")
+    if graph_db is not None:
+        # Backend injected before startup (e.g. tests)
+        return
+    graph_db = create_backend()
+    if await run_in_threadpool(graph_db.verify_connectivity):
+        print(f"✅ Connected to {GRAPH_BACKEND} graph.")
     else:
-        print("❌ Failed to connect to Neo4j.")
+        print(f"❌ Failed to connect to {GRAPH_BACKEND} graph.")
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -62,6 +127,64 @@ class LinkPredictionResponse(BaseModel):
     source_node: str
     predictions: list[dict] # {target_node: str, confidence: float, relation_type: str}
 
+class BatchLinkPredictionRequest(BaseModel):
+    node_ids: list[str]
+    top_k: int = 5
+
+class BatchLinkPredictionResponse(BaseModel):
+    results: list[LinkPredictionResponse]
+
+class RelationRequest(BaseModel):
+    source_node: str
+    target_node: str
+
+class InvalidateRequest(BaseModel):
+    node_ids: list[str] = []
+
+# --- LINK PREDICTION ---
+
+def to_prediction(target: str, neighbors: int) -> dict:
+    # Normalize confidence based on neighbor count (heuristic: 1=0.5, 5+=0.95)
+    confidence = min(0.5 + (neighbors * 0.1), 0.99)
+    return {
+        "target_node": target,
+        "confidence": confidence,
+        "relation_type": "INTUITIVELY_LINKED"
+    }
+
+async def predict_many(node_ids: list[str], top_k: int) -> dict:
+    """Predictions per node id; cache misses go to the backend in one batch."""
+    if not graph_db:
+        raise HTTPException(status_code=503, detail="Graph Database unavailable")
+
+    candidates = {}
+    missing = []
+    for node_id in dict.fromkeys(node_ids):
+        cached = link_cache.get(node_id, top_k)
+        if cached is None:
+            missing.append(node_id)
+        else:
+            candidates[node_id] = cached
+
+    if missing:
+        try:
+            # The driver is blocking; keep the event loop free
+            fetched = await run_in_threadpool(graph_db.common_neighbors_many, missing, top_k)
+        except GraphUnavailable as e:
+            raise HTTPException(status_code=503, detail=f"Graph Database unavailable: {e}")
+        except Exception as e:
+            print(f"Query Error: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+        for node_id, found in fetched.items():
+            link_cache.put(node_id, top_k, found)
+            candidates[node_id] = found
+
+    return {
+        node_id: [to_prediction(target, neighbors) for target, neighbors in candidates[node_id]]
+        for node_id in node_ids
+    }
+
 # --- ENDPOINTS ---
 
 @app.get("/")
@@ -70,8 +193,8 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    connected = graph_db.verify_connectivity() if graph_db else False
-    return {"database_connected": connected}
+    connected = await run_in_threadpool(graph_db.verify_connectivity) if graph_db else False
+    return {"database_connected": connected, "backend": GRAPH_BACKEND, "link_cache": link_cache.stats()}
 
 @app.post("/predict_links", response_model=LinkPredictionResponse)
 async def predict_links(request: LinkPredictionRequest):
@@ -79,42 +202,7 @@ async def predict_links(request: LinkPredictionRequest):
     Simulate GNN Intuition using Graph Heuristics (Common Neighbors).
     Finds nodes that share neighbors but are not yet connected.
     """
-    if not graph_db or not graph_db.verify_connectivity():
-        raise HTTPException(status_code=503, detail="Graph Database unavailable")
-
-    # Cypher Query for "Link Prediction" via Common Neighbors
-    # Logic: If A and B share many friends, they should probably be friends.
-    query = """
-    MATCH (source:Concept {id: $nodeId})
-    MATCH (source)-[:RELATED_TO]->(common)<-[:RELATED_TO]-(candidate:Concept)
-    WHERE NOT (source)-[:RELATED_TO]-(candidate) AND source <> candidate
-    WITH candidate, count(common) as common_neighbors
-    WHERE common_neighbors >= 1
-    RETURN candidate.id as target, common_neighbors
-    ORDER BY common_neighbors DESC
-    LIMIT $topK
-    """
-    
-    predictions = []
-    
-    try:
-        with graph_db.driver.session() as session:
-            result = session.run(query, nodeId=request.node_id, topK=request.top_k)
-            
-            for record in result:
-                # Normalize confidence based on neighbor count (heuristic: 1=0.5, 5+=0.95)
-                neighbors = record["common_neighbors"]
-                confidence = min(0.5 + (neighbors * 0.1), 0.99)
-                
-                predictions.append({
-                    "target_node": record["target"],
-                    "confidence": confidence,
-                    "relation_type": "INTUITIVELY_LINKED"
-                })
-                
-    except Exception as e:
-        print(f"Query Error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    predictions = (await predict_many([request.node_id], request.top_k))[request.node_id]
 
     # Fallback if no specific links found (serendipity)
     if not predictions:
@@ -125,3 +213,44 @@ async def predict_links(request: LinkPredictionRequest):
         "source_node": request.node_id,
         "predictions": predictions
     }
+
+@app.post("/predict_links_many", response_model=BatchLinkPredictionResponse)
+async def predict_links_many(request: BatchLinkPredictionRequest):
+    """Common-neighbor predictions for many nodes in one round trip."""
+    predictions = await predict_many(request.node_ids, request.top_k)
+    return {
+        "results": [
+            {"source_node": node_id, "predictions": predictions[node_id]}
+            for node_id in request.node_ids
+        ]
+    }
+
+@app.post("/relations")
+async def add_relation(request: RelationRequest):
+    """
+    Write a RELATED_TO edge and drop cached predictions it affects:
+    both endpoints and every node that already points at the target.
+    """
+    if not graph_db:
+        raise HTTPException(status_code=503, detail="Graph Database unavailable")
+
+    def write():
+        graph_db.add_relation(request.source_node, request.target_node)
+        return graph_db.predecessors(request.target_node)
+
+    try:
+        affected = await run_in_threadpool(write)
+    except GraphUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"Graph Database unavailable: {e}")
+
+    link_cache.invalidate(affected | {request.source_node, request.target_node})
+    return {"status": "ok"}
+
+@app.post("/cache/invalidate")
+async def invalidate_cache(request: InvalidateRequest):
+    """Drop cached predictions for node_ids (all of them if empty) after external writes."""
+    if request.node_ids:
+        link_cache.invalidate(request.node_ids)
+    else:
+        link_cache.clear()
+    return {"status": "ok", "link_cache": link_cache.stats()}
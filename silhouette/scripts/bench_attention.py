@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+NANOSILHOUETTE - Attention Benchmark
+====================================
+Compares the GroupedQueryAttention paths (eager, sdpa, flash) on causal
+prefill across sequence lengths and reports latency and peak memory
+(peak memory on CUDA only).
+
+Usage:
+    python bench_attention.py
+    python bench_attention.py --seq-lens 512 2048 8192 --d-model 1024 --heads 16 --kv-heads 4
+    python bench_attention.py --device cuda --dtype bfloat16
+"""
+import os
+import sys
+import time
+import argparse
+
+import torch
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark GQA attention paths")
+    parser.add_argument("--seq-lens", type=int, nargs="+", default=[128, 512, 1024, 2048])
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--d-model", type=int, default=512)
+    parser.add_argument("--heads", type=int, default=8)
+    parser.add_argument("--kv-heads", type=int, default=2)
+    parser.add_argument("--backends", type=str, nargs="+", default=["eager", "sdpa", "flash"])
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--dtype", type=str, default="float32", choices=["float32", "float16", "bfloat16"])
+    parser.add_argument("--iters", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def build_attention(args, backend: str):
+    from src.model.transformer_block import TransformerConfig, GroupedQueryAttention
+
+    config = TransformerConfig(
+        d_model=args.d_model,
+        num_heads=args.heads,
+        num_kv_heads=args.kv_heads,
+        max_position_embeddings=max(args.seq_lens),
+        attention_backend=backend
+    )
+    torch.manual_seed(args.seed)
+    attn = GroupedQueryAttention(config).to(args.device, getattr(torch, args.dtype))
+    return attn.eval()
+
+
+def synchronize(device: str):
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+
+
+@torch.no_grad()
+def bench(attn, x, iters: int, device: str):
+    """Mean latency (ms) and peak memory (MB, CUDA only) of one prefill."""
+    attn(x)  # Warmup
+    synchronize(device)
+
+    if device.startswith("cuda"):
+        torch.cuda.reset_peak_memory_stats()
+        baseline = torch.cuda.memory_allocated()
+
+    start = time.perf_counter()
+    for _ in range(iters):
+        out, _ = attn(x)
+    synchronize(device)
+    latency = (time.perf_counter() - start) / iters * 1000
+
+    peak = None
+    if device.startswith("cuda"):
+        peak = (torch.cuda.max_memory_allocated() - baseline) / 2**20
+    return latency, peak, out
+
+
+def main():
+    args = parse_args()
+
+    from src.model.transformer_block import FLASH_ATTN_AVAILABLE
+
+    backends = []
+    for backend in args.backends:
+        if backend == "flash" and not (FLASH_ATTN_AVAILABLE and args.device.startswith("cuda")):
+            print("Skipping flash: needs flash-attn and a CUDA device")
+            continue
+        backends.append(backend)
+
+    modules = {backend: build_attention(args, backend) for backend in backends}
+
+    print(f"\nDevice: {args.device}  dtype: {args.dtype}  batch: {args.batch}  "
+          f"heads: {args.heads}/{args.kv_heads} kv  d_model: {args.d_model}")
+    header = f"{'seq_len':>8}" + "".join(f"{b + ' ms':>12}{b + ' MB':>12}" for b in backends) + f"{'max diff':>12}"
+    print(header)
+    print("-" * len(header))
+
+    for seq_len in args.seq_lens:
+        torch.manual_seed(args.seed)
+        x = torch.randn(
+            args.batch, seq_len, args.d_model,
+            device=args.device, dtype=getattr(torch, args.dtype)
+        )
+
+        row = f"{seq_len:>8}"
+        outputs = []
+        for backend in backends:
+            try:
+                latency, peak, out = bench(modules[backend], x, args.iters, args.device)
+            except torch.cuda.OutOfMemoryError:
+                row += f"{'OOM':>12}{'':>12}"
+                torch.cuda.empty_cache()
+                continue
+            outputs.append(out.float())
+            row += f"{latency:>12.2f}" + (f"{peak:>12.1f}" if peak is not None else f"{'n/a':>12}")
+
+        diff = max((o - outputs[0]).abs().max().item() for o in outputs) if outputs else 0.0
+        print(row + f"{diff:>12.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+"""
+NANOSILHOUETTE - Serving Benchmark
+==================================
+Drives concurrent clients against the /generate endpoint and reports
+throughput and latency percentiles.
+
+Usage:
+    python bench_serving.py                        # Local tiny model, batching on vs off
+    python bench_serving.py --clients 16 --requests 4
+    python bench_serving.py --url http://localhost:8102 --mode batching
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark NANOSILHOUETTE serving")
+    parser.add_argument("--url", type=str, help="Benchmark a running server instead of a local one")
+    parser.add_argument("--mode", type=str, default="compare",
+                        choices=["batching", "serial", "compare"],
+                        help="Local server mode (ignored with --url)")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=4, help="Requests per client")
+    parser.add_argument("--prompt-len", type=int, default=32)
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--d-model", type=int, default=128)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8199)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+class ByteTokenizer:
+    """Byte-level tokenizer matching the 256-token benchmark model."""
+
+    def encode(self, text: str):
+        return list(text.encode("utf-8"))
+
+    def decode(self, tokens):
+        return bytes(t for t in tokens if t < 256).decode("utf-8", errors="replace")
+
+
+def start_local_server(args, continuous_batching: bool):
+    """Start the API in-process on a tiny randomly initialized model."""
+    import uvicorn
+    from src.model.nanosilhouette import SilhouetteConfig, SilhouetteModel
+    from src.inference import api as api_module
+
+    torch.manual_seed(args.seed)
+    config = SilhouetteConfig(
+        vocab_size=256,
+        d_model=args.d_model,
+        intermediate_size=args.d_model * 2,
+        num_layers=args.layers,
+        num_heads=4,
+        num_kv_heads=2,
+        mamba_ratio=1,
+        num_experts=4,
+        use_cms=False,
+        use_deep_optimizer=False
+    )
+
+    server_api = api_module.api
+    server_api.config.continuous_batching = continuous_batching
+    server_api.config.max_batch_size = args.max_batch_size
+    server_api.attach_model(SilhouetteModel(config), ByteTokenizer())
+
+    server = uvicorn.Server(uvicorn.Config(
+        api_module.app, host="127.0.0.1", port=args.port, log_level="warning"
+    ))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def send_request(url: str, prompt: str, max_new_tokens: int) -> dict:
+    payload = json.dumps({
+        "prompt": prompt,
+        "max_new_tokens": max_new_tokens,
+        "temperature": 0.8
+    }).encode()
+    request = urllib.request.Request(
+        f"{url}/generate", data=payload, headers={"Content-Type": "application/json"}
+    )
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=600) as response:
+        body = json.loads(response.read())
+    return {"latency": time.perf_counter() - start, "tokens": body["tokens_generated"]}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def run_load(args, url: str) -> dict:
+    """Run clients x requests against url and summarize."""
+    rng = random.Random(args.seed)
+    alphabet = "abcdefghijklmnopqrstuvwxyz "
+
+    def client(_):
+        results = []
+        for _ in range(args.requests):
+            prompt = "".join(rng.choice(alphabet) for _ in range(args.prompt_len))
+            results.append(send_request(url, prompt, args.max_new_tokens))
+        return results
+
+    # Warmup
+    send_request(url, "warmup", 2)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        results = [r for batch in pool.map(client, range(args.clients)) for r in batch]
+    elapsed = time.perf_counter() - start
+
+    latencies = [r["latency"] for r in results]
+    tokens = sum(r["tokens"] for r in results)
+    return {
+        "requests": len(results),
+        "elapsed": elapsed,
+        "requests_per_s": len(results) / elapsed,
+        "tokens_per_s": tokens / elapsed,
+        "p50": percentile(latencies, 50),
+        "p90": percentile(latencies, 90),
+        "p99": percentile(latencies, 99)
+    }
+
+
+def print_report(name: str, report: dict):
+    print(f"\n--- {name} ---")
+    print(f"  Requests:    {report['requests']} in {report['elapsed']:.2f}s")
+    print(f"  Throughput:  {report['requests_per_s']:.2f} req/s, {report['tokens_per_s']:.1f} tok/s")
+    print(f"  Latency:     p50={report['p50']:.3f}s  p90={report['p90']:.3f}s  p99={report['p99']:.3f}s")
+
+
+def main():
+    args = parse_args()
+
+    print("=" * 60)
+    print("  NANOSILHOUETTE Serving Benchmark")
+    print("=" * 60)
+    print(f"Clients: {args.clients}, requests/client: {args.requests}, "
+          f"prompt: {args.prompt_len} chars, new tokens: {args.max_new_tokens}")
+
+    if args.url:
+        print_report(args.url, run_load(args, args.url.rstrip("/")))
+        return
+
+    modes = ["batching", "serial"] if args.mode == "compare" else [args.mode]
+    reports = {}
+    for mode in modes:
+        server, thread = start_local_server(args, continuous_batching=(mode == "batching"))
+        try:
+            reports[mode] = run_load(args, f"http://127.0.0.1:{args.port}")
+        finally:
+            server.should_exit = True
+            thread.join()
+        print_report(mode, reports[mode])
+
+    if len(reports) == 2:
+        speedup = reports["batching"]["tokens_per_s"] / reports["serial"]["tokens_per_s"]
+        print(f"\nContinuous batching throughput: {speedup:.2f}x serial")
+
+
+if __name__ == "__main__":
+    main()
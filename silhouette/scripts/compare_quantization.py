@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+"""
+NANOSILHOUETTE - Quantization Comparison
+========================================
+Compares the fp32 model with native weight-only int8/int4 quantization:
+perplexity, top-1 agreement and KL divergence from fp32, prefill/decode
+throughput, weight memory, and a save/load round trip of the quantized
+checkpoint. Quality numbers are only meaningful for a trained checkpoint.
+
+Usage:
+    python compare_quantization.py                          # Tiny random model, random tokens
+    python compare_quantization.py --checkpoint ./checkpoints/checkpoint_final.pt --data eval.txt
+    python compare_quantization.py --bits 8 --group-size 64
+"""
+import os
+import sys
+import copy
+import math
+import time
+import argparse
+import tempfile
+
+import torch
+import torch.nn.functional as F
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare fp32 and native quantized models")
+    parser.add_argument("--checkpoint", type=str, help="Model checkpoint (default: tiny random model)")
+    parser.add_argument("--data", type=str, help="Text file for perplexity (default: random tokens)")
+    parser.add_argument("--bits", type=int, nargs="+", default=[8, 4], choices=[4, 8])
+    parser.add_argument("--group-size", type=int, default=128)
+    parser.add_argument("--min-in-features", type=int, default=256)
+    parser.add_argument("--seq-len", type=int, default=256)
+    parser.add_argument("--num-sequences", type=int, default=8)
+    parser.add_argument("--decode-tokens", type=int, default=32)
+    parser.add_argument("--d-model", type=int, default=512)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--vocab-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def build_model(args):
+    from src.model.nanosilhouette import SilhouetteConfig, SilhouetteModel
+
+    if args.checkpoint:
+        from src.model import NanoSilhouetteModel
+
+        model = NanoSilhouetteModel()
+        model.load_state_dict(torch.load(args.checkpoint, map_location="cpu")["model_state_dict"])
+        return model.eval()
+
+    torch.manual_seed(args.seed)
+    config = SilhouetteConfig(
+        d_model=args.d_model,
+        intermediate_size=args.d_model * 2,
+        num_layers=args.layers,
+        num_heads=8,
+        num_kv_heads=2,
+        vocab_size=args.vocab_size,
+        use_cms=False,
+        use_deep_optimizer=False
+    )
+    return SilhouetteModel(config).eval()
+
+
+def load_tokens(args, vocab_size: int) -> torch.Tensor:
+    """(num_sequences, seq_len) evaluation tokens."""
+    if args.data:
+        from src.training.data_loader import SimpleTokenizer
+
+        with open(args.data, encoding="utf-8") as f:
+            tokens = SimpleTokenizer().encode(f.read())
+        tokens = torch.tensor(tokens[:args.num_sequences * args.seq_len]) % vocab_size
+        num = len(tokens) // args.seq_len
+        return tokens[:num * args.seq_len].view(num, args.seq_len)
+
+    generator = torch.Generator().manual_seed(args.seed)
+    return torch.randint(0, vocab_size, (args.num_sequences, args.seq_len), generator=generator)
+
+
+def weight_megabytes(model) -> float:
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors) / 2**20
+
+
+@torch.no_grad()
+def evaluate(model, tokens: torch.Tensor, reference_logits=None) -> dict:
+    logits = torch.cat([model(row.view(1, -1))["logits"] for row in tokens])
+    loss = F.cross_entropy(logits[:, :-1].reshape(-1, logits.shape[-1]), tokens[:, 1:].reshape(-1))
+
+    agreement = kl = None
+    if reference_logits is not None:
+        agreement = (logits.argmax(-1) == reference_logits.argmax(-1)).float().mean().item()
+        kl = F.kl_div(
+            F.log_softmax(logits, dim=-1).flatten(0, 1),
+            F.log_softmax(reference_logits, dim=-1).flatten(0, 1),
+            log_target=True,
+            reduction="batchmean"
+        ).item()
+    return {"perplexity": math.exp(min(loss.item(), 20)), "agreement": agreement, "kl": kl, "logits": logits}
+
+
+@torch.no_grad()
+def throughput(model, tokens: torch.Tensor, decode_tokens: int) -> dict:
+    """Prefill and cached-decode tokens per second on the first sequence."""
+    prompt = tokens[:1]
+    model(prompt)  # Warmup
+
+    start = time.perf_counter()
+    model(prompt)
+    prefill = prompt.numel() / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    model.generate(prompt, max_new_tokens=decode_tokens, temperature=1.0, top_k=1)
+    decode = decode_tokens / (time.perf_counter() - start)
+    return {"prefill": prefill, "decode": decode}
+
+
+def main():
+    args = parse_args()
+
+    from src.training.quantization import (
+        QuantizationConfig,
+        quantize_model,
+        save_quantized_model,
+        load_quantized_model
+    )
+
+    base = build_model(args)
+    tokens = load_tokens(args, base.config.vocab_size)
+
+    results = {}
+    reference = evaluate(base, tokens)
+    results["fp32"] = (reference, throughput(base, tokens, args.decode_tokens), weight_megabytes(base))
+
+    for bits in args.bits:
+        config = QuantizationConfig(
+            load_in_4bit=bits == 4,
+            load_in_8bit=bits == 8,
+            native_group_size=args.group_size,
+            min_in_features=args.min_in_features
+        )
+        model = quantize_model(copy.deepcopy(base), config, backend="native")
+
+        # Serialization round trip
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, f"int{bits}.pt")
+            save_quantized_model(model, path)
+            size = os.path.getsize(path) / 2**20
+            reloaded = load_quantized_model(build_model(args), path).eval()
+        quality = evaluate(reloaded, tokens, reference["logits"])
+        roundtrip = torch.equal(quality["logits"], evaluate(model, tokens)["logits"])
+
+        results[f"int{bits}"] = (quality, throughput(reloaded, tokens, args.decode_tokens), weight_megabytes(reloaded))
+        print(f"int{bits}: checkpoint {size:.1f} MB, reload matches: {roundtrip}")
+
+    print(f"\n{'model':>6}{'weights MB':>12}{'perplexity':>12}{'top-1 agree':>13}{'KL vs fp32':>12}"
+          f"{'prefill tok/s':>15}{'decode tok/s':>14}")
+    print("-" * 84)
+    for name, (quality, speed, megabytes) in results.items():
+        agreement = f"{quality['agreement']:.3f}" if quality["agreement"] is not None else "-"
+        kl = f"{quality['kl']:.2e}" if quality["kl"] is not None else "-"
+        print(
+            f"{name:>6}{megabytes:>12.1f}{quality['perplexity']:>12.2f}{agreement:>13}{kl:>12}"
+            f"{speed['prefill']:>15.0f}{speed['decode']:>14.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,26 @@
 # NANOSILHOUETTE Inference Package
-from .api import app, InferenceEngine
+from .api import app, InferenceEngine, InferenceAPI, InferenceConfig
+from .scheduler import (
+    ContinuousBatchingScheduler,
+    SchedulerConfig,
+    GenerationStream,
+    create_scheduler
+)
 from .speculative import (
     SpeculativeDecoder,
     SpeculativeConfig,
     MedusaHead,
+    MedusaConfig,
+    MedusaDecoder,
+    MedusaTrainingModel,
     create_speculative_decoder
 )
 from .kv_cache import (
     KVCache,
     KVCacheConfig,
     CompressedKVCache,
+    StaticKVCache,
+    StaticKVCacheLayer,
     SlidingWindowAttention,
     create_kv_cache
 )
@@ -18,15 +29,27 @@ __all__ = [
     # API
     "app",
     "InferenceEngine",
+    "InferenceAPI",
+    "InferenceConfig",
+    # Continuous Batching
+    "ContinuousBatchingScheduler",
+    "SchedulerConfig",
+    "GenerationStream",
+    "create_scheduler",
     # Speculative Decoding
     "SpeculativeDecoder",
     "SpeculativeConfig", 
     "MedusaHead",
+    "MedusaConfig",
+    "MedusaDecoder",
+    "MedusaTrainingModel",
     "create_speculative_decoder",
     # KV Cache
     "KVCache",
     "KVCacheConfig",
     "CompressedKVCache",
+    "StaticKVCache",
+    "StaticKVCacheLayer",
     "SlidingWindowAttention",
     "create_kv_cache"
 ]
@@ -2,15 +2,23 @@
 SILHOUETTE - Inference API
 FastAPI server for model inference.
 Independent instance for Silhouette Agency OS.
+
+Requests are served through a continuous batching scheduler when the
+model supports incremental decoding, so concurrent clients share decode
+steps instead of running one full generation at a time.
 """
 import os
 import torch
-from typing import Optional, List
+import time
+import json
+from typing import Optional, List, Iterator
 from dataclasses import dataclass
 
 try:
-    from fastapi import FastAPI, HTTPException
-    from pydantic import BaseModel
+    from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+    from fastapi.concurrency import iterate_in_threadpool
+    from fastapi.responses import StreamingResponse
+    from pydantic import BaseModel, ValidationError
     import uvicorn
     FASTAPI_AVAILABLE = True
 except ImportError:
@@ -25,6 +33,8 @@ class InferenceConfig:
     default_temperature: float = 0.7
     default_top_p: float = 0.9
     default_top_k: int = 50
+    continuous_batching: bool = True
+    max_batch_size: int = 8
 
 
 class InferenceAPI:
@@ -34,6 +44,7 @@ class InferenceAPI:
         self.config = config or InferenceConfig()
         self.model = None
         self.tokenizer = None
+        self.scheduler = None
         
         # Auto-detect device
         if self.config.device == "auto":
@@ -54,15 +65,60 @@ class InferenceAPI:
         checkpoint = torch.load(path, map_location=self.device)
         
         # Create model
-        self.model = NanoSilhouetteModel()
-        self.model.load_state_dict(checkpoint["model_state_dict"])
-        self.model.to(self.device)
-        self.model.eval()
+        model = NanoSilhouetteModel()
+        model.load_state_dict(checkpoint["model_state_dict"])
         
-        self.tokenizer = SimpleTokenizer()
+        self.attach_model(model, SimpleTokenizer())
         print(f"Model loaded from {path}")
     
-    @torch.no_grad()
+    def attach_model(self, model, tokenizer):
+        """Serve an already constructed model (starts the batching scheduler)."""
+        from .scheduler import ContinuousBatchingScheduler, SchedulerConfig
+        
+        self.shutdown()
+        self.model = model.to(self.device)
+        self.model.eval()
+        self.tokenizer = tokenizer
+        
+        if self.config.continuous_batching and getattr(model, "supports_incremental_decoding", False):
+            self.scheduler = ContinuousBatchingScheduler(
+                self.model,
+                SchedulerConfig(max_batch_size=self.config.max_batch_size),
+                eos_token_id=getattr(tokenizer, "eos_token_id", None)
+            )
+            self.scheduler.start()
+    
+    def shutdown(self):
+        """Stop the batching scheduler if one is running."""
+        if self.scheduler is not None:
+            self.scheduler.stop()
+            self.scheduler = None
+    
+    def submit(
+        self,
+        prompt: str,
+        max_new_tokens: int = 100,
+        temperature: float = None,
+        top_p: float = None,
+        top_k: int = None
+    ):
+        """
+        Queue a prompt on the batching scheduler.
+        
+        Returns:
+            GenerationStream yielding new token ids as they are sampled
+        """
+        if self.scheduler is None:
+            raise RuntimeError("Continuous batching is not enabled.")
+        
+        return self.scheduler.submit(
+            self.tokenizer.encode(prompt),
+            max_new_tokens=max_new_tokens,
+            temperature=temperature or self.config.default_temperature,
+            top_p=top_p or self.config.default_top_p,
+            top_k=top_k or self.config.default_top_k
+        )
+    
     def generate(
         self,
         prompt: str,
@@ -72,9 +128,37 @@ class InferenceAPI:
         top_k: int = None
     ) -> str:
         """Generate text from prompt."""
+        new_tokens = self.generate_tokens(prompt, max_new_tokens, temperature, top_p, top_k)
+        return self.tokenizer.decode(self.tokenizer.encode(prompt) + new_tokens)
+    
+    def generate_tokens(
+        self,
+        prompt: str,
+        max_new_tokens: int = 100,
+        temperature: float = None,
+        top_p: float = None,
+        top_k: int = None
+    ) -> List[int]:
+        """Generate from prompt and return only the new token ids."""
+        return list(self.stream_tokens(prompt, max_new_tokens, temperature, top_p, top_k))
+    
+    @torch.no_grad()
+    def stream_tokens(
+        self,
+        prompt: str,
+        max_new_tokens: int = 100,
+        temperature: float = None,
+        top_p: float = None,
+        top_k: int = None
+    ) -> Iterator[int]:
+        """Yield new token ids as they are sampled."""
         if self.model is None:
             raise RuntimeError("Model not loaded. Call load_model() first.")
         
+        if self.scheduler is not None:
+            yield from self.submit(prompt, max_new_tokens, temperature, top_p, top_k)
+            return
+        
         temperature = temperature or self.config.default_temperature
         top_p = top_p or self.config.default_top_p
         top_k = top_k or self.config.default_top_k
@@ -84,17 +168,14 @@ class InferenceAPI:
         input_ids = torch.tensor([tokens], device=self.device)
         
         # Generate
-        output_ids = self.model.generate(
+        for next_token in self.model.generate_stream(
             input_ids,
             max_new_tokens=max_new_tokens,
             temperature=temperature,
             top_p=top_p,
             top_k=top_k
-        )
-        
-        # Decode
-        output_tokens = output_ids[0].tolist()
-        return self.tokenizer.decode(output_tokens)
+        ):
+            yield int(next_token[0, 0])
     
     @torch.no_grad()
     def get_embedding(self, text: str) -> torch.Tensor:
@@ -124,39 +205,192 @@ if FASTAPI_AVAILABLE:
     class GenerateResponse(BaseModel):
         text: str
         tokens_generated: int
+        finish_reason: Optional[str] = None
     
     @app.on_event("startup")
     async def startup():
+        if api.model is not None:
+            return
         try:
             api.load_model()
         except FileNotFoundError:
             print("Warning: No model checkpoint found. Load manually.")
     
-    @app.post("/generate", response_model=GenerateResponse)
-    async def generate(request: GenerateRequest):
-        if api.model is None:
-            raise HTTPException(500, "Model not loaded")
+    @app.on_event("shutdown")
+    async def shutdown():
+        api.shutdown()
+    
+    def open_stream(request: GenerateRequest):
+        """
+        Start generating for a request.
+        
+        Queues the request on the scheduler immediately, so a full queue
+        surfaces here rather than after a streaming response has started.
         
-        text = api.generate(
+        Returns:
+            (async iterator of new token ids, GenerationStream or None)
+        
+        Raises:
+            RuntimeError: If the scheduler queue is full
+        """
+        args = (
             request.prompt,
             request.max_new_tokens,
             request.temperature,
             request.top_p,
             request.top_k
         )
+        if api.scheduler is None:
+            # Keep the event loop free while the model runs
+            return iterate_in_threadpool(api.stream_tokens(*args)), None
+        
+        stream = api.submit(*args)
         
+        async def tokens():
+            try:
+                async for token in stream:
+                    yield token
+            finally:
+                # Client went away before the sequence finished
+                if not stream.finished:
+                    stream.cancel()
+        
+        return tokens(), stream
+    
+    def finish_reason(request: GenerateRequest, stream, num_tokens: int) -> str:
+        """Scheduler's finish reason ("stop", "length", "cancelled", "error")."""
+        if stream is not None:
+            return stream.finish_reason
+        # Direct generation stops only at max_new_tokens (failures raise)
+        return "length" if num_tokens >= request.max_new_tokens else "stop"
+    
+    async def stream_events(request: GenerateRequest, tokens, stream=None):
+        """
+        Per-token frames followed by a final frame with the full text,
+        time-to-first-token and inter-token latency.
+        
+        Latency comes from the scheduler's sampling timestamps when the
+        request runs on it, so it is not skewed by how fast the client reads.
+        """
+        start = time.perf_counter()
+        token_times = []
+        new_tokens = []
+        
+        async for token in tokens:
+            token_times.append(time.perf_counter())
+            new_tokens.append(token)
+            yield {"token": token, "text": api.tokenizer.decode([token])}
+        
+        end = time.perf_counter()
+        if stream is not None:
+            start = stream.submitted_at
+            token_times = stream.token_times
+            end = stream.finished_at or end
+        
+        gaps = [b - a for a, b in zip(token_times, token_times[1:])]
+        prompt_tokens = api.tokenizer.encode(request.prompt)
+        reason = finish_reason(request, stream, len(new_tokens))
+        final = {"error": "Generation failed"} if reason == "error" else {}
+        yield {
+            **final,
+            "done": True,
+            "finish_reason": reason,
+            "text": api.tokenizer.decode(prompt_tokens + new_tokens),
+            "tokens_generated": len(new_tokens),
+            "time_to_first_token_ms": (token_times[0] - start) * 1000 if token_times else None,
+            "inter_token_latency_ms": sum(gaps) / len(gaps) * 1000 if gaps else None,
+            "max_inter_token_latency_ms": max(gaps) * 1000 if gaps else None,
+            "total_time_ms": (end - start) * 1000
+        }
+    
+    def check_ready():
+        if api.model is None:
+            raise HTTPException(500, "Model not loaded")
+        if api.scheduler is not None and api.scheduler.get_stats()["waiting"] >= api.scheduler.config.max_waiting:
+            raise HTTPException(503, "Scheduler queue is full")
+    
+    def open_stream_or_503(request: GenerateRequest):
+        check_ready()
+        try:
+            return open_stream(request)
+        except RuntimeError as e:
+            # Queue filled up between check_ready() and submit
+            raise HTTPException(503, str(e))
+    
+    @app.post("/generate", response_model=GenerateResponse)
+    async def generate(request: GenerateRequest):
+        tokens, stream = open_stream_or_503(request)
+        
+        new_tokens = [token async for token in tokens]
+        reason = finish_reason(request, stream, len(new_tokens))
+        if reason == "error":
+            raise HTTPException(500, "Generation failed")
+        
+        prompt_tokens = api.tokenizer.encode(request.prompt)
         return GenerateResponse(
-            text=text,
-            tokens_generated=len(text) - len(request.prompt)
+            text=api.tokenizer.decode(prompt_tokens + new_tokens),
+            tokens_generated=len(new_tokens),
+            finish_reason=reason
         )
     
+    @app.post("/generate/stream")
+    async def generate_stream(request: GenerateRequest):
+        """Server-sent events: one frame per token, then a final stats frame."""
+        tokens, stream = open_stream_or_503(request)
+        
+        async def sse():
+            async for event in stream_events(request, tokens, stream):
+                yield f"data: {json.dumps(event)}\n\n"
+        
+        return StreamingResponse(sse(), media_type="text/event-stream")
+    
+    @app.websocket("/ws/generate")
+    async def generate_ws(websocket: WebSocket):
+        """
+        WebSocket streaming: send a GenerateRequest JSON, receive token frames.
+        
+        Bad payloads and a full queue are reported as {"error": ...} frames
+        and the socket stays open for the next request.
+        """
+        await websocket.accept()
+        try:
+            while True:
+                payload = await websocket.receive_text()
+                try:
+                    request = GenerateRequest.model_validate_json(payload)
+                except ValidationError as e:
+                    await websocket.send_json({
+                        "error": "Invalid request",
+                        "details": e.errors(include_url=False, include_context=False)
+                    })
+                    continue
+                if api.model is None:
+                    await websocket.send_json({"error": "Model not loaded"})
+                    continue
+                try:
+                    tokens, stream = open_stream(request)
+                except RuntimeError as e:
+                    await websocket.send_json({"error": str(e)})
+                    continue
+                async for event in stream_events(request, tokens, stream):
+                    await websocket.send_json(event)
+        except WebSocketDisconnect:
+            pass
+    
     @app.get("/health")
     async def health():
         return {
             "status": "ok",
             "model_loaded": api.model is not None,
-            "device": str(api.device)
+            "device": str(api.device),
+            "scheduler": api.scheduler.get_stats() if api.scheduler is not None else None
         }
+else:
+    app = None
+
+
+# Backward compatibility alias
+InferenceEngine = InferenceAPI
 
 
 def run_server(host: str = "0.0.0.0", port: int = 8102):
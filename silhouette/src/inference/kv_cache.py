@@ -5,6 +5,7 @@ Implements efficient KV cache with:
 - Sliding window attention
 - Attention sinks (StreamingLLM)
 - Dynamic cache compression
+- Preallocated ring-buffer cache with in-place writes
 """
 import torch
 import torch.nn as nn
@@ -36,14 +37,14 @@ class KVCache:
         head_dim: int,
         config: Optional[KVCacheConfig] = None,
         dtype: torch.dtype = torch.float16,
-        device: str = "cuda"
+        device: Optional[str] = None
     ):
         self.num_layers = num_layers
         self.num_heads = num_heads
         self.head_dim = head_dim
         self.config = config or KVCacheConfig()
         self.dtype = dtype
-        self.device = device
+        self.device = _resolve_device(device)
         
         # Initialize empty caches
         self.key_cache: List[Optional[torch.Tensor]] = [None] * num_layers
@@ -150,6 +151,200 @@ class KVCache:
         }
 
 
+class StaticKVCache(KVCache):
+    """
+    Static-capacity KV cache backed by preallocated ring buffers.
+    
+    Each layer owns (batch, num_heads, max_cache_size, head_dim) key/value
+    buffers. New entries are written in place: the first num_sink_tokens
+    slots are pinned attention sinks, the remaining slots form a ring
+    over the most recent tokens. Attention reads a view of the buffer,
+    so steady-state decoding never allocates or copies the cache.
+    
+    Keys are stored after rotary embedding, so slot order inside the
+    ring does not matter for a single query token attending to all slots.
+    """
+    
+    def __init__(
+        self,
+        num_layers: int,
+        num_heads: int,
+        head_dim: int,
+        config: Optional[KVCacheConfig] = None,
+        dtype: torch.dtype = torch.float16,
+        device: Optional[str] = None,
+        batch_size: int = 1
+    ):
+        super().__init__(num_layers, num_heads, head_dim, config, dtype, device)
+        self.batch_size = batch_size
+        self.capacity = self.config.max_cache_size
+        self.num_sinks = min(self.config.num_sink_tokens, self.capacity - 1)
+        self.ring_size = self.capacity - self.num_sinks
+        
+        # Preallocated buffers
+        self._allocate(batch_size, dtype, self.device)
+        
+        # Tokens written per layer (absolute position of the next token)
+        self.layer_seq_lens: List[int] = [0] * num_layers
+    
+    def _allocate(self, batch_size: int, dtype: torch.dtype, device: torch.device):
+        """(Re)allocate the per-layer buffers."""
+        shape = (batch_size, self.num_heads, self.capacity, self.head_dim)
+        self.batch_size = batch_size
+        self.dtype = dtype
+        self.device = device
+        self.key_cache = [
+            torch.zeros(shape, dtype=dtype, device=device) for _ in range(self.num_layers)
+        ]
+        self.value_cache = [
+            torch.zeros(shape, dtype=dtype, device=device) for _ in range(self.num_layers)
+        ]
+    
+    def _slots(self, positions: torch.Tensor) -> torch.Tensor:
+        """Map absolute token positions to buffer slots (sinks pinned, ring after)."""
+        return torch.where(
+            positions < self.num_sinks,
+            positions,
+            self.num_sinks + (positions - self.num_sinks) % self.ring_size
+        )
+    
+    def update(
+        self,
+        layer_idx: int,
+        key: torch.Tensor,
+        value: torch.Tensor
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Write new key-value pairs in place.
+        
+        Args:
+            layer_idx: Layer index
+            key: New keys (batch, num_heads, seq, head_dim)
+            value: New values (batch, num_heads, seq, head_dim)
+        
+        Returns:
+            Key and value tensors for attention. Until the ring wraps they
+            are in temporal order with the new entries last (standard
+            causal masking applies). Once it has wrapped, a single-token
+            update returns the whole buffer in slot order, so the new entry
+            sits at its ring slot rather than last; that is fine for one
+            query attending to every slot. A multi-token update that wraps
+            returns old cache + new chunk (new entries last), a copy rather
+            than a view, since the chunk needs keys it is about to evict.
+        """
+        batch_size, _, new_seq_len, _ = key.shape
+        start = self.layer_seq_lens[layer_idx]
+        end = start + new_seq_len
+        
+        if start == 0 and (
+            batch_size != self.batch_size
+            or key.dtype != self.dtype
+            or key.device != self.key_cache[layer_idx].device
+        ):
+            self._allocate(batch_size, key.dtype, key.device)
+        
+        k_buf = self.key_cache[layer_idx]
+        v_buf = self.value_cache[layer_idx]
+        self.layer_seq_lens[layer_idx] = end
+        self.seq_len = max(self.seq_len, end)
+        
+        if end <= self.capacity:
+            # Not full yet: contiguous in-place write, temporal order preserved
+            k_buf[:, :, start:end].copy_(key)
+            v_buf[:, :, start:end].copy_(value)
+            return k_buf[:, :, :end], v_buf[:, :, :end]
+        
+        if new_seq_len == 1:
+            # Decoding: overwrite the oldest ring slot, attend over every slot
+            slot = self.num_sinks + (start - self.num_sinks) % self.ring_size
+            k_buf[:, :, slot].copy_(key[:, :, 0])
+            v_buf[:, :, slot].copy_(value[:, :, 0])
+            return k_buf, v_buf
+        
+        # Multi-token update that wraps: attend over old cache + new chunk
+        filled = min(start, self.capacity)
+        keys = torch.cat([k_buf[:, :, :filled], key], dim=2)
+        values = torch.cat([v_buf[:, :, :filled], value], dim=2)
+        
+        # Only the last write to each slot survives
+        positions = torch.arange(start, end, device=key.device)
+        keep = (positions < self.num_sinks) | (positions >= end - self.ring_size)
+        slots = self._slots(positions[keep])
+        k_buf.index_copy_(2, slots, key[:, :, keep])
+        v_buf.index_copy_(2, slots, value[:, :, keep])
+        
+        return keys, values
+    
+    def get(
+        self,
+        layer_idx: int
+    ) -> Tuple[Optional[torch.Tensor], Optional[torch.Tensor]]:
+        """Get views of the filled part of a layer's cache."""
+        filled = min(self.layer_seq_lens[layer_idx], self.capacity)
+        if filled == 0:
+            return None, None
+        return (
+            self.key_cache[layer_idx][:, :, :filled],
+            self.value_cache[layer_idx][:, :, :filled]
+        )
+    
+    def get_seq_length(self, layer_idx: int = 0) -> int:
+        """Absolute number of tokens written to a layer (next position)."""
+        return self.layer_seq_lens[layer_idx]
+    
+    def layer(self, layer_idx: int) -> "StaticKVCacheLayer":
+        """Per-layer handle to pass as GroupedQueryAttention's past_key_value."""
+        return StaticKVCacheLayer(self, layer_idx)
+    
+    def clear(self):
+        """Reset positions; buffers stay allocated."""
+        self.layer_seq_lens = [0] * self.num_layers
+        self.seq_len = 0
+    
+    def get_memory_usage(self) -> dict:
+        """Get memory usage statistics (allocated buffers and used slots)."""
+        allocated_bytes = 0
+        used_bytes = 0
+        for layer_idx, (k, v) in enumerate(zip(self.key_cache, self.value_cache)):
+            layer_bytes = k.element_size() * k.nelement() + v.element_size() * v.nelement()
+            allocated_bytes += layer_bytes
+            filled = min(self.layer_seq_lens[layer_idx], self.capacity)
+            used_bytes += layer_bytes * filled // self.capacity
+        
+        return {
+            "total_bytes": allocated_bytes,
+            "total_mb": allocated_bytes / 1e6,
+            "used_bytes": used_bytes,
+            "used_mb": used_bytes / 1e6,
+            "seq_len": self.seq_len,
+            "max_cache_size": self.config.max_cache_size
+        }
+
+
+class StaticKVCacheLayer:
+    """
+    Handle binding a StaticKVCache to one layer.
+    
+    GroupedQueryAttention accepts it as past_key_value: it reads the
+    absolute position offset from get_seq_length() and writes through
+    update(), returning the same handle as its new cache.
+    """
+    
+    def __init__(self, cache: StaticKVCache, layer_idx: int):
+        self.cache = cache
+        self.layer_idx = layer_idx
+    
+    def update(
+        self,
+        key: torch.Tensor,
+        value: torch.Tensor
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        return self.cache.update(self.layer_idx, key, value)
+    
+    def get_seq_length(self) -> int:
+        return self.cache.get_seq_length(self.layer_idx)
+
+
 class SlidingWindowAttention(nn.Module):
     """
     Sliding Window Attention with KV Cache.
@@ -347,6 +542,13 @@ class CompressedKVCache(KVCache):
         self.importance_scores[layer_idx] = self.importance_scores[layer_idx][keep_indices]
 
 
+def _resolve_device(device: Optional[str]) -> torch.device:
+    """Requested device, or CUDA when available and CPU otherwise."""
+    if device is None:
+        return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    return torch.device(device)
+
+
 def create_kv_cache(
     num_layers: int,
     num_heads: int,
@@ -354,7 +556,8 @@ def create_kv_cache(
     max_cache_size: int = 2048,
     window_size: int = 512,
     compressed: bool = False,
-    device: str = "cuda"
+    static: bool = False,
+    device: Optional[str] = None
 ) -> KVCache:
     """Factory function for KV cache."""
     config = KVCacheConfig(
@@ -362,7 +565,11 @@ def create_kv_cache(
         window_size=window_size
     )
     
-    if compressed:
+    if static:
+        return StaticKVCache(
+            num_layers, num_heads, head_dim, config, device=device
+        )
+    elif compressed:
         return CompressedKVCache(
             num_layers, num_heads, head_dim, config, device=device
         )
@@ -393,6 +600,22 @@ if __name__ == "__main__":
     
     print(f"Cache memory: {cache.get_memory_usage()}")
     
+    # Test static ring-buffer cache
+    static_cache = create_kv_cache(
+        num_layers=12,
+        num_heads=8,
+        head_dim=64,
+        max_cache_size=100,
+        static=True,
+        device="cpu"
+    )
+    for i in range(10):
+        k = torch.randn(1, 8, 20, 64, dtype=torch.float16)
+        v = torch.randn(1, 8, 20, 64, dtype=torch.float16)
+        static_cache.update(0, k, v)
+    k_view, _ = static_cache.update(0, k[:, :, :1], v[:, :, :1])
+    print(f"Static cache view: {tuple(k_view.shape)}, memory: {static_cache.get_memory_usage()}")
+    
     # Test sliding window attention
     swa = SlidingWindowAttention(512, 8, window_size=256)
     x = torch.randn(2, 64, 512)
@@ -0,0 +1,476 @@
+"""
+SILHOUETTE - Continuous Batching Scheduler
+==========================================
+Iteration-level scheduling (Orca / vLLM style) for SilhouetteModel:
+- New prompts are admitted into the running decode batch between steps
+- Every step decodes one token for all active sequences in one forward
+- Tokens are streamed back per request as soon as they are sampled
+- Slots are freed the moment a sequence finishes
+
+The batch keeps one DecodingState: Mamba conv/SSM states and CMS memory
+are stacked per row, Transformer KV caches are left-padded to a common
+width and the padding is hidden with an attention mask. Each row carries
+its own rotary position.
+"""
+import asyncio
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional, List, Iterator, AsyncIterator
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from ..model.nanosilhouette import DecodingState
+
+
+@dataclass
+class SchedulerConfig:
+    """Configuration for the continuous batching scheduler."""
+    max_batch_size: int = 8       # Concurrent sequences in the decode batch
+    max_waiting: int = 256        # Queued requests before submit() rejects
+    idle_wait: float = 0.05       # Seconds to block for new work when idle
+
+
+class GenerationStream:
+    """
+    Handle for one submitted request.
+
+    Iterate it (sync or async) to receive token ids as they are sampled;
+    iteration ends when the sequence finishes. Created from inside an
+    event loop it delivers through an asyncio.Queue, otherwise through a
+    thread-safe queue.
+    """
+
+    def __init__(
+        self,
+        prompt_ids: List[int],
+        max_new_tokens: int = 100,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        top_k: int = 50
+    ):
+        self.prompt_ids = prompt_ids
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.top_k = top_k
+
+        self.tokens: List[int] = []
+        self.token_times: List[float] = []
+        self.finish_reason: Optional[str] = None
+        self.submitted_at = time.perf_counter()
+        self.finished_at: Optional[float] = None
+        self.cancelled = False
+
+        try:
+            self._loop = asyncio.get_running_loop()
+            self._async_queue: Optional[asyncio.Queue] = asyncio.Queue()
+            self._sync_queue: Optional[queue.Queue] = None
+        except RuntimeError:
+            self._loop = None
+            self._async_queue = None
+            self._sync_queue = queue.Queue()
+
+    @property
+    def finished(self) -> bool:
+        return self.finish_reason is not None
+
+    def cancel(self):
+        """Ask the scheduler to drop this sequence at the next step."""
+        self.cancelled = True
+
+    def _emit(self, item: Optional[int]):
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._async_queue.put_nowait, item)
+            except RuntimeError:
+                # Event loop closed (client went away)
+                self.cancelled = True
+        else:
+            self._sync_queue.put(item)
+
+    def _push_token(self, token: int):
+        self.tokens.append(token)
+        self.token_times.append(time.perf_counter())
+        self._emit(token)
+
+    def _finish(self, reason: str):
+        if self.finish_reason is None:
+            self.finish_reason = reason
+            self.finished_at = time.perf_counter()
+            self._emit(None)
+
+    def __iter__(self) -> Iterator[int]:
+        if self._sync_queue is None:
+            raise RuntimeError("Stream was created inside an event loop; use 'async for'.")
+        while True:
+            item = self._sync_queue.get()
+            if item is None:
+                return
+            yield item
+
+    async def __aiter__(self) -> AsyncIterator[int]:
+        if self._async_queue is None:
+            raise RuntimeError("Stream was created outside an event loop; iterate it synchronously.")
+        while True:
+            item = await self._async_queue.get()
+            if item is None:
+                return
+            yield item
+
+
+class ContinuousBatchingScheduler:
+    """
+    Runs a SilhouetteModel decode loop on a background thread.
+
+    Requests wait in a queue until a batch slot is free; admission runs
+    the prompt prefill and merges the sequence's state into the batch,
+    so new requests join between two decode steps instead of waiting
+    for the current batch to drain.
+    """
+
+    def __init__(
+        self,
+        model: nn.Module,
+        config: Optional[SchedulerConfig] = None,
+        eos_token_id: Optional[int] = None
+    ):
+        if not getattr(model, "supports_incremental_decoding", False):
+            raise ValueError("Continuous batching requires a model with incremental decoding support")
+
+        self.model = model
+        self.config = config or SchedulerConfig()
+        self.eos_token_id = eos_token_id
+        self.device = next(model.parameters()).device
+        self._kv_layers = [
+            i for i, layer in enumerate(model.layers) if layer.block_type == "transformer"
+        ]
+
+        self._waiting: queue.Queue = queue.Queue(maxsize=self.config.max_waiting)
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+        # Batch state (one row per active sequence)
+        self._rows: List[GenerationStream] = []
+        self._state: Optional[DecodingState] = None
+        self._last_tokens: Optional[torch.Tensor] = None  # (batch, 1)
+        self._positions: Optional[torch.Tensor] = None    # (batch,) next rotary position
+        self._pad: Optional[torch.Tensor] = None          # (batch,) left-padded KV columns
+
+        # Stats
+        self.steps = 0
+        self.tokens_generated = 0
+        self._batch_size_sum = 0
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Start the background decode loop."""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="silhouette-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the loop; unfinished requests end with finish_reason 'aborted'."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        for request in self._rows:
+            request._finish("aborted")
+        self._reset_batch()
+        while not self._waiting.empty():
+            self._waiting.get_nowait()._finish("aborted")
+
+    def submit(
+        self,
+        prompt_ids: List[int],
+        max_new_tokens: int = 100,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        top_k: int = 50
+    ) -> GenerationStream:
+        """
+        Queue a prompt for generation.
+
+        Raises:
+            RuntimeError: If the waiting queue is full
+        """
+        request = GenerationStream(prompt_ids, max_new_tokens, temperature, top_p, top_k)
+        if max_new_tokens <= 0 or not prompt_ids:
+            request._finish("length")
+            return request
+        try:
+            self._waiting.put_nowait(request)
+        except queue.Full:
+            raise RuntimeError("Scheduler queue is full")
+        return request
+
+    def get_stats(self) -> dict:
+        """Scheduler statistics."""
+        return {
+            "active": len(self._rows),
+            "waiting": self._waiting.qsize(),
+            "steps": self.steps,
+            "tokens_generated": self.tokens_generated,
+            "avg_batch_size": self._batch_size_sum / max(1, self.steps),
+            "max_batch_size": self.config.max_batch_size
+        }
+
+    # ------------------------------------------------------------------
+    # Decode loop
+    # ------------------------------------------------------------------
+
+    def _loop(self):
+        with torch.no_grad():
+            while self._running:
+                try:
+                    if not self._rows:
+                        # Idle: block until work arrives
+                        try:
+                            request = self._waiting.get(timeout=self.config.idle_wait)
+                        except queue.Empty:
+                            continue
+                        self._try_admit(request)
+
+                    # Iteration-level admission into the running batch
+                    while len(self._rows) < self.config.max_batch_size:
+                        try:
+                            request = self._waiting.get_nowait()
+                        except queue.Empty:
+                            break
+                        self._try_admit(request)
+
+                    if self._rows:
+                        self._step()
+                except Exception as e:
+                    print(f"[SCHEDULER] Decode step failed: {e}")
+                    for request in self._rows:
+                        request._finish("error")
+                    self._reset_batch()
+
+    def _sample(self, logits: torch.Tensor, request: GenerationStream) -> int:
+        next_token = self.model._sample_next_token(
+            logits, request.temperature, request.top_p, request.top_k
+        )
+        return int(next_token.item())
+
+    def _check_finished(self, request: GenerationStream, token: int) -> bool:
+        if request.cancelled:
+            request._finish("cancelled")
+        elif self.eos_token_id is not None and token == self.eos_token_id:
+            request._finish("stop")
+        elif len(request.tokens) >= request.max_new_tokens:
+            request._finish("length")
+        return request.finished
+
+    def _try_admit(self, request: GenerationStream):
+        """Admit a request; a failed prefill ends only that request."""
+        try:
+            self._admit(request)
+        except Exception as e:
+            print(f"[SCHEDULER] Prefill failed: {e}")
+            request._finish("error")
+
+    def _admit(self, request: GenerationStream):
+        """Prefill a prompt, stream its first token and merge it into the batch."""
+        if request.cancelled:
+            request._finish("cancelled")
+            return
+
+        prompt = request.prompt_ids[-self.model.config.max_seq_len:]
+        input_ids = torch.tensor([prompt], dtype=torch.long, device=self.device)
+        outputs = self.model(input_ids, use_cache=True)
+
+        token = self._sample(outputs["logits"][:, -1, :], request)
+        request._push_token(token)
+        self.tokens_generated += 1
+        if self._check_finished(request, token):
+            return
+
+        self._merge(request, outputs["past_state"], token, len(prompt))
+
+    def _step(self):
+        """Decode one token for every active sequence."""
+        batch = len(self._rows)
+
+        # Hide left padding of the KV caches; the new token's column is always visible
+        attention_mask = None
+        if self._kv_layers:
+            kv_len = self._state.layer_caches[self._kv_layers[0]][0].shape[2] + 1
+            columns = torch.arange(kv_len, device=self.device)
+            hidden = columns.unsqueeze(0) < self._pad.unsqueeze(1)
+            attention_mask = torch.zeros(batch, 1, 1, kv_len, device=self.device)
+            attention_mask.masked_fill_(hidden.view(batch, 1, 1, kv_len), float("-inf"))
+
+        outputs = self.model(
+            self._last_tokens,
+            past_state=self._state,
+            attention_mask=attention_mask,
+            position_ids=self._positions.unsqueeze(1)
+        )
+        self._state = outputs["past_state"]
+        self._positions = self._positions + 1
+
+        self.steps += 1
+        self._batch_size_sum += batch
+
+        logits = outputs["logits"][:, -1, :]
+        keep = []
+        for row, request in enumerate(self._rows):
+            token = self._sample(logits[row:row + 1], request)
+            request._push_token(token)
+            self._last_tokens[row, 0] = token
+            if not self._check_finished(request, token):
+                keep.append(row)
+        self.tokens_generated += batch
+
+        if len(keep) < batch:
+            self._evict(keep)
+
+    # ------------------------------------------------------------------
+    # Batch state management
+    # ------------------------------------------------------------------
+
+    def _reset_batch(self):
+        self._rows = []
+        self._state = None
+        self._last_tokens = None
+        self._positions = None
+        self._pad = None
+
+    def _merge(self, request: GenerationStream, state: DecodingState, token: int, length: int):
+        """Append a prefilled sequence as a new batch row."""
+        token_t = torch.tensor([[token]], dtype=torch.long, device=self.device)
+        length_t = torch.tensor([length], dtype=torch.long, device=self.device)
+
+        if not self._rows:
+            self._rows = [request]
+            self._state = state
+            self._last_tokens = token_t
+            self._positions = length_t
+            self._pad = torch.zeros(1, dtype=torch.long, device=self.device)
+            return
+
+        layer_caches = list(self._state.layer_caches)
+        old_width = row_width = width = 0
+        if self._kv_layers:
+            old_width = layer_caches[self._kv_layers[0]][0].shape[2]
+            row_width = state.layer_caches[self._kv_layers[0]][0].shape[2]
+            width = max(old_width, row_width)
+
+        for i, (batch_cache, row_cache) in enumerate(zip(layer_caches, state.layer_caches)):
+            if i in self._kv_layers:
+                batch_cache = tuple(_left_pad(t, width) for t in batch_cache)
+                row_cache = tuple(_left_pad(t, width) for t in row_cache)
+            layer_caches[i] = tuple(
+                torch.cat([b, r], dim=0) for b, r in zip(batch_cache, row_cache)
+            )
+
+        cms_states = self._state.cms_states
+        if cms_states is not None:
+            cms_states = [
+                tuple(torch.cat([b, r], dim=0) for b, r in zip(batch_mem, row_mem))
+                for batch_mem, row_mem in zip(cms_states, state.cms_states)
+            ]
+
+        pad = torch.cat([
+            self._pad + (width - old_width),
+            torch.tensor([width - row_width], dtype=torch.long, device=self.device)
+        ])
+
+        self._rows.append(request)
+        self._state = DecodingState(layer_caches=layer_caches, cms_states=cms_states, seq_len=width)
+        self._last_tokens = torch.cat([self._last_tokens, token_t], dim=0)
+        self._positions = torch.cat([self._positions, length_t])
+        self._pad = pad
+
+    def _evict(self, keep: List[int]):
+        """Drop finished rows and trim KV columns that are padding for every row."""
+        if not keep:
+            self._reset_batch()
+            return
+
+        index = torch.tensor(keep, dtype=torch.long, device=self.device)
+        self._rows = [self._rows[i] for i in keep]
+        self._last_tokens = self._last_tokens[index]
+        self._positions = self._positions[index]
+        self._pad = self._pad[index]
+
+        trim = int(self._pad.min()) if self._kv_layers else 0
+        self._pad = self._pad - trim
+
+        layer_caches = []
+        for i, cache in enumerate(self._state.layer_caches):
+            cache = tuple(t[index] for t in cache)
+            if trim and i in self._kv_layers:
+                cache = tuple(t[:, :, trim:] for t in cache)
+            layer_caches.append(cache)
+
+        cms_states = self._state.cms_states
+        if cms_states is not None:
+            cms_states = [tuple(t[index] for t in mem) for mem in cms_states]
+
+        self._state = DecodingState(
+            layer_caches=layer_caches,
+            cms_states=cms_states,
+            seq_len=self._state.seq_len - trim
+        )
+
+
+def _left_pad(t: torch.Tensor, width: int) -> torch.Tensor:
+    """Left-pad a (batch, heads, seq, head_dim) cache tensor along seq to width."""
+    missing = width - t.shape[2]
+    if missing <= 0:
+        return t
+    return F.pad(t, (0, 0, missing, 0))
+
+
+def create_scheduler(
+    model: nn.Module,
+    max_batch_size: int = 8,
+    eos_token_id: Optional[int] = None,
+    start: bool = True
+) -> ContinuousBatchingScheduler:
+    """Factory function for the continuous batching scheduler."""
+    scheduler = ContinuousBatchingScheduler(
+        model,
+        SchedulerConfig(max_batch_size=max_batch_size),
+        eos_token_id=eos_token_id
+    )
+    if start:
+        scheduler.start()
+    return scheduler
+
+
+if __name__ == "__main__":
+    from ..model.nanosilhouette import SilhouetteConfig, SilhouetteModel
+
+    print("Testing Continuous Batching Scheduler...")
+
+    config = SilhouetteConfig(
+        vocab_size=100, d_model=64, intermediate_size=128, num_layers=4,
+        num_heads=4, num_kv_heads=2, mamba_ratio=1, num_experts=4,
+        use_cms=False, use_deep_optimizer=False
+    )
+    model = SilhouetteModel(config).eval()
+    scheduler = create_scheduler(model, max_batch_size=2)
+
+    streams = [
+        scheduler.submit(list(range(1, 2 + 3 * i)), max_new_tokens=4 + 2 * i, top_k=1)
+        for i in range(4)
+    ]
+    for i, stream in enumerate(streams):
+        tokens = list(stream)
+        print(f"Request {i}: {len(tokens)} tokens ({stream.finish_reason})")
+    print(f"Stats: {scheduler.get_stats()}")
+    scheduler.stop()
+
+    print("✅ Scheduler test passed!")
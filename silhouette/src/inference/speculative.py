@@ -3,10 +3,17 @@ NANOSILHOUETTE - Speculative Decoding
 ======================================
 Implements draft-then-verify decoding for 2-3x faster inference.
 Based on research from Google, DeepMind, and IBM (2024).
+
+Rejection sampling keeps the output distribution identical to sampling
+from the target model alone. Medusa heads propose a token tree that is
+verified in a single forward pass (tree attention).
 """
+import time
+import inspect
 import torch
 import torch.nn as nn
-from typing import Optional, Tuple, List
+import torch.nn.functional as F
+from typing import Optional, Tuple, List, Dict, Any
 from dataclasses import dataclass
 
 
@@ -18,14 +25,144 @@ class SpeculativeConfig:
     top_k: int = 50
     top_p: float = 0.9
     max_new_tokens: int = 100
+    draft_layers: int = 0  # Self-drafting: target layers in the early-exit draft (0 = num_layers // 4)
+
+
+def filtered_probs(
+    logits: torch.Tensor,
+    temperature: float = 0.7,
+    top_k: int = 50,
+    top_p: float = 0.9
+) -> torch.Tensor:
+    """
+    Sampling distribution over the last dim after temperature, top-k and
+    top-p filtering (one-hot argmax when temperature <= 0).
+    """
+    if temperature <= 0:
+        return F.one_hot(logits.argmax(dim=-1), logits.shape[-1]).float()
+    
+    logits = logits.float() / temperature
+    
+    # Top-k filtering
+    if top_k > 0:
+        kth = logits.topk(min(top_k, logits.shape[-1]), dim=-1)[0][..., -1:]
+        logits = logits.masked_fill(logits < kth, float('-inf'))
+    
+    # Top-p (nucleus) filtering
+    if top_p < 1.0:
+        sorted_logits, sorted_indices = torch.sort(logits, dim=-1, descending=True)
+        cumulative_probs = torch.cumsum(F.softmax(sorted_logits, dim=-1), dim=-1)
+        sorted_mask = cumulative_probs > top_p
+        sorted_mask[..., 1:] = sorted_mask[..., :-1].clone()
+        sorted_mask[..., 0] = False
+        logits = logits.masked_fill(sorted_mask.scatter(-1, sorted_indices, sorted_mask), float('-inf'))
+    
+    return F.softmax(logits, dim=-1)
+
+
+class _SequenceRunner:
+    """
+    Feeds tokens of one sequence through a model.
+    
+    Carries a DecodingState when the model supports incremental decoding;
+    otherwise the "state" is the token prefix and every call re-runs it.
+    
+    Continuum memory (use_cms) updates once per forward from the whole
+    chunk, so a multi-token call after a prefix gives different outputs
+    than decoding those tokens one at a time. For such models every call
+    that continues a prefix is stepped token by token, which keeps
+    verification exact but removes its single-pass speedup.
+    """
+    
+    def __init__(self, model: nn.Module, exit_layer: Optional[int] = None):
+        self.model = model
+        self.exit_layer = exit_layer
+        self.incremental = getattr(model, "supports_incremental_decoding", False)
+        self.kwargs = {"exit_layer": exit_layer} if exit_layer is not None else {}
+        self.stepwise = bool(getattr(getattr(model, "config", None), "use_cms", False))
+        
+        # Layer caches that are plain (keys, values) can be cut back instead of recomputed
+        layers = getattr(model, "layers", None)
+        if layers is not None and exit_layer is not None:
+            layers = layers[:exit_layer]
+        self.kv_only = (
+            layers is not None and len(layers) > 0
+            and all(getattr(layer, "block_type", None) == "transformer" for layer in layers)
+        )
+    
+    def initial_state(self, device: torch.device):
+        return None if self.incremental else torch.empty(1, 0, dtype=torch.long, device=device)
+    
+    def forward(self, state, tokens: torch.Tensor) -> Dict[str, Any]:
+        """
+        Model outputs for (batch, n) tokens following state: "logits" (and
+        "hidden_states" when the model returns them) for those n positions,
+        plus the advanced state as "past_state".
+        """
+        has_prefix = state is not None if self.incremental else state.shape[1] > 0
+        if self.stepwise and has_prefix and tokens.shape[1] > 1:
+            steps = []
+            for t in range(tokens.shape[1]):
+                outputs = self.forward(state, tokens[:, t:t + 1])
+                state = outputs["past_state"]
+                steps.append(outputs)
+            outputs = {
+                key: torch.cat([step[key] for step in steps], dim=1)
+                for key in ("logits", "hidden_states") if key in steps[0]
+            }
+            outputs["past_state"] = state
+            return outputs
+        
+        if self.incremental:
+            return self.model(tokens, past_state=state, use_cache=True, **self.kwargs)
+        
+        ids = torch.cat([state, tokens], dim=1)
+        outputs = self.model(ids, **self.kwargs)
+        outputs = {
+            key: outputs[key][:, -tokens.shape[1]:]
+            for key in ("logits", "hidden_states") if key in outputs
+        }
+        outputs["past_state"] = ids
+        return outputs
+    
+    def run(self, state, tokens: torch.Tensor) -> Tuple[torch.Tensor, Any]:
+        """Logits (1, n, vocab) for tokens following state, and the advanced state."""
+        outputs = self.forward(state, tokens)
+        return outputs["logits"], outputs["past_state"]
+    
+    def rewind(self, snapshot, advanced, tokens: torch.Tensor):
+        """
+        State covering snapshot + tokens, given a state `advanced` that
+        covers snapshot followed by a continuation starting with tokens.
+        """
+        if not self.incremental:
+            return torch.cat([snapshot, tokens], dim=1)
+        
+        target_len = (snapshot.seq_len if snapshot is not None else 0) + tokens.shape[1]
+        if self.kv_only and advanced.cms_states is None and advanced.seq_len >= target_len:
+            # Drop the rejected positions from every KV cache
+            layer_caches = [(k[:, :, :target_len], v[:, :, :target_len]) for k, v in advanced.layer_caches]
+            return type(advanced)(layer_caches=layer_caches, cms_states=None, seq_len=target_len)
+        
+        # Recurrent state (Mamba, CMS) cannot be cut back: recompute from the snapshot
+        return self.run(snapshot, tokens)[1]
 
 
 class SpeculativeDecoder:
     """
     Speculative Decoding for faster inference.
     
-    Uses a smaller draft model to propose tokens,
-    then verifies with the main model in parallel.
+    A draft proposes num_speculative_tokens tokens one at a time; the
+    target scores all of them in a single forward pass and rejection
+    sampling (accept with min(1, p/q), otherwise resample from
+    max(0, p - q)) keeps the output distributed exactly as sampling from
+    the target alone. Both models carry incremental state between rounds.
+    With continuum memory (use_cms) the target scores the drafts one
+    token at a time to stay exact, so expect little or no speedup.
+    
+    Without a draft model the target drafts itself with an early exit
+    after its first draft_layers blocks, reusing the target's own cached
+    state for those blocks.
     """
     
     def __init__(
@@ -41,6 +178,34 @@ class SpeculativeDecoder:
         # If no draft model provided, use self-drafting
         # (target model with early exit)
         self.use_self_drafting = draft_model is None
+        
+        self.target = _SequenceRunner(target_model)
+        self.exit_layer = None
+        if draft_model is not None:
+            self.draft = _SequenceRunner(draft_model)
+        else:
+            layers = getattr(target_model, "layers", None)
+            if layers is not None and "exit_layer" in inspect.signature(target_model.forward).parameters:
+                self.exit_layer = self.config.draft_layers or max(1, len(layers) // 4)
+            # Models without early exit draft with themselves (correct, but no speedup)
+            self.draft = _SequenceRunner(target_model, exit_layer=self.exit_layer)
+        
+        if self.target.stepwise:
+            print("[SPECULATIVE] Target uses continuum memory: drafts are verified one token "
+                  "at a time, so expect little or no speedup (use_cms=False for single-pass verification).")
+        
+        self.reset_stats()
+    
+    def reset_stats(self):
+        self._stats = {"rounds": 0, "drafted": 0, "accepted": 0, "generated": 0, "seconds": 0.0}
+    
+    def get_stats(self) -> Dict[str, float]:
+        """Acceptance rate, tokens per round and throughput since the last reset."""
+        stats = dict(self._stats)
+        stats["acceptance_rate"] = stats["accepted"] / max(stats["drafted"], 1)
+        stats["tokens_per_round"] = stats["generated"] / max(stats["rounds"], 1)
+        stats["tokens_per_second"] = stats["generated"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+        return stats
     
     @torch.no_grad()
     def generate(
@@ -59,119 +224,113 @@ class SpeculativeDecoder:
             Generated token IDs
         """
         max_new_tokens = max_new_tokens or self.config.max_new_tokens
-        device = input_ids.device
-        batch_size = input_ids.shape[0]
-        
-        generated_tokens = 0
-        current_ids = input_ids.clone()
         
-        while generated_tokens < max_new_tokens:
-            # 1. Draft phase: generate speculative tokens
-            draft_tokens = self._draft_tokens(current_ids)
-            
-            # 2. Verify phase: check with target model
-            accepted_tokens = self._verify_tokens(current_ids, draft_tokens)
-            
-            # 3. Accept verified tokens
-            if len(accepted_tokens) > 0:
-                accepted_tensor = torch.tensor(
-                    accepted_tokens, device=device
-                ).unsqueeze(0).expand(batch_size, -1)
-                current_ids = torch.cat([current_ids, accepted_tensor], dim=1)
-                generated_tokens += len(accepted_tokens)
-            else:
-                # If no tokens accepted, sample one from target
-                next_token = self._sample_target(current_ids)
-                current_ids = torch.cat([current_ids, next_token], dim=1)
-                generated_tokens += 1
-        
-        return current_ids
+        # Rows accept different numbers of tokens per round, so each is decoded on its own
+        rows = [
+            self._generate_sequence(input_ids[row:row + 1], max_new_tokens)
+            for row in range(input_ids.shape[0])
+        ]
+        return torch.cat(rows, dim=0)
     
-    def _draft_tokens(
-        self,
-        input_ids: torch.Tensor
-    ) -> List[int]:
-        """Generate speculative tokens using draft model."""
-        draft_ids = input_ids.clone()
-        draft_tokens = []
-        
-        draft_model = self.draft_model or self.target_model
-        
-        for _ in range(self.config.num_speculative_tokens):
-            outputs = draft_model(draft_ids)
-            logits = outputs["logits"][:, -1, :] / self.config.temperature
-            
-            # Apply top-k
-            if self.config.top_k > 0:
-                values, _ = logits.topk(self.config.top_k)
-                logits[logits < values[:, [-1]]] = float('-inf')
-            
-            # Sample
-            probs = torch.softmax(logits, dim=-1)
-            next_token = torch.multinomial(probs, num_samples=1)
-            
-            draft_tokens.append(next_token.item())
-            draft_ids = torch.cat([draft_ids, next_token], dim=1)
-        
-        return draft_tokens
+    def _probs(self, logits: torch.Tensor) -> torch.Tensor:
+        return filtered_probs(logits, self.config.temperature, self.config.top_k, self.config.top_p)
     
-    def _verify_tokens(
-        self,
-        input_ids: torch.Tensor,
-        draft_tokens: List[int]
-    ) -> List[int]:
-        """Verify draft tokens with target model."""
-        if not draft_tokens:
-            return []
-        
-        # Build sequence with all draft tokens
+    def _draft_state(self, target_state, draft_state):
+        """Self-drafting starts from the target's caches for the early-exit blocks."""
+        if not self.use_self_drafting:
+            return draft_state
+        if self.exit_layer is None or not self.target.incremental or target_state is None:
+            return target_state
+        return type(target_state)(
+            layer_caches=target_state.layer_caches[:self.exit_layer],
+            cms_states=target_state.cms_states,
+            seq_len=target_state.seq_len
+        )
+    
+    def _generate_sequence(self, input_ids: torch.Tensor, max_new_tokens: int) -> torch.Tensor:
+        """Speculative decoding of a single (1, seq) prompt."""
+        start = time.perf_counter()
         device = input_ids.device
-        all_tokens = input_ids.clone()
         
-        for token in draft_tokens:
-            token_tensor = torch.tensor([[token]], device=device)
-            all_tokens = torch.cat([all_tokens, token_tensor], dim=1)
+        # Prefill the whole prompt, like generate(); the first token comes from it
+        logits, target_state = self.target.run(self.target.initial_state(device), input_ids)
+        draft_state = None
+        if not self.use_self_drafting:
+            _, draft_state = self.draft.run(self.draft.initial_state(device), input_ids)
         
-        # Get target model predictions for all positions
-        outputs = self.target_model(all_tokens)
-        logits = outputs["logits"]
-        
-        # Verify each draft token
-        accepted = []
-        input_len = input_ids.shape[1]
-        
-        for i, draft_token in enumerate(draft_tokens):
-            pos = input_len + i - 1
-            if pos < 0:
-                pos = 0
+        # States always cover every token except `last`, the newest one
+        last = torch.multinomial(self._probs(logits[0, -1]), num_samples=1).view(1, 1)
+        new_tokens: List[torch.Tensor] = [last]
+        generated = 1
+        while generated < max_new_tokens:
+            # Each round yields accepted drafts plus one target token
+            k = min(self.config.num_speculative_tokens, max_new_tokens - generated - 1)
             
-            # Get target distribution at this position
-            target_logits = logits[:, pos, :] / self.config.temperature
-            target_probs = torch.softmax(target_logits, dim=-1)
+            # 1. Draft phase: propose k tokens and keep their distributions
+            draft_snapshot = self._draft_state(target_state, draft_state)
+            state = draft_snapshot
+            token = last
+            drafted, draft_probs = [], []
+            for _ in range(k):
+                logits, state = self.draft.run(state, token)
+                q = self._probs(logits[0, -1])
+                token = torch.multinomial(q, num_samples=1).view(1, 1)
+                drafted.append(token)
+                draft_probs.append(q)
             
-            # Acceptance probability
-            draft_prob = target_probs[0, draft_token].item()
+            # 2. Verify phase: one target pass over last + drafts
+            candidates = torch.cat([last] + drafted, dim=1)  # (1, k + 1)
+            logits, verified = self.target.run(target_state, candidates)
+            p = self._probs(logits[0])  # (k + 1, vocab)
             
-            # Accept with probability based on target model's confidence
-            if torch.rand(1).item() < draft_prob * 2:  # Relaxed acceptance
-                accepted.append(draft_token)
+            # 3. Rejection sampling: accept draft i with probability min(1, p_i / q_i)
+            num_accepted = k
+            if k > 0:
+                q = torch.stack(draft_probs)  # (k, vocab)
+                ids = candidates[0, 1:]
+                positions = torch.arange(k, device=device)
+                p_draft = p[positions, ids]
+                q_draft = q[positions, ids]
+                rejected = (torch.rand(k, device=device) * q_draft >= p_draft).nonzero()
+                if len(rejected) > 0:
+                    num_accepted = int(rejected[0])
+            
+            if num_accepted < k:
+                # Resample from the part of p that q under-covers
+                residual = (p[num_accepted] - q[num_accepted]).clamp_min(0)
+                if residual.sum() <= 0:
+                    residual = p[num_accepted]
+                next_token = torch.multinomial(residual / residual.sum(), num_samples=1)
             else:
-                break  # Reject rest of sequence
-        
-        return accepted
-    
-    def _sample_target(self, input_ids: torch.Tensor) -> torch.Tensor:
-        """Sample a single token from target model."""
-        outputs = self.target_model(input_ids)
-        logits = outputs["logits"][:, -1, :] / self.config.temperature
+                # Every draft accepted: bonus token from the last target distribution
+                next_token = torch.multinomial(p[k], num_samples=1)
+            next_token = next_token.view(1, 1)
+            
+            # 4. Advance states to cover last + accepted drafts
+            accepted = candidates[:, :num_accepted + 1]
+            if num_accepted < k:
+                target_state = self.target.rewind(target_state, verified, accepted)
+            else:
+                target_state = verified
+            if not self.use_self_drafting:
+                if num_accepted == k and k > 0:
+                    # Drafting fed every draft but the last one
+                    _, draft_state = self.draft.run(state, drafted[-1])
+                else:
+                    draft_state = self.draft.rewind(draft_snapshot, state, accepted)
+            
+            new_tokens.extend([accepted[:, 1:], next_token])
+            last = next_token
+            generated += num_accepted + 1
+            
+            self._stats["rounds"] += 1
+            self._stats["drafted"] += k
+            self._stats["accepted"] += num_accepted
         
-        # Apply top-k
-        if self.config.top_k > 0:
-            values, _ = logits.topk(self.config.top_k)
-            logits[logits < values[:, [-1]]] = float('-inf')
+        self._stats["generated"] += generated
+        self._stats["seconds"] += time.perf_counter() - start
         
-        probs = torch.softmax(logits, dim=-1)
-        return torch.multinomial(probs, num_samples=1)
+        return torch.cat([input_ids] + new_tokens, dim=1)
 
 
 class MedusaHead(nn.Module):
@@ -204,25 +363,57 @@ class MedusaHead(nn.Module):
     
     def forward(
         self,
-        hidden_states: torch.Tensor
+        hidden_states: torch.Tensor,
+        all_positions: bool = False
     ) -> List[torch.Tensor]:
         """
         Predict multiple future tokens.
         
+        Head i predicts the token i + 2 positions after each hidden state
+        (the LM head covers the next one).
+        
         Args:
             hidden_states: (batch, seq, d_model)
+            all_positions: Predict from every position instead of the last
         
         Returns:
-            List of logits for each future position
+            List of logits for each future position, (batch, vocab) or
+            (batch, seq, vocab) with all_positions
         """
-        # Get last hidden state
-        last_hidden = hidden_states[:, -1, :]  # (batch, d_model)
+        if not all_positions:
+            # Get last hidden state
+            hidden_states = hidden_states[:, -1, :]  # (batch, d_model)
         
         # Predict from each head
-        predictions = [head(last_hidden) for head in self.heads]
+        predictions = [head(hidden_states) for head in self.heads]
         
         return predictions
     
+    def loss(self, hidden_states: torch.Tensor, labels: torch.Tensor) -> torch.Tensor:
+        """
+        Mean cross-entropy of all heads.
+        
+        Args:
+            hidden_states: (batch, seq, d_model) backbone hidden states
+            labels: (batch, seq) next-token labels (labels[t] = token t + 1),
+                -100 to ignore
+        """
+        predictions = self.forward(hidden_states, all_positions=True)
+        seq_len = hidden_states.shape[1]
+        
+        losses = []
+        for i, logits in enumerate(predictions):
+            # Head i at position t predicts token t + i + 2 = labels[t + i + 1]
+            shift = i + 1
+            if shift >= seq_len:
+                break
+            losses.append(F.cross_entropy(
+                logits[:, :seq_len - shift].reshape(-1, logits.shape[-1]),
+                labels[:, shift:].reshape(-1),
+                ignore_index=-100
+            ))
+        return torch.stack(losses).mean()
+    
     def speculative_tokens(
         self,
         hidden_states: torch.Tensor,
@@ -240,13 +431,311 @@ class MedusaHead(nn.Module):
         return torch.stack(tokens, dim=1)  # (batch, num_heads)
 
 
+class MedusaTrainingModel(nn.Module):
+    """
+    Fits MedusaHead on a frozen backbone.
+    
+    Drop-in model for Trainer: forward(input_ids, labels) returns
+    {"loss": ...} and only the heads require gradients, so Trainer's
+    optimizer only updates them.
+    
+        trainer = Trainer(MedusaTrainingModel(model, medusa), train_loader)
+        trainer.train()
+    """
+    
+    def __init__(self, backbone: nn.Module, medusa_head: MedusaHead):
+        super().__init__()
+        self.backbone = backbone
+        self.medusa_head = medusa_head
+        
+        for param in self.backbone.parameters():
+            param.requires_grad = False
+        self.backbone.eval()
+    
+    def train(self, mode: bool = True):
+        # The backbone stays in eval mode (no dropout) while the heads train
+        super().train(mode)
+        self.backbone.eval()
+        return self
+    
+    def forward(
+        self,
+        input_ids: torch.Tensor,
+        labels: Optional[torch.Tensor] = None
+    ) -> Dict[str, Any]:
+        with torch.no_grad():
+            hidden_states = self.backbone(input_ids)["hidden_states"]
+        
+        outputs = {"hidden_states": hidden_states}
+        if labels is not None:
+            outputs["loss"] = self.medusa_head.loss(hidden_states, labels)
+        return outputs
+
+
+@dataclass
+class MedusaConfig:
+    """Configuration for Medusa tree decoding."""
+    tree_topk: Tuple[int, ...] = (3, 2, 2)  # Candidates per head; the tree is their product
+    temperature: float = 0.7
+    top_k: int = 50
+    top_p: float = 0.9
+    max_new_tokens: int = 100
+
+
+class MedusaDecoder:
+    """
+    Medusa decoding with tree-attention verification.
+    
+    Each round the heads' top-k proposals form a candidate tree under the
+    already sampled next token. The whole tree goes through the model in
+    one forward pass:
+    - Transformer-only models: one row with a tree attention mask (each
+      node sees the cache and its ancestors) and depth-based positions;
+      the accepted branch's KV entries are gathered afterwards.
+    - Models with recurrent state (Mamba, CMS): every root-to-leaf branch
+      is a batch row over the expanded state.
+    
+    The tree is then walked by sampling from the model at each node and
+    descending while the sample is a child, so the longest valid prefix
+    is accepted and the output is distributed exactly as plain sampling
+    (greedy when temperature <= 0). With continuum memory (use_cms) the
+    branches are fed one depth at a time to stay exact, so expect little
+    or no speedup.
+    """
+    
+    def __init__(
+        self,
+        model: nn.Module,
+        medusa_head: MedusaHead,
+        config: Optional[MedusaConfig] = None
+    ):
+        self.model = model
+        self.medusa_head = medusa_head
+        self.config = config or MedusaConfig()
+        
+        if len(self.config.tree_topk) > medusa_head.num_heads:
+            raise ValueError(
+                f"tree_topk has {len(self.config.tree_topk)} levels but MedusaHead has "
+                f"{medusa_head.num_heads} heads"
+            )
+        if not getattr(model, "supports_incremental_decoding", False):
+            raise ValueError("Medusa decoding needs a model with incremental decoding")
+        
+        self.runner = _SequenceRunner(model)
+        if self.runner.stepwise:
+            print("[MEDUSA] Model uses continuum memory: the tree is verified one depth "
+                  "at a time, so expect little or no speedup (use_cms=False for single-pass verification).")
+        self._build_tree()
+        self.reset_stats()
+    
+    def _build_tree(self):
+        """Static tree layout: node parents, depths, ancestor mask and branches."""
+        parents, depths, slots = [-1], [0], [0]
+        level = [0]
+        for depth, k in enumerate(self.config.tree_topk, start=1):
+            next_level = []
+            for parent in level:
+                for slot in range(k):
+                    parents.append(parent)
+                    depths.append(depth)
+                    slots.append(slot)  # Index into this head's top-k
+                    next_level.append(len(parents) - 1)
+            level = next_level
+        
+        num_nodes = len(parents)
+        ancestors = torch.eye(num_nodes, dtype=torch.bool)
+        for node in range(1, num_nodes):
+            ancestors[node] |= ancestors[parents[node]]
+        
+        self.tree_parents = parents
+        self.tree_depths = torch.tensor(depths)
+        self.tree_slots = slots
+        self.tree_ancestors = ancestors
+        
+        # Root-to-leaf branches (all leaves sit at the last depth)
+        self.tree_branches = torch.stack([ancestors[leaf].nonzero().view(-1) for leaf in level])
+        branch_of = {}
+        for row, branch in enumerate(self.tree_branches.tolist()):
+            for node in branch:
+                branch_of.setdefault(node, row)
+        self.tree_branch_of = [branch_of[node] for node in range(num_nodes)]
+    
+    def reset_stats(self):
+        self._stats = {"rounds": 0, "accepted": 0, "generated": 0, "seconds": 0.0}
+    
+    def get_stats(self) -> Dict[str, float]:
+        """Accepted tree tokens per round and throughput since the last reset."""
+        stats = dict(self._stats)
+        stats["accepted_per_round"] = stats["accepted"] / max(stats["rounds"], 1)
+        stats["tokens_per_round"] = stats["generated"] / max(stats["rounds"], 1)
+        stats["tokens_per_second"] = stats["generated"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+        return stats
+    
+    def _probs(self, logits: torch.Tensor) -> torch.Tensor:
+        return filtered_probs(logits, self.config.temperature, self.config.top_k, self.config.top_p)
+    
+    @torch.no_grad()
+    def generate(
+        self,
+        input_ids: torch.Tensor,
+        max_new_tokens: Optional[int] = None
+    ) -> torch.Tensor:
+        """
+        Generate tokens using Medusa tree decoding.
+        
+        Args:
+            input_ids: (batch, seq) input token IDs
+            max_new_tokens: Maximum tokens to generate
+        
+        Returns:
+            Generated token IDs
+        """
+        max_new_tokens = max_new_tokens or self.config.max_new_tokens
+        rows = [
+            self._generate_sequence(input_ids[row:row + 1], max_new_tokens)
+            for row in range(input_ids.shape[0])
+        ]
+        return torch.cat(rows, dim=0)
+    
+    def _generate_sequence(self, input_ids: torch.Tensor, max_new_tokens: int) -> torch.Tensor:
+        """Medusa decoding of a single (1, seq) prompt."""
+        start = time.perf_counter()
+        device = input_ids.device
+        
+        # State covers every fed token; `root` is sampled but not fed yet
+        outputs = self.model(input_ids, use_cache=True)
+        state = outputs["past_state"]
+        hidden = outputs["hidden_states"][:, -1:]
+        root = torch.multinomial(self._probs(outputs["logits"][0, -1]), num_samples=1)
+        new_tokens = [root]
+        generated = 1
+        
+        while generated < max_new_tokens:
+            # 1. Candidate tree: root plus each head's top-k at its depth
+            head_logits = self.medusa_head(hidden)
+            proposals = [
+                head_logits[i][0].topk(k).indices
+                for i, k in enumerate(self.config.tree_topk)
+            ]
+            tree_tokens = torch.stack([root.view(())] + [
+                proposals[depth - 1][slot]
+                for depth, slot in zip(self.tree_depths.tolist()[1:], self.tree_slots[1:])
+            ]).to(device)
+            
+            # 2. Verify every branch in one forward
+            use_tree_mask = self.runner.kv_only and state.cms_states is None
+            if use_tree_mask:
+                logits, tree_hidden, verified = self._verify_tree(state, tree_tokens)
+            else:
+                logits, tree_hidden, verified = self._verify_branches(state, tree_tokens)
+            probs = self._probs(logits)  # (num_nodes, vocab)
+            
+            # 3. Walk: sample at each node, descend while the sample is a child
+            children = {
+                (parent, int(token)): node
+                for node, (parent, token) in enumerate(zip(self.tree_parents, tree_tokens.tolist()))
+                if parent >= 0
+            }
+            path = [0]
+            while True:
+                next_token = int(torch.multinomial(probs[path[-1]], num_samples=1))
+                child = children.get((path[-1], next_token))
+                if child is None:
+                    break
+                path.append(child)
+            
+            # 4. Keep the accepted branch
+            state = self._select_path(state, verified, tree_tokens, path, use_tree_mask)
+            hidden = tree_hidden[path[-1]].view(1, 1, -1)
+            root = torch.tensor([next_token], device=device)
+            
+            new_tokens.extend([tree_tokens[path[1:]], root])
+            generated += len(path)
+            self._stats["rounds"] += 1
+            self._stats["accepted"] += len(path) - 1
+        
+        new_tokens = torch.cat(new_tokens)[:max_new_tokens]
+        self._stats["generated"] += len(new_tokens)
+        self._stats["seconds"] += time.perf_counter() - start
+        
+        return torch.cat([input_ids, new_tokens.view(1, -1)], dim=1)
+    
+    def _verify_tree(self, state, tree_tokens: torch.Tensor):
+        """Single-row forward with a tree attention mask."""
+        device = tree_tokens.device
+        past_len = state.seq_len
+        num_nodes = len(tree_tokens)
+        
+        mask = torch.zeros(num_nodes, past_len + num_nodes, device=device)
+        mask[:, past_len:].masked_fill_(~self.tree_ancestors.to(device), float("-inf"))
+        
+        outputs = self.model(
+            tree_tokens.view(1, -1),
+            past_state=state,
+            attention_mask=mask.view(1, 1, num_nodes, -1),
+            position_ids=(past_len + self.tree_depths.to(device)).view(1, -1)
+        )
+        return outputs["logits"][0], outputs["hidden_states"][0], outputs["past_state"]
+    
+    def _verify_branches(self, state, tree_tokens: torch.Tensor):
+        """One batch row per root-to-leaf branch over the expanded state."""
+        branches = self.tree_branches.to(tree_tokens.device)
+        num_branches = len(branches)
+        
+        def expand(tensor):
+            return tensor.expand(num_branches, *tensor.shape[1:])
+        
+        expanded = type(state)(
+            layer_caches=[tuple(expand(t) for t in cache) for cache in state.layer_caches],
+            cms_states=(
+                [tuple(expand(t) for t in cache) for cache in state.cms_states]
+                if state.cms_states is not None else None
+            ),
+            seq_len=state.seq_len
+        )
+        outputs = self.runner.forward(expanded, tree_tokens[branches])
+        
+        # Every node's outputs from the first branch containing it
+        rows = torch.tensor(self.tree_branch_of, device=tree_tokens.device)
+        depths = self.tree_depths.to(tree_tokens.device)
+        return outputs["logits"][rows, depths], outputs["hidden_states"][rows, depths], outputs["past_state"]
+    
+    def _select_path(self, state, verified, tree_tokens: torch.Tensor, path: List[int], tree_mask: bool):
+        """State covering the previous state plus the accepted path."""
+        if tree_mask:
+            # Keep the cache plus the KV entries of the accepted nodes
+            past_len = state.seq_len
+            keep = torch.cat([
+                torch.arange(past_len, device=tree_tokens.device),
+                past_len + torch.tensor(path, device=tree_tokens.device)
+            ])
+            layer_caches = [(k.index_select(2, keep), v.index_select(2, keep)) for k, v in verified.layer_caches]
+            return type(state)(layer_caches=layer_caches, cms_states=None, seq_len=past_len + len(path))
+        
+        if len(path) == len(self.config.tree_topk) + 1:
+            # A whole branch was accepted: its row already holds the state
+            row = self.tree_branch_of[path[-1]]
+            return type(state)(
+                layer_caches=[tuple(t[row:row + 1] for t in cache) for cache in verified.layer_caches],
+                cms_states=(
+                    [tuple(t[row:row + 1] for t in cache) for cache in verified.cms_states]
+                    if verified.cms_states is not None else None
+                ),
+                seq_len=verified.seq_len
+            )
+        
+        # Recurrent state cannot be cut back: recompute the accepted prefix
+        return self.runner.run(state, tree_tokens[path].view(1, -1))[1]
+
+
 def create_speculative_decoder(
     target_model: nn.Module,
     draft_model: Optional[nn.Module] = None,
-    num_speculative_tokens: int = 4
+    num_speculative_tokens: int = 4,
+    **kwargs
 ) -> SpeculativeDecoder:
     """Factory function for speculative decoder."""
-    config = SpeculativeConfig(num_speculative_tokens=num_speculative_tokens)
+    config = SpeculativeConfig(num_speculative_tokens=num_speculative_tokens, **kwargs)
     return SpeculativeDecoder(target_model, draft_model, config)
 
 
@@ -271,11 +760,14 @@ if __name__ == "__main__":
     output = decoder.generate(input_ids, max_new_tokens=10)
     print(f"Input: {input_ids.shape}")
     print(f"Output: {output.shape}")
+    print(f"Stats: {decoder.get_stats()}")
     
     # Test Medusa head
     medusa = MedusaHead(256, 1000, num_heads=4)
     hidden = torch.randn(1, 10, 256)
     preds = medusa(hidden)
     print(f"Medusa predictions: {len(preds)} heads")
+    loss = medusa.loss(hidden, torch.randint(0, 1000, (1, 10)))
+    print(f"Medusa loss: {loss.item():.3f}")
     
     print("✅ Speculative Decoding test passed!")
@@ -13,14 +13,16 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import numpy as np
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Tuple, Callable
 from dataclasses import dataclass, field
-from collections import defaultdict
 from pathlib import Path
+import os
 import pickle
 import heapq
 import time
 
+from .hnsw_storage import save_index, load_index, is_index_file
+
 
 @dataclass
 class VectorMemoryConfig:
@@ -32,6 +34,7 @@ class VectorMemoryConfig:
     ef_construction: int = 100  # Build quality
     ef_search: int = 50  # Search quality
     decay_rate: float = 0.0001  # Temporal decay
+    eviction_policy: str = "importance"  # "importance" (TemporalDecay) or "fifo"
 
 
 class HNSWIndex:
@@ -39,40 +42,168 @@ class HNSWIndex:
     Hierarchical Navigable Small World graph for efficient ANN search.
     
     Provides O(log n) search instead of O(n) brute force.
+    
+    Storage is array-backed: vectors live in one contiguous float32 matrix
+    and every level keeps fixed-width int32 neighbor lists (-1 padded), so
+    each graph expansion scores a whole neighbor block with one matmul.
+    Level 0 holds 2*M links per node; levels above hold M and only exist
+    for nodes that reach them.
+    
+    Deletion is soft: tombstoned nodes keep routing searches but are never
+    returned. compact() repairs the links around them and renumbers the
+    survivors in one pass. When full, the index evicts evict_fraction of
+    its nodes, oldest first or least important first (importance_fn).
     """
     
+    MAX_LEVEL = 10
+    
     def __init__(
         self,
         d_embedding: int,
         max_elements: int = 100000,
         M: int = 16,  # Number of neighbors per node
-        ef_construction: int = 100
+        ef_construction: int = 100,
+        initial_capacity: int = 1024,
+        exact_search_threshold: int = 2048,  # Below this size search is a single matmul
+        eviction_policy: str = "fifo",  # "fifo" or "importance"
+        evict_fraction: float = 0.1,
+        compact_ratio: float = 0.25,  # Tombstone share that makes compaction worthwhile
+        importance_fn: Optional[Callable[[int], float]] = None,
+        on_compact: Optional[Callable[[np.ndarray], None]] = None
     ):
         self.d_embedding = d_embedding
         self.max_elements = max_elements
         self.M = M
+        self.M0 = 2 * M
         self.ef_construction = ef_construction
+        self.exact_search_threshold = exact_search_threshold
+        
+        # Eviction / compaction
+        if eviction_policy not in ("fifo", "importance"):
+            raise ValueError(f"Unknown eviction policy: {eviction_policy}")
+        self.eviction_policy = eviction_policy
+        self.evict_fraction = evict_fraction
+        self.compact_ratio = compact_ratio
+        self.importance_fn = importance_fn  # idx -> importance, lowest is evicted first
+        self.on_compact = on_compact  # Called with the old -> new id map after compact()
         
         # Storage
-        self.vectors: List[np.ndarray] = []
         self.metadata: List[Dict] = []
+        self._count = 0
+        self._num_upper = 0
+        self._num_deleted = 0
         
-        # Graph structure (simplified HNSW)
-        self.neighbors: Dict[int, List[int]] = defaultdict(list)
+        # Graph structure
         self.entry_point: Optional[int] = None
-        
-        # Levels for hierarchical structure
-        self.levels: Dict[int, int] = {}
         self.max_level = 0
         self.level_mult = 1.0 / np.log(M)
+        
+        # Visited marks for graph search (compared against a per-search epoch)
+        self._visit_epoch = 0
+        
+        # On-disk state (see hnsw_storage)
+        self._read_only = False
+        self._persisted_path: Optional[str] = None
+        self._persisted_count = 0
+        
+        self._allocate(max(1, min(max_elements, initial_capacity)))
+        self._allocate_upper(max(1, min(max_elements, initial_capacity) // M))
+    
+    # ------------------------------------------------------------------
+    # Storage
+    # ------------------------------------------------------------------
+    
+    def _allocate(self, capacity: int):
+        """(Re)allocate per-node arrays to capacity rows, keeping contents."""
+        if not hasattr(self, "_vectors"):
+            self._vectors = np.zeros((capacity, self.d_embedding), dtype=np.float32)
+            self._levels = np.zeros(capacity, dtype=np.int8)
+            self._neighbors0 = np.full((capacity, self.M0), -1, dtype=np.int32)
+            self._counts0 = np.zeros(capacity, dtype=np.int32)
+            self._upper_row = np.full(capacity, -1, dtype=np.int32)
+            self._deleted = np.zeros(capacity, dtype=bool)
+            self._visited = np.zeros(capacity, dtype=np.int32)
+            return
+        self._vectors = _resized(self._vectors, capacity, 0)
+        self._levels = _resized(self._levels, capacity, 0)
+        self._neighbors0 = _resized(self._neighbors0, capacity, -1)
+        self._counts0 = _resized(self._counts0, capacity, 0)
+        self._upper_row = _resized(self._upper_row, capacity, -1)
+        self._deleted = _resized(self._deleted, capacity, False)
+        self._visited = _resized(self._visited, capacity, 0)
+    
+    def _allocate_upper(self, capacity: int):
+        """(Re)allocate neighbor lists for nodes above level 0."""
+        if not hasattr(self, "_upper_neighbors"):
+            self._upper_neighbors = np.full((capacity, self.MAX_LEVEL, self.M), -1, dtype=np.int32)
+            self._upper_counts = np.zeros((capacity, self.MAX_LEVEL), dtype=np.int32)
+            return
+        self._upper_neighbors = _resized(self._upper_neighbors, capacity, -1)
+        self._upper_counts = _resized(self._upper_counts, capacity, 0)
+    
+    @property
+    def vectors(self) -> np.ndarray:
+        """(num_slots, d_embedding) view of the stored unit vectors."""
+        return self._vectors[:self._count]
+    
+    @property
+    def levels(self) -> np.ndarray:
+        """Top level of every stored node."""
+        return self._levels[:self._count]
+    
+    @property
+    def num_slots(self) -> int:
+        """Used ids, including tombstones not yet compacted away."""
+        return self._count
+    
+    @property
+    def num_deleted(self) -> int:
+        return self._num_deleted
+    
+    def __len__(self) -> int:
+        """Number of live (not deleted) elements."""
+        return self._count - self._num_deleted
+    
+    def is_deleted(self, idx: int) -> bool:
+        return bool(self._deleted[idx])
     
     def _get_random_level(self) -> int:
         """Get random level for new node (exponential distribution)."""
         return int(-np.log(np.random.random()) * self.level_mult)
     
-    def _distance(self, v1: np.ndarray, v2: np.ndarray) -> float:
-        """Compute cosine distance."""
-        return 1.0 - np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2) + 1e-8)
+    def _distances(self, query: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        """Cosine distances from a unit query to a block of stored nodes."""
+        return 1.0 - self._vectors[ids] @ query
+    
+    def _get_neighbors(self, idx: int, level: int) -> np.ndarray:
+        """Valid neighbor ids of a node at a level."""
+        if level == 0:
+            return self._neighbors0[idx, :self._counts0[idx]]
+        row = self._upper_row[idx]
+        return self._upper_neighbors[row, level - 1, :self._upper_counts[row, level - 1]]
+    
+    def _set_neighbors(self, idx: int, level: int, neighbors: np.ndarray):
+        """Overwrite the neighbor list of a node at a level."""
+        n = len(neighbors)
+        if level == 0:
+            self._neighbors0[idx, :n] = neighbors
+            self._neighbors0[idx, n:] = -1
+            self._counts0[idx] = n
+        else:
+            row = self._upper_row[idx]
+            self._upper_neighbors[row, level - 1, :n] = neighbors
+            self._upper_neighbors[row, level - 1, n:] = -1
+            self._upper_counts[row, level - 1] = n
+    
+    def _neighbor_rows(self, ids: np.ndarray, level: int) -> np.ndarray:
+        """-1 padded neighbor lists of several nodes at a level."""
+        if level == 0:
+            return self._neighbors0[ids]
+        return self._upper_neighbors[self._upper_row[ids], level - 1]
+    
+    # ------------------------------------------------------------------
+    # Construction
+    # ------------------------------------------------------------------
     
     def add(
         self,
@@ -80,22 +211,28 @@ class HNSWIndex:
         metadata: Optional[Dict] = None
     ) -> int:
         """Add a vector to the index."""
-        idx = len(self.vectors)
+        self._check_writable()
+        if self._count >= self.max_elements:
+            self._evict()
         
-        if idx >= self.max_elements:
-            # Remove oldest
-            self._evict_oldest()
-            idx = len(self.vectors)
+        idx = self._count
+        if idx >= len(self._vectors):
+            self._allocate(min(self.max_elements, 2 * len(self._vectors)))
         
         # Normalize vector
-        vector = vector / (np.linalg.norm(vector) + 1e-8)
-        
-        self.vectors.append(vector)
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        self._vectors[idx] = vector / (np.linalg.norm(vector) + 1e-8)
         self.metadata.append(metadata or {})
         
         # Assign level
-        level = min(self._get_random_level(), 10)
-        self.levels[idx] = level
+        level = min(self._get_random_level(), self.MAX_LEVEL)
+        self._levels[idx] = level
+        if level > 0:
+            if self._num_upper >= len(self._upper_neighbors):
+                self._allocate_upper(2 * len(self._upper_neighbors))
+            self._upper_row[idx] = self._num_upper
+            self._num_upper += 1
+        self._count += 1
         
         if self.entry_point is None:
             self.entry_point = idx
@@ -113,91 +250,174 @@ class HNSWIndex:
         return idx
     
     def _connect_node(self, idx: int, level: int):
-        """Connect new node to existing graph."""
-        if len(self.vectors) < 2:
-            return
+        """Connect new node to existing graph, level by level from its top."""
+        query = self._vectors[idx]
         
-        # Find ef_construction nearest neighbors
-        candidates = self._search_layer(
-            self.vectors[idx],
-            self.ef_construction,
-            exclude={idx}
-        )
+        # Greedy descent through the levels above the new node
+        entry = self._greedy_descent(query[None], stop_level=level)
         
-        # Connect to M nearest
-        for neighbor_idx, _ in candidates[:self.M]:
-            self.neighbors[idx].append(neighbor_idx)
-            self.neighbors[neighbor_idx].append(idx)
+        for lc in range(min(level, self.max_level), -1, -1):
+            ids, dists = self._search_layer(query, entry, self.ef_construction, lc)
+            
+            # Connect to up to M diverse near neighbors
+            selected = self._select_neighbors(ids, dists, self.M)
+            self._set_neighbors(idx, lc, selected)
+            for neighbor_idx in selected.tolist():
+                self._link(neighbor_idx, idx, lc)
             
-            # Prune if too many neighbors
-            if len(self.neighbors[neighbor_idx]) > self.M * 2:
-                self._prune_neighbors(neighbor_idx)
+            entry = ids
     
-    def _prune_neighbors(self, idx: int):
-        """Prune neighbors to keep only M nearest."""
-        if len(self.neighbors[idx]) <= self.M:
+    def _link(self, idx: int, new_idx: int, level: int):
+        """Add a back-link, pruning to the nearest neighbors when full."""
+        neighbors = self._get_neighbors(idx, level)
+        width = self.M0 if level == 0 else self.M
+        
+        if len(neighbors) < width:
+            if level == 0:
+                self._neighbors0[idx, len(neighbors)] = new_idx
+                self._counts0[idx] += 1
+            else:
+                row = self._upper_row[idx]
+                self._upper_neighbors[row, level - 1, len(neighbors)] = new_idx
+                self._upper_counts[row, level - 1] += 1
             return
         
-        # Keep M nearest
-        distances = [
-            (n, self._distance(self.vectors[idx], self.vectors[n]))
-            for n in self.neighbors[idx]
-        ]
-        distances.sort(key=lambda x: x[1])
-        self.neighbors[idx] = [n for n, _ in distances[:self.M]]
+        self._prune_neighbors(idx, level, np.append(neighbors, new_idx))
+    
+    def _prune_neighbors(self, idx: int, level: int, candidates: np.ndarray):
+        """Shrink a full neighbor list back to the level's width."""
+        width = self.M0 if level == 0 else self.M
+        distances = self._distances(self._vectors[idx], candidates)
+        order = np.argsort(distances, kind="stable")
+        self._set_neighbors(
+            idx, level, self._select_neighbors(candidates[order], distances[order], width)
+        )
+    
+    def _select_neighbors(self, ids: np.ndarray, dists: np.ndarray, width: int) -> np.ndarray:
+        """
+        HNSW neighbor heuristic over candidates sorted by distance: keep a
+        candidate only if it is closer to the base node than to every
+        neighbor already kept. Keeps links spread across clusters instead
+        of spending them all on one dense region.
+        """
+        if len(ids) <= width:
+            return ids
+        
+        # Pairwise candidate distances in one matmul
+        pairwise = 1.0 - self._vectors[ids] @ self._vectors[ids].T
+        selected = []
+        for i, dist in enumerate(dists.tolist()):
+            if not selected or pairwise[i, selected].min() > dist:
+                selected.append(i)
+                if len(selected) == width:
+                    break
+        return ids[selected]
+    
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+    
+    def _next_epoch(self) -> int:
+        self._visit_epoch += 1
+        if self._visit_epoch >= np.iinfo(np.int32).max:
+            self._visited[:] = 0
+            self._visit_epoch = 1
+        return self._visit_epoch
+    
+    def _greedy_descent(self, queries: np.ndarray, stop_level: int = 0) -> np.ndarray:
+        """
+        Greedy best-first descent from the entry point for a batch of
+        queries, through every level above stop_level.
+        
+        Returns: (num_queries,) entry node per query for stop_level
+        """
+        num_queries = len(queries)
+        current = np.full(num_queries, self.entry_point, dtype=np.int64)
+        current_dist = 1.0 - queries @ self._vectors[self.entry_point]
+        
+        for level in range(self.max_level, stop_level, -1):
+            active = np.arange(num_queries)
+            while len(active):
+                neighbors = self._neighbor_rows(current[active], level)  # (a, M)
+                valid = neighbors >= 0
+                blocks = self._vectors[np.where(valid, neighbors, 0)]  # (a, M, d)
+                dists = 1.0 - np.einsum("amd,ad->am", blocks, queries[active])
+                dists[~valid] = np.inf
+                
+                best = dists.argmin(axis=1)
+                best_dist = dists[np.arange(len(active)), best]
+                improved = best_dist < current_dist[active]
+                
+                moved = active[improved]
+                current[moved] = neighbors[improved, best[improved]]
+                current_dist[moved] = best_dist[improved]
+                active = moved
+        
+        return current
     
     def _search_layer(
         self,
         query: np.ndarray,
+        entry_points: np.ndarray,
         ef: int,
-        exclude: Optional[set] = None
-    ) -> List[Tuple[int, float]]:
-        """Search a layer of the graph."""
-        if not self.vectors:
-            return []
-        
-        exclude = exclude or set()
-        
-        # Start from entry point
-        visited = set()
-        candidates = []  # min-heap by distance
-        results = []  # max-heap by -distance
-        
-        entry = self.entry_point
-        if entry in exclude:
-            entry = 0
+        level: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Best-first search of one level. Tombstones are expanded but kept
+        out of the results.
         
-        dist = self._distance(query, self.vectors[entry])
-        heapq.heappush(candidates, (dist, entry))
-        heapq.heappush(results, (-dist, entry))
-        visited.add(entry)
+        Returns: (ids, distances) of up to ef nearest live nodes, ascending
+        """
+        epoch = self._next_epoch()
+        visited = self._visited
+        deleted = self._deleted
+        has_deleted = self._num_deleted > 0
+        
+        entry = np.unique(np.asarray(entry_points, dtype=np.int64))
+        visited[entry] = epoch
+        entry_dists = self._distances(query, entry)
+        
+        candidates = list(zip(entry_dists.tolist(), entry.tolist()))  # min-heap by distance
+        heapq.heapify(candidates)
+        results = [(-d, i) for d, i in candidates if not deleted[i]]  # max-heap by -distance
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
         
         while candidates:
             c_dist, c_idx = heapq.heappop(candidates)
             
-            # Check if we can stop
-            if results and c_dist > -results[0][0]:
+            # Check if we can stop (with tombstones, only once results are full)
+            if results and c_dist > -results[0][0] and (len(results) >= ef or not has_deleted):
                 break
             
-            # Explore neighbors
-            for neighbor in self.neighbors.get(c_idx, []):
-                if neighbor in visited or neighbor in exclude:
-                    continue
-                visited.add(neighbor)
-                
-                d = self._distance(query, self.vectors[neighbor])
-                
+            # Score the unvisited part of the neighbor block at once
+            neighbors = self._get_neighbors(c_idx, level)
+            neighbors = neighbors[visited[neighbors] != epoch]
+            if len(neighbors) == 0:
+                continue
+            visited[neighbors] = epoch
+            dists = self._distances(query, neighbors)
+            
+            if len(results) >= ef:
+                closer = dists < -results[0][0]
+                neighbors, dists = neighbors[closer], dists[closer]
+            
+            for d, neighbor in zip(dists.tolist(), neighbors.tolist()):
                 if len(results) < ef or d < -results[0][0]:
                     heapq.heappush(candidates, (d, neighbor))
+                    if has_deleted and deleted[neighbor]:
+                        continue
                     heapq.heappush(results, (-d, neighbor))
                     
                     if len(results) > ef:
                         heapq.heappop(results)
         
         # Return sorted by distance
-        result_list = [(-d, idx) for d, idx in results]
-        result_list.sort(key=lambda x: x[0])
-        return [(idx, d) for d, idx in result_list]
+        results.sort(reverse=True)
+        ids = np.array([i for _, i in results], dtype=np.int64)
+        dists = np.array([-d for d, _ in results], dtype=np.float32)
+        return ids, dists
     
     def search(
         self,
@@ -210,64 +430,280 @@ class HNSWIndex:
         
         Returns: List of (index, distance, metadata)
         """
-        if not self.vectors:
-            return []
+        return self.search_many(np.asarray(query).reshape(1, -1), k=k, ef=ef)[0]
+    
+    def search_many(
+        self,
+        queries: np.ndarray,
+        k: int = 10,
+        ef: Optional[int] = None
+    ) -> List[List[Tuple[int, float, Dict]]]:
+        """
+        Search for the k nearest neighbors of every row of queries.
         
-        query = query / (np.linalg.norm(query) + 1e-8)
-        ef = ef or max(k * 2, 50)
+        Small indexes are searched exactly with one matmul; larger ones
+        descend the upper levels for all queries together and then run
+        one level-0 search per query.
+        
+        Returns: One list of (index, distance, metadata) per query
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None]
+        if self._count == 0:
+            return [[] for _ in range(len(queries))]
+        
+        queries = queries / (np.linalg.norm(queries, axis=1, keepdims=True) + 1e-8)
+        k = min(k, len(self))
+        if k == 0:
+            return [[] for _ in range(len(queries))]
+        
+        if self._count <= self.exact_search_threshold:
+            dists = 1.0 - queries @ self.vectors.T
+            dists[:, self._deleted[:self._count]] = np.inf
+            top = np.argpartition(dists, k - 1, axis=1)[:, :k]
+            top_dists = np.take_along_axis(dists, top, axis=1)
+            order = np.argsort(top_dists, axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            top_dists = np.take_along_axis(top_dists, order, axis=1)
+            return [
+                [(i, float(d), self.metadata[i]) for i, d in zip(row.tolist(), row_dists.tolist())]
+                for row, row_dists in zip(top, top_dists)
+            ]
+        
+        ef = max(ef or max(k * 2, 50), k)
+        entries = self._greedy_descent(queries)
+        
+        all_results = []
+        for query, entry in zip(queries, entries):
+            ids, dists = self._search_layer(query, entry[None], ef, 0)
+            all_results.append([
+                (i, float(d), self.metadata[i])
+                for i, d in zip(ids[:k].tolist(), dists[:k].tolist())
+            ])
+        return all_results
+    
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+    
+    def delete(self, idx: int) -> bool:
+        """
+        Soft-delete a node. It stops appearing in results immediately but
+        keeps its id and links until the next compact().
+        
+        Returns: True if the node was live
+        """
+        self._check_writable()
+        if idx < 0 or idx >= self._count or self._deleted[idx]:
+            return False
+        self._deleted[idx] = True
+        self._num_deleted += 1
+        return True
+    
+    def needs_compaction(self) -> bool:
+        """Whether tombstones exceed compact_ratio of the used slots."""
+        return self._num_deleted > self.compact_ratio * max(1, self._count)
+    
+    def compact(self) -> np.ndarray:
+        """
+        Drop tombstoned nodes: repair the links around them, then renumber
+        the survivors densely (keeping insertion order) in one pass.
+        
+        Returns: (old_num_slots,) map from old id to new id, -1 if dropped
+        """
+        self._check_writable()
+        if self._num_deleted == 0:
+            return np.arange(self._count)
         
-        results = self._search_layer(query, ef)[:k]
+        removed = np.nonzero(self._deleted[:self._count])[0]
+        self._repair(removed)
+        remap = self._rebuild(np.nonzero(~self._deleted[:self._count])[0])
         
-        return [
-            (idx, dist, self.metadata[idx])
-            for idx, dist in results
-        ]
+        if self.on_compact is not None:
+            self.on_compact(remap)
+        return remap
     
-    def _evict_oldest(self):
-        """Evict oldest memories when full."""
-        # Simple FIFO eviction
-        if len(self.vectors) > 0:
-            # Remove first 10%
-            remove_count = max(1, len(self.vectors) // 10)
-            self.vectors = self.vectors[remove_count:]
-            self.metadata = self.metadata[remove_count:]
+    def _evict(self):
+        """
+        Make room when full. Existing tombstones are compacted away first;
+        otherwise evict_fraction of the live nodes are deleted, oldest
+        first ("fifo") or least important first ("importance").
+        """
+        if self._num_deleted == 0:
+            live = np.nonzero(~self._deleted[:self._count])[0]
+            num_evict = max(1, int(len(live) * self.evict_fraction))
+            
+            if self.eviction_policy == "importance" and self.importance_fn is not None:
+                scores = np.array([self.importance_fn(i) for i in live.tolist()])
+                victims = live[np.argpartition(scores, num_evict - 1)[:num_evict]]
+            else:
+                # Ids keep insertion order across compactions
+                victims = live[:num_evict]
             
-            # Rebuild neighbors (simplified)
-            new_neighbors = defaultdict(list)
-            for old_idx, neighbors in self.neighbors.items():
-                new_idx = old_idx - remove_count
-                if new_idx >= 0:
-                    new_neighbors[new_idx] = [
-                        n - remove_count for n in neighbors
-                        if n - remove_count >= 0
-                    ]
-            self.neighbors = new_neighbors
+            self._deleted[victims] = True
+            self._num_deleted += len(victims)
+        
+        self.compact()
     
-    def save(self, path: Path):
-        """Save index to disk."""
-        data = {
-            "vectors": self.vectors,
-            "metadata": self.metadata,
-            "neighbors": dict(self.neighbors),
-            "entry_point": self.entry_point,
-            "levels": self.levels,
-            "max_level": self.max_level
-        }
-        with open(path, "wb") as f:
-            pickle.dump(data, f)
+    def _repair(self, removed: np.ndarray):
+        """
+        Patch the holes removed nodes leave in live neighbor lists.
+        
+        Every live node linking to a removed node drops that link and
+        refills the freed slots with the nearest live neighbors of the
+        removed node it does not link to yet, so routes through the
+        removed region stay connected.
+        """
+        removed_mask = np.zeros(self._count + 1, dtype=bool)  # Last slot stands for -1
+        removed_mask[removed] = True
+        live_mask = ~self._deleted[:self._count]
+        
+        for level in range(int(self._levels[removed].max()), -1, -1):
+            if level == 0:
+                nodes = np.arange(self._count)
+            else:
+                nodes = np.nonzero(self._levels[:self._count] >= level)[0]
+            rows = self._neighbor_rows(nodes, level)
+            affected = nodes[removed_mask[rows].any(axis=1) & live_mask[nodes]]
+            width = self.M0 if level == 0 else self.M
+            
+            for idx in affected.tolist():
+                own = self._get_neighbors(idx, level)
+                lost = own[removed_mask[own]]
+                kept = own[~removed_mask[own]]
+                
+                # Live second-hop candidates through the removed neighbors
+                candidates = np.concatenate([self._get_neighbors(r, level) for r in lost.tolist()])
+                candidates = candidates[~removed_mask[candidates]]
+                candidates = np.setdiff1d(candidates, np.append(kept, idx))
+                
+                free = width - len(kept)
+                if len(candidates) > free:
+                    dists = self._distances(self._vectors[idx], candidates)
+                    candidates = candidates[np.argpartition(dists, free - 1)[:free]]
+                self._set_neighbors(idx, level, np.concatenate([kept, candidates]))
+    
+    def _rebuild(self, keep: np.ndarray) -> np.ndarray:
+        """
+        Compact storage to the given (sorted) node ids.
+        
+        Ids are renumbered densely in order; links to removed nodes are
+        dropped from every neighbor list.
+        
+        Returns: Map from old id to new id (-1 if removed)
+        """
+        old_count = self._count
+        n = len(keep)
+        remap = np.full(old_count + 1, -1, dtype=np.int32)  # Last slot maps -1 -> -1
+        remap[keep] = np.arange(n, dtype=np.int32)
+        
+        def remap_rows(rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+            mapped = remap[rows]
+            # Move surviving links to the front of each row
+            order = np.argsort(mapped < 0, axis=-1, kind="stable")
+            mapped = np.take_along_axis(mapped, order, axis=-1)
+            return mapped, (mapped >= 0).sum(axis=-1).astype(np.int32)
+        
+        # Level 0
+        self._vectors[:n] = self._vectors[keep]
+        self._levels[:n] = self._levels[keep]
+        self._neighbors0[:n], self._counts0[:n] = remap_rows(self._neighbors0[keep])
+        
+        # Upper levels
+        upper_rows = self._upper_row[keep]
+        has_upper = upper_rows >= 0
+        num_upper = int(has_upper.sum())
+        kept_rows = upper_rows[has_upper]
+        self._upper_neighbors[:num_upper], self._upper_counts[:num_upper] = remap_rows(
+            self._upper_neighbors[kept_rows]
+        )
+        self._upper_neighbors[num_upper:self._num_upper] = -1
+        self._upper_counts[num_upper:self._num_upper] = 0
+        new_rows = np.full(n, -1, dtype=np.int32)
+        new_rows[has_upper] = np.arange(num_upper, dtype=np.int32)
+        self._upper_row[:n] = new_rows
+        self._num_upper = num_upper
+        
+        # Clear freed rows
+        self._vectors[n:old_count] = 0
+        self._levels[n:old_count] = 0
+        self._neighbors0[n:old_count] = -1
+        self._counts0[n:old_count] = 0
+        self._upper_row[n:old_count] = -1
+        self._deleted[:old_count] = False
+        
+        self.metadata = [self.metadata[i] for i in keep.tolist()]
+        self._count = n
+        self._num_deleted = 0
+        self._persisted_path = None  # Ids changed: next save rewrites the files
+        
+        # Entry point: keep it if it survived, else the highest remaining node
+        if n == 0:
+            self.entry_point = None
+            self.max_level = 0
+        elif self.entry_point is not None and remap[self.entry_point] >= 0:
+            self.entry_point = int(remap[self.entry_point])
+        else:
+            self.entry_point = int(np.argmax(self._levels[:n]))
+            self.max_level = int(self._levels[self.entry_point])
+        
+        return remap[:old_count]
+    
+    def _check_writable(self):
+        if self._read_only:
+            raise RuntimeError("Index was opened read-only (mmap_mode='r')")
     
-    def load(self, path: Path):
-        """Load index from disk."""
+    def save(self, path: Path) -> bool:
+        """
+        Save index to disk in the binary format of hnsw_storage.
+        
+        Saving again to the same path only appends new rows (and rewrites
+        the graph blocks) unless the index was compacted or grew.
+        
+        Returns: True if the save was incremental
+        """
+        return save_index(self, Path(path))
+    
+    def load(self, path: Path, mmap_mode: Optional[str] = "c", verify: bool = False):
+        """
+        Load index from disk.
+        
+        Binary index files are memory-mapped (see hnsw_storage.load_index);
+        older pickle files are read and their graph rebuilt.
+        """
+        path = Path(path)
         if not path.exists():
             return
+        if is_index_file(path):
+            load_index(self, path, mmap_mode=mmap_mode, verify=verify)
+            return
+        
         with open(path, "rb") as f:
             data = pickle.load(f)
-        self.vectors = data["vectors"]
-        self.metadata = data["metadata"]
-        self.neighbors = defaultdict(list, data["neighbors"])
-        self.entry_point = data["entry_point"]
-        self.levels = data["levels"]
-        self.max_level = data["max_level"]
+        
+        # Reset storage and rebuild the graph from the pickled vectors
+        del self._vectors, self._upper_neighbors
+        self._count = 0
+        self._num_upper = 0
+        self._num_deleted = 0
+        self.metadata = []
+        self.entry_point = None
+        self.max_level = 0
+        self._read_only = False
+        self._persisted_path = None
+        self._allocate(max(1, min(self.max_elements, len(data["vectors"]))))
+        self._allocate_upper(1)
+        for vector, meta in zip(data["vectors"], data["metadata"]):
+            self.add(vector, meta)
+
+
+def _resized(array: np.ndarray, rows: int, fill) -> np.ndarray:
+    """Copy of array with rows rows along dim 0, padded with fill."""
+    out = np.full((rows,) + array.shape[1:], fill, dtype=array.dtype)
+    n = min(rows, len(array))
+    out[:n] = array[:n]
+    return out
 
 
 class MemoryCluster(nn.Module):
@@ -391,42 +827,66 @@ class TemporalDecay:
     Manages temporal decay of memory importance.
     
     Recent memories are more important, but frequently accessed ones persist.
+    
+    Records live in one numpy array indexed by memory id (index row), so
+    they are saved as a single .npy file and memory-mapped on load next
+    to the index instead of being rebuilt as per-id Python objects.
     """
     
-    def __init__(self, decay_rate: float = 0.0001):
+    RECORD_DTYPE = np.dtype([
+        ("created", np.float64),      # NaN = no record
+        ("last_access", np.float64),
+        ("accesses", np.int64)
+    ])
+    
+    def __init__(self, decay_rate: float = 0.0001, initial_capacity: int = 1024):
         self.decay_rate = decay_rate
-        self.access_counts: Dict[int, int] = defaultdict(int)
-        self.creation_times: Dict[int, float] = {}
-        self.last_access: Dict[int, float] = {}
+        self._records = self._empty(initial_capacity)
+    
+    @classmethod
+    def _empty(cls, size: int) -> np.ndarray:
+        records = np.zeros(size, dtype=cls.RECORD_DTYPE)
+        records["created"] = np.nan
+        return records
+    
+    def _reserve(self, idx: int):
+        """Grow the record array (geometrically) to hold idx."""
+        if idx >= len(self._records):
+            records = self._empty(max(idx + 1, 2 * len(self._records)))
+            records[:len(self._records)] = self._records
+            self._records = records
     
     def record_creation(self, idx: int):
         """Record memory creation."""
-        self.creation_times[idx] = time.time()
-        self.last_access[idx] = time.time()
+        self._reserve(idx)
+        now = time.time()
+        self._records[idx] = (now, now, 0)
     
     def record_access(self, idx: int):
         """Record memory access."""
-        self.access_counts[idx] += 1
-        self.last_access[idx] = time.time()
+        self._reserve(idx)
+        self._records["accesses"][idx] += 1
+        self._records["last_access"][idx] = time.time()
     
-    def compute_importance(self, idx: int, base_importance: float = 0.5) -> float:
-        """Compute current importance with decay."""
-        if idx not in self.creation_times:
-            return base_importance
-        
+    def _importance(self, records: np.ndarray, base_importance) -> np.ndarray:
         current_time = time.time()
-        age = current_time - self.creation_times[idx]
-        recency = current_time - self.last_access.get(idx, self.creation_times[idx])
-        access_count = self.access_counts.get(idx, 0)
+        age = current_time - records["created"]
+        recency = current_time - records["last_access"]
         
         # Exponential decay with access boost
         decay = np.exp(-self.decay_rate * age)
         recency_boost = np.exp(-self.decay_rate * recency * 0.5)
-        access_boost = 1 + np.log1p(access_count) * 0.1
-        
-        importance = base_importance * decay * recency_boost * access_boost
+        access_boost = 1 + np.log1p(records["accesses"]) * 0.1
         
-        return min(1.0, importance)
+        importance = np.minimum(1.0, base_importance * decay * recency_boost * access_boost)
+        # Memories without a record keep their base importance
+        return np.where(np.isnan(records["created"]), base_importance, importance)
+    
+    def compute_importance(self, idx: int, base_importance: float = 0.5) -> float:
+        """Compute current importance with decay."""
+        if idx >= len(self._records):
+            return base_importance
+        return float(self._importance(self._records[idx:idx + 1], base_importance)[0])
     
     def get_memories_to_forget(
         self,
@@ -434,11 +894,53 @@ class TemporalDecay:
         threshold: float = 0.1
     ) -> List[int]:
         """Get indices of memories that should be forgotten."""
-        to_forget = []
-        for idx in range(num_memories):
-            if self.compute_importance(idx) < threshold:
-                to_forget.append(idx)
-        return to_forget
+        self._reserve(num_memories - 1)
+        importance = self._importance(self._records[:num_memories], 0.5)
+        return np.nonzero(importance < threshold)[0].tolist()
+    
+    def forget(self, idx: int):
+        """Drop decay records of a memory."""
+        if idx < len(self._records):
+            self._records[idx] = (np.nan, 0.0, 0)
+    
+    def remap(self, remap: np.ndarray):
+        """Renumber records after index compaction (old id -> new id, -1 = removed)."""
+        old = np.arange(min(len(remap), len(self._records)))
+        new = np.asarray(remap[:len(old)])
+        keep = new >= 0
+        records = self._empty(len(self._records))
+        records[new[keep]] = self._records[old[keep]]
+        self._records = records
+    
+    def save(self, path: Path):
+        """Write the records as one .npy file (atomic replace)."""
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, np.asarray(self._records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    
+    def load(self, path: Path, mmap_mode: Optional[str] = "c"):
+        """
+        Open records written by save(). They are memory-mapped copy-on-write
+        (so access updates stay in memory) unless mmap_mode is None.
+        """
+        records = np.load(path, mmap_mode=None if mmap_mode is None else "c")
+        if records.dtype != self.RECORD_DTYPE:
+            raise ValueError(f"Unexpected decay record layout in {path}")
+        self._records = records
+    
+    def load_npz(self, path: Path):
+        """Read the older decay.npz layout (ids plus per-field arrays)."""
+        with np.load(path) as decay:
+            ids = decay["ids"]
+            records = self._empty(int(ids.max()) + 1 if len(ids) else 0)
+            records["created"][ids] = decay["creation_times"]
+            records["last_access"][ids] = decay["last_access"]
+            records["accesses"][ids] = decay["access_counts"]
+        self._records = records
 
 
 class AdvancedVectorMemory(nn.Module):
@@ -459,7 +961,9 @@ class AdvancedVectorMemory(nn.Module):
             d_embedding=self.config.d_embedding,
             max_elements=self.config.max_memories,
             M=self.config.num_neighbors,
-            ef_construction=self.config.ef_construction
+            ef_construction=self.config.ef_construction,
+            eviction_policy=self.config.eviction_policy,
+            importance_fn=self._memory_importance
         )
         
         # Clustering
@@ -474,8 +978,9 @@ class AdvancedVectorMemory(nn.Module):
             d_memory=self.config.d_embedding
         )
         
-        # Temporal decay
+        # Temporal decay (ids follow the index through compaction)
         self.decay = TemporalDecay(self.config.decay_rate)
+        self.index.on_compact = self.decay.remap
         
         # Encoder
         self.encoder = nn.Sequential(
@@ -489,6 +994,12 @@ class AdvancedVectorMemory(nn.Module):
         self.total_stores = 0
         self.total_retrievals = 0
     
+    def _memory_importance(self, idx: int) -> float:
+        """Current decayed importance of a stored memory (eviction score)."""
+        return self.decay.compute_importance(
+            idx, self.index.metadata[idx].get("importance", 0.5)
+        )
+    
     def encode(self, hidden_states: torch.Tensor) -> torch.Tensor:
         """Encode hidden states to memory space."""
         if hidden_states.dim() == 3:
@@ -568,7 +1079,7 @@ class AdvancedVectorMemory(nn.Module):
         if use_attention and len(results) > 0:
             # Get memory embeddings
             memory_embeds = torch.tensor(
-                np.stack([self.index.vectors[idx] for idx, _, _ in results]),
+                self.index.vectors[[idx for idx, _, _ in results]],
                 dtype=torch.float32,
                 device=query_encoded.device
             ).unsqueeze(0)
@@ -588,21 +1099,32 @@ class AdvancedVectorMemory(nn.Module):
         }
     
     def consolidate(self, threshold: float = 0.1) -> Dict[str, Any]:
-        """Consolidate memories, forgetting unimportant ones."""
-        total_memories = len(self.index.vectors)
+        """
+        Consolidate memories, forgetting unimportant ones.
+        
+        Forgotten memories are tombstoned in the index; the index is
+        compacted (ids renumbered) once tombstones pile up.
+        """
+        total_slots = self.index.num_slots
         to_forget = self.decay.get_memories_to_forget(
-            total_memories,
+            total_slots,
             threshold
         )
         
-        # For now, just mark them (actual removal is complex with graph structure)
+        pruned = 0
         for idx in to_forget:
-            if idx < len(self.index.metadata):
-                self.index.metadata[idx]["forgotten"] = True
+            if self.index.delete(idx):
+                self.decay.forget(idx)
+                pruned += 1
+        
+        compacted = self.index.needs_compaction()
+        if compacted:
+            self.index.compact()
         
         return {
-            "pruned": len(to_forget),
-            "total_slots": total_memories,
+            "pruned": pruned,
+            "total_slots": total_slots,
+            "compacted": compacted,
             "threshold": threshold
         }
     
@@ -613,7 +1135,8 @@ class AdvancedVectorMemory(nn.Module):
     def get_stats(self) -> Dict[str, Any]:
         """Get memory statistics."""
         return {
-            "total_memories": len(self.index.vectors),
+            "total_memories": len(self.index),
+            "deleted_pending_compaction": self.index.num_deleted,
             "total_stores": self.total_stores,
             "total_retrievals": self.total_retrievals,
             "num_clusters": self.config.num_clusters,
@@ -621,17 +1144,32 @@ class AdvancedVectorMemory(nn.Module):
         }
     
     def save(self, path: Path):
-        """Save memory to disk."""
+        """Save memory to disk (index saves are incremental when possible)."""
         path = Path(path)
         path.mkdir(parents=True, exist_ok=True)
-        self.index.save(path / "index.pkl")
+        self.index.save(path / "index.hnsw")
+        self.decay.save(path / "decay.npy")
         torch.save(self.state_dict(), path / "memory_model.pt")
     
-    def load(self, path: Path):
-        """Load memory from disk."""
+    def load(self, path: Path, mmap_mode: Optional[str] = "c", verify: bool = False):
+        """
+        Load memory from disk.
+        
+        The index and decay records are memory-mapped rather than read
+        (mmap_mode="r" for read-only serving, None to read them into RAM);
+        older index.pkl / decay.npz directories are still understood.
+        """
         path = Path(path)
-        if (path / "index.pkl").exists():
+        if (path / "index.hnsw").exists():
+            self.index.load(path / "index.hnsw", mmap_mode=mmap_mode, verify=verify)
+        elif (path / "index.pkl").exists():
             self.index.load(path / "index.pkl")
+        
+        if (path / "decay.npy").exists():
+            self.decay.load(path / "decay.npy", mmap_mode=mmap_mode)
+        elif (path / "decay.npz").exists():
+            self.decay.load_npz(path / "decay.npz")
+        
         if (path / "memory_model.pt").exists():
             self.load_state_dict(torch.load(path / "memory_model.pt"))
 
@@ -610,35 +610,45 @@ class ChainOfThought(nn.Module):
         self,
         initial_thought: torch.Tensor
     ) -> Dict[str, Any]:
-        """Sequential chain of thought."""
+        """
+        Sequential chain of thought.
+        
+        Early stopping and reflection are decided per row: a row that
+        reaches high progress keeps its thought while the rest of the
+        batch continues, and only rows failing verification are retried.
+        """
         thought = initial_thought
         trace = [thought]
         evaluations = []
+        finished = torch.zeros(thought.shape[:-1], dtype=torch.bool, device=thought.device)
         
         for step in range(self.config.max_reasoning_steps):
-            # Take step
+            # Take step (finished rows keep their thought)
             step_result = self.stepper(thought, trace[-1] if len(trace) > 1 else None)
-            thought = step_result["thought"]
+            thought = torch.where(finished.unsqueeze(-1), thought, step_result["thought"])
             trace.append(thought)
             
             # Evaluate
             eval_result = self.evaluator(thought, trace[-2])
             evaluations.append(eval_result)
             
-            # Early stopping if high progress
-            if eval_result["progress"].mean() > 0.9:
+            # Early stopping once every row has high progress
+            finished = finished | (eval_result["progress"] > 0.9)
+            if finished.all():
                 break
         
         # Verify conclusion
         verification = self.verifier.verify_conclusion(initial_thought, thought)
         
-        # Reflect if needed
+        # Reflect on rows that failed verification
         reflection = None
-        if verification["valid"].mean() < self.config.verification_threshold:
+        needs_reflection = verification["valid"] < self.config.verification_threshold
+        if needs_reflection.any():
             reflection = self.reflector(thought, verification)
-            if reflection["should_retry"].any():
+            retry = needs_reflection & reflection["should_retry"]
+            if retry.any():
                 # Try again with improved thought
-                thought = reflection["improved_thought"]
+                thought = torch.where(retry.unsqueeze(-1), reflection["improved_thought"], thought)
         
         # Decode
         output = self.decoder(thought)
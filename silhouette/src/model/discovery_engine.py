@@ -20,7 +20,7 @@ Leverages existing modules:
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from typing import Optional, Dict, Any, List, Tuple, Set
+from typing import Optional, Dict, Any, List, Tuple, Set, Union
 from dataclasses import dataclass, field
 from enum import Enum
 from collections import defaultdict
@@ -84,6 +84,121 @@ class DiscoveryEngineConfig:
     auto_cycle_interval: int = 100  # steps between auto cycles
     max_candidates_per_cycle: int = 10
     deferred_retry_delay: int = 50  # steps before retry
+    
+    # Focus selection
+    focus_top_k: int = 1  # Focus nodes seeded per cycle
+    focus_sample_size: int = 0  # Score a random subset of nodes (0 = all)
+    focus_batch_size: int = 1024  # Nodes per curiosity forward pass
+
+
+def _csr_positions(row_ptr: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Positions in the CSR column array of all entries of the given rows."""
+    starts = row_ptr[rows]
+    counts = row_ptr[rows + 1] - starts
+    offsets = np.cumsum(counts) - counts
+    return np.arange(counts.sum()) - np.repeat(offsets, counts) + np.repeat(starts, counts)
+
+
+class SparseTopology:
+    """
+    Directed graph as a sparse adjacency matrix.
+    
+    Edges are appended incrementally (duplicates ignored) and the CSR
+    form is rebuilt lazily, only after edges were added. sync_edges()
+    consumes just the edges appended to a growing edge list since the
+    previous call, and starts over when handed a different list.
+    """
+    
+    def __init__(self):
+        self.node_to_idx: Dict[str, int] = {}
+        self.idx_to_node: List[str] = []
+        self._edge_set: Set[Tuple[int, int]] = set()
+        self._src = np.zeros(64, dtype=np.int64)
+        self._tgt = np.zeros(64, dtype=np.int64)
+        self._num_edges = 0
+        self._edges_seen = 0
+        self._edges_source: Optional[List[Any]] = None  # Edge list synced from
+        self._csr: Optional[Tuple[np.ndarray, np.ndarray]] = None
+    
+    @classmethod
+    def from_adjacency(cls, adjacency: Dict[str, List[str]]) -> "SparseTopology":
+        topology = cls()
+        for source, targets in adjacency.items():
+            for target in targets:
+                topology.add_edge(source, target)
+        return topology
+    
+    def _node(self, node_id: str) -> int:
+        idx = self.node_to_idx.get(node_id)
+        if idx is None:
+            idx = self.node_to_idx[node_id] = len(self.idx_to_node)
+            self.idx_to_node.append(node_id)
+        return idx
+    
+    def add_edge(self, source: str, target: str) -> bool:
+        """Add source -> target; returns False if it already existed."""
+        pair = (self._node(source), self._node(target))
+        if pair in self._edge_set:
+            return False
+        self._edge_set.add(pair)
+        
+        if self._num_edges == len(self._src):
+            self._src = np.concatenate([self._src, np.zeros_like(self._src)])
+            self._tgt = np.concatenate([self._tgt, np.zeros_like(self._tgt)])
+        self._src[self._num_edges], self._tgt[self._num_edges] = pair
+        self._num_edges += 1
+        self._csr = None
+        return True
+    
+    def sync_edges(self, edges: List[Any]) -> int:
+        """Add edges (with source_id/target_id) appended since the last sync."""
+        if edges is not self._edges_source or len(edges) < self._edges_seen:
+            # A different (or truncated) edge list; start over
+            self.__init__()
+            self._edges_source = edges
+        added = 0
+        for edge in edges[self._edges_seen:]:
+            added += self.add_edge(edge.source_id, edge.target_id)
+        self._edges_seen = len(edges)
+        return added
+    
+    @property
+    def num_nodes(self) -> int:
+        return len(self.idx_to_node)
+    
+    @property
+    def num_edges(self) -> int:
+        return self._num_edges
+    
+    def csr(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(row_ptr, col_index) with columns sorted within each row."""
+        if self._csr is None:
+            src = self._src[:self._num_edges]
+            tgt = self._tgt[:self._num_edges]
+            order = np.lexsort((tgt, src))
+            row_ptr = np.zeros(self.num_nodes + 1, dtype=np.int64)
+            np.cumsum(np.bincount(src, minlength=self.num_nodes), out=row_ptr[1:])
+            self._csr = (row_ptr, tgt[order])
+        return self._csr
+    
+    def out_degree(self) -> np.ndarray:
+        row_ptr, _ = self.csr()
+        return np.diff(row_ptr)
+    
+    def source_nodes(self) -> np.ndarray:
+        """Indices of nodes with at least one outgoing edge."""
+        return np.flatnonzero(self.out_degree())
+    
+    def __len__(self) -> int:
+        # Matches len() of a dict-of-lists adjacency keyed by source
+        return len(self.source_nodes())
+    
+    def to_adjacency(self) -> Dict[str, List[str]]:
+        row_ptr, col = self.csr()
+        return {
+            self.idx_to_node[i]: [self.idx_to_node[j] for j in col[row_ptr[i]:row_ptr[i + 1]]]
+            for i in self.source_nodes()
+        }
 
 
 class WattsStrogatzOptimizer(nn.Module):
@@ -104,10 +219,13 @@ class WattsStrogatzOptimizer(nn.Module):
         # Metrics history
         self.clustering_history: List[float] = []
         self.path_length_history: List[float] = []
+        
+        # Sparse graph kept in sync with the knowledge graph
+        self.topology = SparseTopology()
     
     def compute_clustering_coefficient(
         self,
-        adjacency: Dict[str, List[str]],
+        adjacency: Union[SparseTopology, Dict[str, List[str]]],
         sample_size: int = 100
     ) -> float:
         """
@@ -116,85 +234,109 @@ class WattsStrogatzOptimizer(nn.Module):
         C = (number of closed triangles) / (number of possible triangles)
         
         High C means neighbors of a node are likely connected to each other.
+        Closed triangles are counted for all sampled nodes at once as the
+        product A_s A masked by A_s (A = adjacency, s = sampled rows).
         """
-        if len(adjacency) < 3:
+        topology = self._as_topology(adjacency)
+        nodes = topology.source_nodes()
+        if len(nodes) < 3:
             return 0.0
         
-        nodes = list(adjacency.keys())
         if len(nodes) > sample_size:
-            nodes = np.random.choice(nodes, sample_size, replace=False).tolist()
-        
-        total_triangles = 0
-        total_possible = 0
+            nodes = np.random.choice(nodes, sample_size, replace=False)
         
-        for node in nodes:
-            neighbors = set(adjacency.get(node, []))
-            k = len(neighbors)
-            
-            if k < 2:
-                continue
-            
-            # Count connections between neighbors
-            closed = 0
-            for n1 in neighbors:
-                for n2 in neighbors:
-                    if n1 != n2 and n2 in adjacency.get(n1, []):
-                        closed += 1
-            
-            closed //= 2  # Each edge counted twice
-            possible = k * (k - 1) // 2
-            
-            total_triangles += closed
-            total_possible += possible
+        row_ptr, col = topology.csr()
+        degree = np.diff(row_ptr)
+        nodes = nodes[degree[nodes] >= 2]
+        if len(nodes) == 0:
+            return 0.0
         
+        # Wedges: sampled node -> neighbor n1 -> n2 (n1 != n2)
+        first = _csr_positions(row_ptr, nodes)
+        owner = np.repeat(np.arange(len(nodes)), degree[nodes])
+        n1 = col[first]
+        second = _csr_positions(row_ptr, n1)
+        owner2 = np.repeat(owner, degree[n1])
+        n2 = col[second]
+        keep = n2 != np.repeat(n1, degree[n1])
+        owner2, n2 = owner2[keep], n2[keep]
+        
+        # Closed if n2 is also a neighbor of the sampled node
+        neighbor_keys = owner * topology.num_nodes + n1  # Sorted: owners ascend, rows are sorted
+        wedge_keys = owner2 * topology.num_nodes + n2
+        hits = np.searchsorted(neighbor_keys, wedge_keys)
+        closed_mask = neighbor_keys[np.minimum(hits, len(neighbor_keys) - 1)] == wedge_keys
+        closed = np.bincount(owner2[closed_mask], minlength=len(nodes)) // 2  # Each edge counted twice
+        
+        k = degree[nodes]
+        total_possible = int((k * (k - 1) // 2).sum())
         if total_possible == 0:
             return 0.0
         
-        return total_triangles / total_possible
+        return int(closed.sum()) / total_possible
     
     def estimate_path_length(
         self,
-        adjacency: Dict[str, List[str]],
+        adjacency: Union[SparseTopology, Dict[str, List[str]]],
         sample_size: int = 50
     ) -> float:
         """
         Estimate average shortest path length using BFS sampling.
         
-        Short L means information can spread quickly.
+        Short L means information can spread quickly. All sampled sources
+        are expanded together, one level per step, with a visited bitset
+        per source.
         """
-        if len(adjacency) < 2:
+        topology = self._as_topology(adjacency)
+        nodes = topology.source_nodes()
+        if len(nodes) < 2:
             return 0.0
         
-        nodes = list(adjacency.keys())
         if len(nodes) > sample_size:
-            sample_nodes = np.random.choice(nodes, sample_size, replace=False).tolist()
-        else:
-            sample_nodes = nodes
+            nodes = np.random.choice(nodes, sample_size, replace=False)
+        sources = nodes[:sample_size // 2]
+        
+        row_ptr, col = topology.csr()
+        degree = np.diff(row_ptr)
+        num_nodes = topology.num_nodes
+        
+        # Bitsets over (source, node), flattened
+        visited = np.zeros(len(sources) * num_nodes, dtype=bool)
+        level = np.zeros_like(visited)
+        visited[np.arange(len(sources)) * num_nodes + sources] = True
+        frontier_owner = np.arange(len(sources))
+        frontier = sources
         
         total_length = 0
         count = 0
+        depth = 0
         
-        for source in sample_nodes[:sample_size//2]:
-            # BFS from source
-            visited = {source: 0}
-            queue = [source]
+        while len(frontier):
+            depth += 1
             
-            while queue:
-                current = queue.pop(0)
-                current_dist = visited[current]
-                
-                for neighbor in adjacency.get(current, []):
-                    if neighbor not in visited:
-                        visited[neighbor] = current_dist + 1
-                        queue.append(neighbor)
-                        total_length += visited[neighbor]
-                        count += 1
+            # Expand every (source, node) in the frontier in one step
+            positions = _csr_positions(row_ptr, frontier)
+            keys = np.repeat(frontier_owner, degree[frontier]) * num_nodes + col[positions]
+            level[keys[~visited[keys]]] = True
+            keys = np.flatnonzero(level)
+            level[keys] = False
+            visited[keys] = True
+            
+            frontier_owner, frontier = keys // num_nodes, keys % num_nodes
+            total_length += depth * len(keys)
+            count += len(keys)
         
         if count == 0:
             return float('inf')
         
         return total_length / count
     
+    @staticmethod
+    def _as_topology(adjacency: Union[SparseTopology, Dict[str, List[str]]]) -> SparseTopology:
+        if isinstance(adjacency, SparseTopology):
+            return adjacency
+        return SparseTopology.from_adjacency(adjacency)
+    
     def should_rewire(
         self,
         clustering: float,
@@ -694,70 +836,126 @@ class System2Validation(nn.Module):
         """
         Validate a discovery candidate using deliberate reasoning.
         """
-        trace = []
+        return self.validate_batch([candidate], chain_of_thought, self_model)[0]
+    
+    def validate_batch(
+        self,
+        candidates: List[DiscoveryCandidate],
+        chain_of_thought: Any,  # ChainOfThought module
+        self_model: Any         # AdvancedSelfModel
+    ) -> List[Tuple[DiscoveryDecision, float, List[str]]]:
+        """
+        Validate many candidates with one pass of each network.
+        
+        Candidates are grouped by embedding shape; within a group the
+        validator, hallucination detector, Chain-of-Thought and self-model
+        each run once over the stacked (source, target) pairs.
+        
+        Returns:
+            (decision, score, trace) per candidate, in input order
+        """
+        results: List[Optional[Tuple[DiscoveryDecision, float, List[str]]]] = [None] * len(candidates)
         
-        # Ensure embeddings are proper tensors
-        source_emb = candidate.source_embedding
-        target_emb = candidate.target_embedding
+        groups: Dict[Tuple, List[int]] = defaultdict(list)
+        for i, candidate in enumerate(candidates):
+            key = (tuple(candidate.source_embedding.shape), tuple(candidate.target_embedding.shape))
+            groups[key].append(i)
         
-        if source_emb.dim() == 1:
-            source_emb = source_emb.unsqueeze(0)
-        if target_emb.dim() == 1:
-            target_emb = target_emb.unsqueeze(0)
+        for indices in groups.values():
+            group = [candidates[i] for i in indices]
+            for i, result in zip(indices, self._validate_group(group, chain_of_thought, self_model)):
+                results[i] = result
+        
+        return results
+    
+    def _validate_group(
+        self,
+        candidates: List[DiscoveryCandidate],
+        chain_of_thought: Any,
+        self_model: Any
+    ) -> List[Tuple[DiscoveryDecision, float, List[str]]]:
+        """Validate candidates whose embeddings share a shape."""
+        traces = [[] for _ in candidates]
+        
+        # Ensure embeddings are proper tensors: (n, d) each
+        source_emb = torch.cat([c.source_embedding.reshape(1, -1) for c in candidates])
+        target_emb = torch.cat([c.target_embedding.reshape(1, -1) for c in candidates])
         
         # Step 1: Quick validation check
         combined = torch.cat([source_emb, target_emb], dim=-1)
-        raw_score = self.validator(combined).squeeze(-1).item()
-        trace.append(f"Initial validation score: {raw_score:.3f}")
+        raw_scores = self.validator(combined).squeeze(-1).tolist()
         
         # Step 2: Hallucination check
-        hallucination_risk = self.hallucination_detector(combined).squeeze(-1).item()
-        trace.append(f"Hallucination risk: {hallucination_risk:.3f}")
+        hallucination_risks = self.hallucination_detector(combined).squeeze(-1).tolist()
+        
+        results: List[Optional[Tuple[DiscoveryDecision, float, List[str]]]] = [None] * len(candidates)
+        active = []
+        for i, (raw_score, risk) in enumerate(zip(raw_scores, hallucination_risks)):
+            traces[i].append(f"Initial validation score: {raw_score:.3f}")
+            traces[i].append(f"Hallucination risk: {risk:.3f}")
+            if risk > 0.7:
+                traces[i].append("HIGH hallucination risk detected")
+                results[i] = (DiscoveryDecision.REJECT, risk, traces[i])
+            else:
+                active.append(i)
+        
+        if not active:
+            return results
         
-        if hallucination_risk > 0.7:
-            trace.append("HIGH hallucination risk detected")
-            return DiscoveryDecision.REJECT, hallucination_risk, trace
+        # (n_active, 1, 2 * d) reasoning input
+        rows = torch.tensor(active, device=combined.device)
+        reasoning_input = combined[rows].unsqueeze(1)
         
         # Step 3: Chain-of-Thought reasoning (if available)
-        cot_score = raw_score
+        cot_scores = [raw_scores[i] for i in active]
         if chain_of_thought is not None:
             try:
-                # Create input for reasoning
-                reasoning_input = torch.cat([source_emb, target_emb], dim=1)
-                if reasoning_input.dim() == 2:
-                    reasoning_input = reasoning_input.unsqueeze(1)
-                
                 cot_result = chain_of_thought(reasoning_input, mode="chain")
                 
                 if "verification" in cot_result:
-                    cot_score = cot_result["verification"]["valid"].mean().item()
-                    trace.append(f"CoT verification: {cot_score:.3f}")
+                    valid = cot_result["verification"]["valid"]
+                    cot_scores = self._per_candidate(valid, len(active))
+                    for i, score in zip(active, cot_scores):
+                        traces[i].append(f"CoT verification: {score:.3f}")
             except Exception as e:
-                trace.append(f"CoT error: {str(e)[:50]}")
+                for i in active:
+                    traces[i].append(f"CoT error: {str(e)[:50]}")
         
         # Step 4: Metacognitive check (if available)
-        metacog_score = 1.0
+        metacog_scores = [1.0] * len(active)
         if self_model is not None:
             try:
-                meta_input = torch.cat([source_emb, target_emb], dim=1)
-                if meta_input.dim() == 2:
-                    meta_input = meta_input.unsqueeze(1)
-                
-                meta_result = self_model(meta_input)
+                meta_result = self_model(reasoning_input)
                 
                 if "metacognition" in meta_result:
                     metacog = meta_result["metacognition"]
-                    metacog_score = 1.0 - metacog.get("hallucination_risk", torch.tensor(0.0)).mean().item()
-                    trace.append(f"Metacog score: {metacog_score:.3f}")
+                    risk = metacog.get("hallucination_risk", torch.tensor(0.0))
+                    metacog_scores = [1.0 - r for r in self._per_candidate(risk, len(active))]
+                    for i, score in zip(active, metacog_scores):
+                        traces[i].append(f"Metacog score: {score:.3f}")
             except Exception as e:
-                trace.append(f"Metacog error: {str(e)[:50]}")
+                for i in active:
+                    traces[i].append(f"Metacog error: {str(e)[:50]}")
         
-        # Combine scores
-        final_score = (raw_score + cot_score + metacog_score) / 3
-        final_score = final_score * candidate.confidence  # Weight by initial confidence
-        trace.append(f"Final score: {final_score:.3f}")
+        for j, i in enumerate(active):
+            # Combine scores
+            final_score = (raw_scores[i] + cot_scores[j] + metacog_scores[j]) / 3
+            final_score = final_score * candidates[i].confidence  # Weight by initial confidence
+            traces[i].append(f"Final score: {final_score:.3f}")
+            results[i] = (self._decide(final_score, traces[i]), final_score, traces[i])
         
-        # Make decision
+        return results
+    
+    @staticmethod
+    def _per_candidate(values: torch.Tensor, n: int) -> List[float]:
+        """Mean over non-batch dims; a batch-level scalar is shared by all candidates."""
+        values = values.detach()
+        if values.dim() > 0 and values.shape[0] == n:
+            return values.reshape(n, -1).float().mean(dim=-1).tolist()
+        return [values.float().mean().item()] * n
+    
+    def _decide(self, final_score: float, trace: List[str]) -> DiscoveryDecision:
+        """Map a final score to a decision."""
         if final_score >= self.accept_threshold:
             decision = DiscoveryDecision.ACCEPT
             trace.append("Decision: ACCEPT")
@@ -771,7 +969,7 @@ class System2Validation(nn.Module):
             decision = DiscoveryDecision.REJECT
             trace.append("Decision: REJECT")
         
-        return decision, final_score, trace
+        return decision
 
 
 class DiscoveryEngine(nn.Module):
@@ -811,6 +1009,13 @@ class DiscoveryEngine(nn.Module):
         self.discovery_history: List[DiscoveryResult] = []
         self.deferred_candidates: Dict[str, Tuple[DiscoveryCandidate, int]] = {}
         
+        # Node embedding matrix for focus scoring, extended as nodes are added
+        self._focus_ids: List[str] = []
+        self._focus_embeddings: Optional[torch.Tensor] = None
+        self._focus_graph = None
+        self._focus_order = None  # Graph's _node_order list; replaced when it invalidates
+        self._topology_graph = None  # Graph the Watts-Strogatz topology was built from
+        
         # Statistics
         self.stats = {
             "total_cycles": 0,
@@ -863,41 +1068,36 @@ class DiscoveryEngine(nn.Module):
         6. Update rewards and connections
         """
         self.stats["total_cycles"] += 1
-        results = []
-        
-        # Step 1: Process deferred items ready for retry
-        retry_candidates = self._get_deferred_ready()
         
-        for candidate in retry_candidates:
-            result = self._process_candidate(candidate)
-            results.append(result)
+        # Step 1: Process deferred items ready for retry, so accepted
+        # retries are in the graph before focus selection and generation
+        results = self._process_candidates(self._get_deferred_ready())
         
-        # Step 2: Select focus
-        focus_node, focus_emb = self._select_focus(focus_embedding)
+        # Step 2: Select focus node(s)
+        foci = self._select_focus_many(focus_embedding, self.config.focus_top_k)
         
-        if focus_node is None and focus_embedding is not None:
-            focus_node = "query"
-            focus_emb = focus_embedding
+        if not foci and focus_embedding is not None:
+            foci = [("query", focus_embedding)]
         
-        if focus_emb is None:
+        if not foci:
             return results
         
-        # Step 3: System 1 - Generate candidates
-        candidates = self.system1.generate_candidates(
-            focus_node,
-            focus_emb,
-            self.knowledge_graph,
-            self.vector_memory,
-            self.curiosity,
-            self.config.max_candidates_per_cycle
-        )
+        # Step 3: System 1 - Generate candidates for every focus
+        candidates = []
+        for focus_node, focus_emb in foci:
+            candidates.extend(self.system1.generate_candidates(
+                focus_node,
+                focus_emb,
+                self.knowledge_graph,
+                self.vector_memory,
+                self.curiosity,
+                self.config.max_candidates_per_cycle
+            ))
         
         self.stats["total_candidates"] += len(candidates)
         
-        # Step 4 & 5: Process each candidate
-        for candidate in candidates:
-            result = self._process_candidate(candidate)
-            results.append(result)
+        # Step 4 & 5: Validate new candidates in one batch
+        results.extend(self._process_candidates(candidates))
         
         # Step 6: Optimize topology
         self._optimize_topology()
@@ -913,63 +1113,127 @@ class DiscoveryEngine(nn.Module):
         
         Uses curiosity weights (RPE) to select interesting nodes.
         """
-        if self.knowledge_graph is None or not self.knowledge_graph.nodes:
+        foci = self._select_focus_many(query_embedding, 1)
+        if not foci:
             return None, query_embedding
+        return foci[0]
+    
+    def _select_focus_many(
+        self,
+        query_embedding: Optional[torch.Tensor],
+        k: int = 1
+    ) -> List[Tuple[str, torch.Tensor]]:
+        """
+        Select up to k focus nodes.
         
-        # Get nodes with high curiosity (if curiosity module available)
-        nodes = list(self.knowledge_graph.nodes.values())
-        
-        if self.curiosity is not None:
-            # Score nodes by curiosity
-            scored_nodes = []
-            for node in nodes:
-                emb = torch.tensor(node.embedding)
-                try:
-                    curiosity_result = self.curiosity(emb.unsqueeze(0).unsqueeze(0))
-                    score = curiosity_result["combined_curiosity"].mean().item()
-                except:
-                    score = node.importance
-                
-                scored_nodes.append((node, score))
-            
-            scored_nodes.sort(key=lambda x: -x[1])
-            
-            if scored_nodes:
-                focus = scored_nodes[0][0]
-                return focus.id, torch.tensor(focus.embedding)
+        All (or focus_sample_size sampled) node embeddings are scored by
+        curiosity in batched forward passes over a cached embedding matrix.
+        If curiosity cannot score them, the most important nodes are taken;
+        without a curiosity module, nodes are drawn weighted by importance.
+        """
+        if self.knowledge_graph is None or not self.knowledge_graph.nodes:
+            return []
         
-        # Fallback: random selection weighted by importance
-        if nodes:
-            weights = [n.importance for n in nodes]
-            weights = np.array(weights) / sum(weights)
-            selected = np.random.choice(nodes, p=weights)
-            return selected.id, torch.tensor(selected.embedding)
+        ids, embeddings = self._node_embedding_matrix()
+        rows = np.arange(len(ids))
+        sample_size = self.config.focus_sample_size
+        if 0 < sample_size < len(rows):
+            rows = np.sort(np.random.choice(rows, sample_size, replace=False))
+        k = min(k, len(rows))
         
-        return None, None
+        if self.curiosity is not None:
+            scores = self._curiosity_scores(embeddings[torch.from_numpy(rows)])
+            if scores is None:
+                # Curiosity cannot score these embeddings; rank by importance instead
+                nodes = self.knowledge_graph.nodes
+                scores = torch.tensor([nodes[ids[i]].importance for i in rows], dtype=torch.float32)
+            top = torch.topk(scores, k).indices.numpy()
+            chosen = rows[top]
+        else:
+            # No curiosity module: random selection weighted by importance
+            nodes = self.knowledge_graph.nodes
+            weights = np.array([nodes[ids[i]].importance for i in rows], dtype=np.float64)
+            if weights.sum() > 0:
+                # Without replacement, only nodes with nonzero weight can be drawn
+                k = min(k, np.count_nonzero(weights))
+                weights = weights / weights.sum()
+            else:
+                weights = None
+            chosen = np.random.choice(rows, k, replace=False, p=weights)
+        
+        return [(ids[i], embeddings[i].clone()) for i in chosen]
+    
+    def _node_embedding_matrix(self) -> Tuple[List[str], torch.Tensor]:
+        """
+        (node ids, (num_nodes, d) embeddings), appending only nodes added
+        since the last call. Rebuilt when the graph invalidates its tensors
+        (e.g. a node was replaced), which swaps out its _node_order list.
+        """
+        nodes = self.knowledge_graph.nodes
+        order = getattr(self.knowledge_graph, "_node_order", None)
+        if self._focus_graph is not self.knowledge_graph or self._focus_order is not order \
+                or len(self._focus_ids) > len(nodes):
+            self._focus_graph = self.knowledge_graph
+            self._focus_order = order
+            self._focus_ids = []
+            self._focus_embeddings = None
+        
+        if len(self._focus_ids) < len(nodes):
+            new_nodes = list(nodes.values())[len(self._focus_ids):]
+            new_rows = torch.tensor(np.stack([n.embedding for n in new_nodes]), dtype=torch.float32)
+            self._focus_embeddings = new_rows if self._focus_embeddings is None \
+                else torch.cat([self._focus_embeddings, new_rows])
+            self._focus_ids.extend(n.id for n in new_nodes)
+        
+        return self._focus_ids, self._focus_embeddings
+    
+    @torch.no_grad()
+    def _curiosity_scores(self, embeddings: torch.Tensor) -> Optional[torch.Tensor]:
+        """Combined curiosity per row, or None if the module cannot score these embeddings."""
+        expected = getattr(getattr(self.curiosity, "config", None), "d_model", embeddings.shape[-1])
+        if expected != embeddings.shape[-1]:
+            return None
+        
+        device = next(self.curiosity.parameters()).device
+        scores = []
+        for chunk in embeddings.split(self.config.focus_batch_size):
+            result = self.curiosity(chunk.to(device).unsqueeze(1))
+            scores.append(result["combined_curiosity"].reshape(len(chunk), -1).mean(dim=-1).cpu())
+        return torch.cat(scores)
     
     def _process_candidate(self, candidate: DiscoveryCandidate) -> DiscoveryResult:
         """Process a single candidate through validation and decision."""
+        return self._process_candidates([candidate])[0]
+    
+    def _process_candidates(self, candidates: List[DiscoveryCandidate]) -> List[DiscoveryResult]:
+        """Validate candidates as one batch, then apply each decision in order."""
+        if not candidates:
+            return []
+        
         # System 2 validation
-        decision, score, trace = self.system2.validate(
-            candidate,
+        validations = self.system2.validate_batch(
+            candidates,
             self.chain_of_thought,
             self.self_model
         )
         
-        result = DiscoveryResult(
-            candidate=candidate,
-            decision=decision,
-            validation_score=score,
-            reasoning_trace=trace
-        )
-        
-        # Apply decision
-        self._apply_decision(result)
-        
-        # Record
-        self.discovery_history.append(result)
+        results = []
+        for candidate, (decision, score, trace) in zip(candidates, validations):
+            result = DiscoveryResult(
+                candidate=candidate,
+                decision=decision,
+                validation_score=score,
+                reasoning_trace=trace
+            )
+            
+            # Apply decision
+            self._apply_decision(result)
+            
+            # Record
+            self.discovery_history.append(result)
+            results.append(result)
         
-        return result
+        return results
     
     def _apply_decision(self, result: DiscoveryResult):
         """Apply the discovery decision."""
@@ -1044,14 +1308,16 @@ class DiscoveryEngine(nn.Module):
         if self.knowledge_graph is None:
             return
         
-        # Build adjacency for analysis
-        adjacency = defaultdict(list)
-        for edge in self.knowledge_graph.edges:
-            adjacency[edge.source_id].append(edge.target_id)
+        # Fold new edges into the sparse adjacency, rebuilt for a different graph
+        if self._topology_graph is not self.knowledge_graph:
+            self._topology_graph = self.knowledge_graph
+            self.watts_strogatz.topology = SparseTopology()
+        topology = self.watts_strogatz.topology
+        topology.sync_edges(self.knowledge_graph.edges)
         
         # Measure current properties
-        clustering = self.watts_strogatz.compute_clustering_coefficient(adjacency)
-        path_length = self.watts_strogatz.estimate_path_length(adjacency)
+        clustering = self.watts_strogatz.compute_clustering_coefficient(topology)
+        path_length = self.watts_strogatz.estimate_path_length(topology)
         
         self.watts_strogatz.clustering_history.append(clustering)
         self.watts_strogatz.path_length_history.append(path_length)
@@ -1059,7 +1325,9 @@ class DiscoveryEngine(nn.Module):
         # Check if rewiring needed
         should_rewire, reason = self.watts_strogatz.should_rewire(clustering, path_length)
         
-        if should_rewire and len(adjacency) > 10:
+        if should_rewire and len(topology) > 10:
+            adjacency = topology.to_adjacency()
+            
             # Get node embeddings
             node_embs = {}
             for node_id, node in self.knowledge_graph.nodes.items():
@@ -9,15 +9,18 @@ Designed for AGI-scale robustness:
 - Prevention of re-evaluation (no wasted computation)
 - Statistical analysis for meta-learning
 - Safe concurrent access
+- Pooled per-thread connections and batched (write-behind) inserts
+- In-memory pair filter so lookups of novel pairs skip SQLite
 
 Biological analog: Hippocampal memory consolidation
 """
 import sqlite3
 import json
 import time
+import weakref
 import threading
 from pathlib import Path
-from typing import Optional, Dict, Any, List, Tuple
+from typing import Optional, Dict, Any, List, Tuple, Iterable, Set
 from dataclasses import dataclass, asdict
 from enum import Enum
 from contextlib import contextmanager
@@ -90,41 +93,135 @@ class DiscoveryJournal:
     - Statistical queries for meta-learning
     - Thread-safe access
     - Automatic schema migration
+    
+    Each thread keeps one long-lived connection (statements are cached
+    per connection by sqlite3). log_discovery queues rows and commits
+    them in batches; every read applies queued rows first, so reads
+    always see earlier writes.
+    
+    A hashed set of (source, target) pairs per decision is warmed from
+    the database and updated on every write. A lookup that misses the
+    set is answered without touching disk; a hit is confirmed by query.
+    Rows written by other processes after startup are not in the set.
     """
     
     SCHEMA_VERSION = 1
     
-    def __init__(self, db_path: Optional[Path] = None):
+    INSERT_SQL = """
+        INSERT INTO discoveries (
+            id, timestamp, source_node, target_node, decision,
+            confidence, validation_score, reasoning_trace,
+            discovery_source, relation_type, retry_count,
+            final_outcome, refinement_hint, metadata
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    
+    def __init__(
+        self,
+        db_path: Optional[Path] = None,
+        write_batch_size: int = 64,
+        flush_interval: float = 1.0
+    ):
         """
         Initialize the journal.
         
         Args:
             db_path: Path to SQLite database. If None, uses default location.
+            write_batch_size: Queued log_discovery rows that trigger a commit
+            flush_interval: Max seconds a queued row waits before the next write commits it
         """
         if db_path is None:
             db_path = Path("./silhouette_discovery.db")
         
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.write_batch_size = write_batch_size
+        self.flush_interval = flush_interval
         
         self._lock = threading.RLock()
         
+        # Connection pool: one connection per thread
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        
+        # Write-behind queue
+        self._pending: List[Tuple] = []
+        self._pending_since = 0.0
+        self._id_ms = 0
+        self._ids_this_ms: Set[str] = set()
+        
         self._init_database()
+        
+        # Pair filter: decision -> hashes of (source, target)
+        self._pair_filter: Dict[str, Set[int]] = {d.value: set() for d in DiscoveryDecision}
+        self._known_pairs: Set[int] = set()
+        self._warm_pair_filter()
+        
+        # Queued rows still reach the database on interpreter exit, or if
+        # the journal is garbage-collected without close()
+        weakref.finalize(self, _close_journal, self.db_path, self._lock, self._pending, self._connections)
+    
+    def _connection(self) -> sqlite3.Connection:
+        """This thread's pooled connection (opened on first use)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Access is serialized by self._lock, so close() may run on any thread
+            conn = sqlite3.connect(
+                str(self.db_path), timeout=30.0, check_same_thread=False, cached_statements=256
+            )
+            conn.execute("PRAGMA journal_mode=WAL")  # Better concurrency
+            conn.execute("PRAGMA synchronous=NORMAL")  # Good balance of safety/speed
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
     
     @contextmanager
     def _get_connection(self):
-        """Thread-safe connection context manager."""
-        conn = sqlite3.connect(str(self.db_path), timeout=30.0)
-        conn.execute("PRAGMA journal_mode=WAL")  # Better concurrency
-        conn.execute("PRAGMA synchronous=NORMAL")  # Good balance of safety/speed
-        try:
-            yield conn
-            conn.commit()
-        except Exception:
-            conn.rollback()
-            raise
-        finally:
-            conn.close()
+        """
+        Transaction on this thread's pooled connection. Queued writes are
+        committed first in their own transaction, so a failing read cannot
+        roll them back.
+        """
+        with self._lock:
+            conn = self._connection()
+            _commit_rows(conn, self._pending)
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    
+    def _warm_pair_filter(self):
+        """Load every recorded (source, target, decision) into the pair filter."""
+        with self._lock:
+            with self._get_connection() as conn:
+                cursor = conn.execute(
+                    "SELECT DISTINCT source_node, target_node, decision FROM discoveries"
+                )
+                for source, target, decision in cursor:
+                    self._remember_pair(source, target, decision)
+    
+    def _remember_pair(self, source_node: str, target_node: str, decision: str):
+        key = hash((source_node, target_node))
+        self._pair_filter.setdefault(decision, set()).add(key)
+        self._known_pairs.add(key)
+    
+    def _maybe_recorded(self, source_node: str, target_node: str, decision: str) -> bool:
+        """False means the pair was certainly never recorded with decision."""
+        return hash((source_node, target_node)) in self._pair_filter.get(decision, ())
+    
+    def flush(self):
+        """Commit all queued log_discovery rows."""
+        with self._lock:
+            _commit_rows(self._connection(), self._pending)
+    
+    def close(self):
+        """Flush queued rows and close every pooled connection."""
+        with self._lock:
+            _close_journal(self.db_path, self._lock, self._pending, self._connections)
+            self._local = threading.local()
     
     def _init_database(self):
         """Initialize database schema."""
@@ -201,9 +298,11 @@ class DiscoveryJournal:
         """
         Log a discovery decision.
         
+        The row is queued and committed with the next batch.
+        
         Returns the entry ID.
         """
-        entry_id = f"disc_{int(time.time() * 1000)}_{source_node[:8]}_{target_node[:8]}"
+        entry_id = self._new_entry_id(source_node, target_node)
         
         entry = DiscoveryEntry(
             id=entry_id,
@@ -220,31 +319,51 @@ class DiscoveryJournal:
         )
         
         with self._lock:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO discoveries (
-                        id, timestamp, source_node, target_node, decision,
-                        confidence, validation_score, reasoning_trace,
-                        discovery_source, relation_type, retry_count,
-                        final_outcome, refinement_hint, metadata
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    entry.id, entry.timestamp, entry.source_node, entry.target_node,
-                    entry.decision, entry.confidence, entry.validation_score,
-                    entry.reasoning_trace, entry.discovery_source, entry.relation_type,
-                    entry.retry_count, entry.final_outcome, entry.refinement_hint,
-                    entry.metadata
-                ))
+            self._remember_pair(source_node, target_node, entry.decision)
+            if not self._pending:
+                self._pending_since = time.time()
+            self._pending.append((
+                entry.id, entry.timestamp, entry.source_node, entry.target_node,
+                entry.decision, entry.confidence, entry.validation_score,
+                entry.reasoning_trace, entry.discovery_source, entry.relation_type,
+                entry.retry_count, entry.final_outcome, entry.refinement_hint,
+                entry.metadata
+            ))
+            
+            if len(self._pending) >= self.write_batch_size or \
+                    time.time() - self._pending_since >= self.flush_interval:
+                self.flush()
         
         return entry_id
     
+    def _new_entry_id(self, source_node: str, target_node: str) -> str:
+        """Timestamped entry id, suffixed if already issued this millisecond."""
+        with self._lock:
+            # Read the clock under the lock (and never step back) so two
+            # threads cannot pair a stale millisecond with a reset id set
+            ms = max(int(time.time() * 1000), self._id_ms)
+            if ms != self._id_ms:
+                self._id_ms = ms
+                self._ids_this_ms = set()
+            
+            base = f"disc_{ms}_{source_node[:8]}_{target_node[:8]}"
+            entry_id = base
+            n = 1
+            while entry_id in self._ids_this_ms:
+                entry_id = f"{base}_{n}"
+                n += 1
+            self._ids_this_ms.add(entry_id)
+        return entry_id
+    
     def was_rejected(self, source_node: str, target_node: str) -> bool:
         """
         Check if a connection was previously rejected.
         
         Prevents wasted computation on known-bad candidates.
         """
+        if not self._maybe_recorded(source_node, target_node, DiscoveryDecision.REJECT.value):
+            return False
+        
         with self._lock:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
@@ -261,6 +380,9 @@ class DiscoveryJournal:
         
         Prevents duplicate processing.
         """
+        if not self._maybe_recorded(source_node, target_node, DiscoveryDecision.ACCEPT.value):
+            return False
+        
         with self._lock:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
@@ -271,6 +393,56 @@ class DiscoveryJournal:
                 
                 return cursor.fetchone()[0] > 0
     
+    def get_decisions_many(
+        self,
+        pairs: Iterable[Tuple[str, str]]
+    ) -> Dict[Tuple[str, str], Set[str]]:
+        """
+        Recorded decisions for many (source, target) pairs in one query.
+        
+        Returns a mapping from each pair with at least one entry to the
+        set of its decision values.
+        """
+        pairs = [
+            pair for pair in dict.fromkeys(map(tuple, pairs))
+            if hash(pair) in self._known_pairs
+        ]
+        if not pairs:
+            return {}
+        
+        with self._lock:
+            with self._get_connection() as conn:
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS lookup_pairs (source_node TEXT, target_node TEXT)")
+                conn.execute("DELETE FROM lookup_pairs")
+                conn.executemany("INSERT INTO lookup_pairs VALUES (?, ?)", pairs)
+                cursor = conn.execute("""
+                    SELECT DISTINCT d.source_node, d.target_node, d.decision
+                    FROM lookup_pairs p
+                    JOIN discoveries d
+                      ON d.source_node = p.source_node AND d.target_node = p.target_node
+                """)
+                
+                decisions: Dict[Tuple[str, str], Set[str]] = {}
+                for source, target, decision in cursor.fetchall():
+                    decisions.setdefault((source, target), set()).add(decision)
+                conn.execute("DELETE FROM lookup_pairs")
+                return decisions
+    
+    def was_decided_many(
+        self,
+        pairs: Iterable[Tuple[str, str]],
+        decisions: Tuple[DiscoveryDecision, ...] = (DiscoveryDecision.ACCEPT, DiscoveryDecision.REJECT)
+    ) -> List[bool]:
+        """
+        For each (source, target) pair, whether it was recorded with any of decisions.
+        
+        Lets a discovery cycle skip known candidates with a single query.
+        """
+        pairs = list(pairs)
+        wanted = {d.value for d in decisions}
+        found = self.get_decisions_many(pairs)
+        return [bool(found.get(pair, set()) & wanted) for pair in pairs]
+    
     def get_pending_refinements(self, limit: int = 10) -> List[DiscoveryEntry]:
         """
         Get discoveries marked for refinement that haven't been resolved.
@@ -546,6 +718,9 @@ class DiscoveryJournal:
                             entry_dict.get("refinement_hint", ""),
                             entry_dict.get("metadata", "{}")
                         ))
+                        self._remember_pair(
+                            entry_dict["source_node"], entry_dict["target_node"], entry_dict["decision"]
+                        )
                         count += 1
                     except Exception:
                         pass
@@ -553,6 +728,57 @@ class DiscoveryJournal:
         return count
 
 
+def _commit_rows(conn: sqlite3.Connection, pending: List[Tuple]):
+    """
+    Commit queued rows in their own transaction. If the batch violates a
+    constraint, rows are retried one by one and the offending ones are
+    dropped; on any other error the rows stay queued for the next commit.
+    """
+    if not pending:
+        return
+    rows = list(pending)
+    try:
+        conn.executemany(DiscoveryJournal.INSERT_SQL, rows)
+        conn.commit()
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        dropped = 0
+        try:
+            for row in rows:
+                try:
+                    conn.execute(DiscoveryJournal.INSERT_SQL, row)
+                except sqlite3.IntegrityError:
+                    dropped += 1  # A failed statement leaves the transaction open
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"[DiscoveryJournal] Dropped {dropped} queued row(s) violating constraints")
+    except Exception:
+        conn.rollback()
+        raise
+    del pending[:len(rows)]
+
+
+def _close_journal(
+    db_path: Path,
+    lock: threading.RLock,
+    pending: List[Tuple],
+    connections: List[sqlite3.Connection]
+):
+    """Flush queued rows and close pooled connections (also the journal's finalizer)."""
+    with lock:
+        try:
+            if pending:
+                if not connections:
+                    connections.append(sqlite3.connect(str(db_path), timeout=30.0))
+                _commit_rows(connections[0], pending)
+        finally:
+            for conn in connections:
+                conn.close()
+            connections.clear()
+
+
 def create_discovery_journal(db_path: Optional[Path] = None) -> DiscoveryJournal:
     """Factory function."""
     return DiscoveryJournal(db_path)
@@ -584,6 +810,7 @@ if __name__ == "__main__":
         # Test queries
         assert journal.was_accepted("node_a", "node_b")
         assert not journal.was_rejected("node_a", "node_b")
+        assert journal.was_decided_many([("node_a", "node_b"), ("node_b", "node_a")]) == [True, False]
         
         # Test stats
         stats = journal.get_stats()
@@ -596,4 +823,6 @@ if __name__ == "__main__":
         patterns = journal.find_patterns(min_occurrences=1)
         print(f"Patterns: {patterns}")
         
+        journal.close()
+        
         print("\n✅ Discovery Journal test passed!")
@@ -7,9 +7,14 @@ Implements persistent semantic + episodic memory:
 - Consolidation: Converts episodes → semantic knowledge
 - Hybrid Retrieval: Vector + graph search
 """
+import os
 import json
 import time
+import atexit
+import weakref
 import hashlib
+import shutil
+from collections import OrderedDict
 from pathlib import Path
 from typing import Optional, List, Dict, Any, Tuple
 from dataclasses import dataclass, field
@@ -261,21 +266,108 @@ class EpisodicMemory:
     Time-based episodic memory.
     
     Stores specific events with temporal context.
+    
+    Storage is a checkpoint plus an append-only log:
+    - checkpoint-<n>/ (episodes.json, embeddings.npy, episode_ids.json):
+      last checkpoint, made current by rewriting the CHECKPOINT pointer
+    - episodes.log: one JSON line per episode added since the checkpoint
+    - embeddings.log: raw float32 embedding rows referenced by the log
+    
+    Inserts are buffered and appended every flush_every episodes; every
+    checkpoint_every episodes (and after pruning) the checkpoint is
+    rewritten and the logs truncated. Embeddings live in a preallocated
+    buffer that doubles when full, with timestamps and source codes kept
+    in parallel arrays so queries are fully vectorized.
     """
     
+    DECAY_SECONDS = 86400 * 30  # 30-day half-life
+    
+    LOG_FILE = "episodes.log"
+    EMBEDDING_LOG_FILE = "embeddings.log"
+    CHECKPOINT_POINTER = "CHECKPOINT"
+    CHECKPOINT_FILES = ("episodes.json", "embeddings.npy", "episode_ids.json")
+    MAX_CONTEXT_MASKS = 64  # Cached (key, value) filter masks, least recently used evicted
+    
     def __init__(
         self,
         storage_path: Optional[Path] = None,
-        max_episodes: int = 10000
+        max_episodes: int = 10000,
+        flush_every: int = 32,
+        checkpoint_every: int = 1000,
+        prune_fraction: float = 0.1
     ):
         self.episodes: Dict[str, Episode] = {}
-        self.embeddings: Optional[np.ndarray] = None
-        self.episode_ids: List[str] = []
+        self.episode_ids: List[str] = []  # Row i of embeddings belongs to episode_ids[i]
         self.storage_path = storage_path or Path("./memory/episodic")
         self.max_episodes = max_episodes
+        self.flush_every = flush_every
+        self.checkpoint_every = checkpoint_every
+        self.prune_fraction = prune_fraction  # Share removed per prune, so pruning is amortized
         self.storage_path.mkdir(parents=True, exist_ok=True)
         
+        # Amortized-growth embedding buffer and per-row columns
+        self._embedding_buffer: Optional[np.ndarray] = None
+        self._timestamps = np.zeros(0, dtype=np.float64)
+        self._source_codes = np.zeros(0, dtype=np.int32)
+        self._source_vocab: Dict[str, int] = {}
+        self._context_masks: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()  # LRU, extended lazily
+        self._num_rows = 0
+        
+        # Write batching
+        self._pending_lines: List[str] = []
+        self._pending_vectors: List[np.ndarray] = []
+        self._embedding_log_floats = 0  # Floats in embeddings.log incl. pending
+        self._logged_since_checkpoint = 0
+        self._checkpoint_generation = 0
+        
         self._load_from_disk()
+        
+        # Buffered episodes still reach the log on interpreter exit
+        ref = weakref.ref(self)
+        atexit.register(lambda: ref() is not None and ref().flush())
+    
+    @property
+    def embeddings(self) -> Optional[np.ndarray]:
+        """(num_embedded, d_embedding) view of the stored embeddings."""
+        if self._embedding_buffer is None or self._num_rows == 0:
+            return None
+        return self._embedding_buffer[:self._num_rows]
+    
+    def _reserve_rows(self, rows: int, dim: int):
+        """Grow the row buffers (doubling) to hold at least rows rows."""
+        capacity = 0 if self._embedding_buffer is None else len(self._embedding_buffer)
+        if rows <= capacity:
+            return
+        capacity = max(64, 2 * capacity, rows)
+        
+        embeddings = np.zeros((capacity, dim), dtype=np.float32)
+        timestamps = np.zeros(capacity, dtype=np.float64)
+        source_codes = np.zeros(capacity, dtype=np.int32)
+        n = self._num_rows
+        if n:
+            embeddings[:n] = self._embedding_buffer[:n]
+            timestamps[:n] = self._timestamps[:n]
+            source_codes[:n] = self._source_codes[:n]
+        self._embedding_buffer = embeddings
+        self._timestamps = timestamps
+        self._source_codes = source_codes
+    
+    def _source_code(self, source: str) -> int:
+        if source not in self._source_vocab:
+            self._source_vocab[source] = len(self._source_vocab)
+        return self._source_vocab[source]
+    
+    def _append_embedding(self, episode_id: str, embedding: np.ndarray):
+        """Append a row to the embedding buffer (doubling capacity when full)."""
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        self._reserve_rows(self._num_rows + 1, embedding.shape[0])
+        
+        episode = self.episodes[episode_id]
+        self._embedding_buffer[self._num_rows] = embedding
+        self._timestamps[self._num_rows] = episode.timestamp
+        self._source_codes[self._num_rows] = self._source_code(episode.source)
+        self._num_rows += 1
+        self.episode_ids.append(episode_id)
     
     def add_episode(
         self,
@@ -301,52 +393,121 @@ class EpisodicMemory:
         
         # Update embedding index
         if embedding is not None:
-            self.episode_ids.append(episode_id)
-            if self.embeddings is None:
-                self.embeddings = embedding.reshape(1, -1)
-            else:
-                self.embeddings = np.vstack([self.embeddings, embedding])
+            self._append_embedding(episode_id, embedding)
+        
+        self._log_episode(episode)
         
         # Prune old episodes if needed
         if len(self.episodes) > self.max_episodes:
             self._prune_episodes()
+            self.checkpoint()
+        elif self._logged_since_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+        elif len(self._pending_lines) >= self.flush_every:
+            self.flush()
         
-        self._save_to_disk()
         return episode
     
     def query(
         self,
         query_embedding: np.ndarray,
         top_k: int = 5,
-        time_decay: bool = True
+        time_decay: bool = True,
+        source: Optional[str] = None,
+        context: Optional[Dict[str, Any]] = None
     ) -> List[Tuple[Episode, float]]:
-        """Query episodic memory using embedding similarity."""
-        if self.embeddings is None or len(self.episode_ids) == 0:
-            return []
+        """
+        Query episodic memory using embedding similarity.
         
-        # Compute similarities
-        similarities = np.dot(self.embeddings, query_embedding)
+        Args:
+            query_embedding: (d_embedding,) query vector
+            top_k: Number of results
+            time_decay: Weight similarity by exp(-age / 30 days)
+            source: Only return episodes with this source
+            context: Only return episodes whose context has these key/values
+        """
+        return self.query_many(
+            np.asarray(query_embedding)[None], top_k, time_decay, source, context
+        )[0]
+    
+    def query_many(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int = 5,
+        time_decay: bool = True,
+        source: Optional[str] = None,
+        context: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[Episode, float]]]:
+        """Batched query: one result list per row of query_embeddings (n, d_embedding)."""
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        if self.embeddings is None:
+            return [[] for _ in range(len(queries))]
+        
+        n = self._num_rows
+        similarities = queries @ self.embeddings.T  # (num_queries, n)
         
-        # Apply time decay if requested
         if time_decay:
-            current_time = time.time()
-            for i, eid in enumerate(self.episode_ids):
-                if eid in self.episodes:
-                    age = current_time - self.episodes[eid].timestamp
-                    decay = np.exp(-age / (86400 * 30))  # 30-day half-life
-                    similarities[i] *= decay
+            age = time.time() - self._timestamps[:n]
+            similarities *= np.exp(-age / self.DECAY_SECONDS).astype(np.float32)
         
-        # Get top-k
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
+        mask = self._filter_mask(source, context)
+        if mask is not None:
+            similarities[:, ~mask] = -np.inf
         
-        results = []
-        for idx in top_indices:
-            if idx < len(self.episode_ids):
-                eid = self.episode_ids[idx]
-                if eid in self.episodes:
-                    results.append((self.episodes[eid], float(similarities[idx])))
+        available = n if mask is None else int(mask.sum())
+        k = min(top_k, available)
+        if k <= 0:
+            return [[] for _ in range(len(queries))]
         
-        return results
+        # Unordered top-k in O(n), then sort only those k
+        if k < n:
+            top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(n), (len(queries), n))
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        
+        return [
+            [(self.episodes[self.episode_ids[idx]], float(score)) for idx, score in zip(rows, scores)]
+            for rows, scores in zip(top, top_scores)
+        ]
+    
+    def _filter_mask(
+        self,
+        source: Optional[str],
+        context: Optional[Dict[str, Any]]
+    ) -> Optional[np.ndarray]:
+        """Boolean row mask for the source/context filters (None = no filter)."""
+        n = self._num_rows
+        mask = None
+        if source is not None:
+            code = self._source_vocab.get(source)
+            if code is None:
+                return np.zeros(n, dtype=bool)
+            mask = self._source_codes[:n] == code
+        
+        for key, value in (context or {}).items():
+            cache_key = (key, json.dumps(value, sort_keys=True, default=str))
+            cached = self._context_masks.get(cache_key)
+            if cached is None:
+                cached = np.zeros(0, dtype=bool)
+            else:
+                self._context_masks.move_to_end(cache_key)
+            if len(cached) < n:
+                # Extend the cached mask with rows added since it was built
+                extra = np.array([
+                    self.episodes[eid].context.get(key, _MISSING) == value
+                    for eid in self.episode_ids[len(cached):n]
+                ], dtype=bool)
+                cached = np.concatenate([cached, extra])
+                self._context_masks[cache_key] = cached
+                if len(self._context_masks) > self.MAX_CONTEXT_MASKS:
+                    self._context_masks.popitem(last=False)
+            mask = cached[:n] if mask is None else mask & cached[:n]
+        
+        return mask
     
     def get_recent(self, n: int = 10) -> List[Episode]:
         """Get most recent episodes."""
@@ -368,75 +529,215 @@ class EpisodicMemory:
             score = ep.importance * 0.5 + recency * 0.3 + ep.access_count * 0.2
             scored.append((eid, score))
         
-        # Sort by score and keep top max_episodes
+        # Sort by score and keep the best, leaving headroom so the next
+        # prune is prune_fraction * max_episodes inserts away
+        keep_count = max(1, int(self.max_episodes * (1.0 - self.prune_fraction)))
         scored.sort(key=lambda x: x[1], reverse=True)
-        keep_ids = set(eid for eid, _ in scored[:self.max_episodes])
+        keep_ids = set(eid for eid, _ in scored[:keep_count])
         
         # Remove pruned episodes
         self.episodes = {eid: ep for eid, ep in self.episodes.items() if eid in keep_ids}
         
-        # Rebuild embedding index
-        new_embeddings = []
-        new_ids = []
-        for eid in self.episode_ids:
-            if eid in keep_ids and eid in self.episodes and self.episodes[eid].embedding is not None:
-                new_ids.append(eid)
-        
-        self.episode_ids = new_ids
-        # Note: Full embedding rebuild would happen here
+        # Compact the embedding index in one pass
+        keep_rows = np.array([eid in keep_ids for eid in self.episode_ids], dtype=bool)
+        self.episode_ids = [eid for eid, keep in zip(self.episode_ids, keep_rows) if keep]
+        if self._num_rows:
+            n = self._num_rows
+            kept = int(keep_rows.sum())
+            self._embedding_buffer[:kept] = self._embedding_buffer[:n][keep_rows]
+            self._timestamps[:kept] = self._timestamps[:n][keep_rows]
+            self._source_codes[:kept] = self._source_codes[:n][keep_rows]
+            self._num_rows = kept
+        self._context_masks.clear()
+    
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    
+    @staticmethod
+    def _episode_record(ep: Episode) -> Dict[str, Any]:
+        return {
+            "content": ep.content,
+            "context": ep.context,
+            "importance": ep.importance,
+            "timestamp": ep.timestamp,
+            "source": ep.source,
+            "access_count": ep.access_count
+        }
+    
+    def _log_episode(self, episode: Episode):
+        """Queue an append-only log record for a new episode."""
+        record = {"id": episode.id, **self._episode_record(episode)}
+        if episode.embedding is not None:
+            vector = np.asarray(episode.embedding, dtype=np.float32).reshape(-1)
+            record["embedding_offset"] = self._embedding_log_floats
+            record["embedding_dim"] = int(vector.shape[0])
+            self._pending_vectors.append(vector)
+            self._embedding_log_floats += vector.shape[0]
+        
+        self._pending_lines.append(json.dumps(record) + "\n")
+        self._logged_since_checkpoint += 1
+    
+    def flush(self):
+        """Append buffered episodes to the logs (embeddings first)."""
+        if not self._pending_lines:
+            return
+        if self._pending_vectors:
+            with open(self.storage_path / self.EMBEDDING_LOG_FILE, "ab") as f:
+                f.write(np.concatenate(self._pending_vectors).tobytes())
+        with open(self.storage_path / self.LOG_FILE, "a") as f:
+            f.write("".join(self._pending_lines))
+        self._pending_lines = []
+        self._pending_vectors = []
+    
+    def checkpoint(self):
+        """Rewrite the checkpoint files and truncate the logs."""
+        self._save_to_disk()
+        for name in (self.LOG_FILE, self.EMBEDDING_LOG_FILE):
+            (self.storage_path / name).unlink(missing_ok=True)
+        self._pending_lines = []
+        self._pending_vectors = []
+        self._embedding_log_floats = 0
+        self._logged_since_checkpoint = 0
+    
+    def close(self):
+        """Flush pending writes."""
+        self.flush()
     
     def _save_to_disk(self):
-        """Persist episodic memory to disk."""
-        data = {
-            eid: {
-                "content": ep.content,
-                "context": ep.context,
-                "importance": ep.importance,
-                "timestamp": ep.timestamp,
-                "source": ep.source,
-                "access_count": ep.access_count
-            }
-            for eid, ep in self.episodes.items()
-        }
+        """
+        Persist episodic memory to disk (checkpoint).
         
-        with open(self.storage_path / "episodes.json", "w") as f:
-            json.dump(data, f, indent=2)
+        All files go into a fresh checkpoint-<n> directory, which only
+        becomes current when the CHECKPOINT pointer is atomically replaced,
+        so a crash never leaves episodes and embeddings from different saves.
+        """
+        data = {eid: self._episode_record(ep) for eid, ep in self.episodes.items()}
+        
+        generation = self._checkpoint_generation + 1
+        name = f"checkpoint-{generation:08d}"
+        directory = self.storage_path / name
+        shutil.rmtree(directory, ignore_errors=True)  # Leftover from an interrupted save
+        directory.mkdir()
+        
+        _atomic_write(directory / "episodes.json", json.dumps(data).encode())
         
         # Save embeddings separately
         if self.embeddings is not None:
-            np.save(self.storage_path / "embeddings.npy", self.embeddings)
-            with open(self.storage_path / "episode_ids.json", "w") as f:
-                json.dump(self.episode_ids, f)
+            with open(directory / "embeddings.npy", "wb") as f:
+                np.save(f, self.embeddings)
+                f.flush()
+                os.fsync(f.fileno())
+            _atomic_write(directory / "episode_ids.json", json.dumps(self.episode_ids).encode())
+        
+        _atomic_write(self.storage_path / self.CHECKPOINT_POINTER, name.encode())
+        self._checkpoint_generation = generation
+        
+        # Older checkpoints and the pre-directory layout are now unreachable
+        for stale in self.storage_path.glob("checkpoint-*"):
+            if stale.name != name:
+                shutil.rmtree(stale, ignore_errors=True)
+        for legacy in self.CHECKPOINT_FILES:
+            (self.storage_path / legacy).unlink(missing_ok=True)
+    
+    def _checkpoint_dir(self) -> Path:
+        """Directory of the current checkpoint (storage_path for the flat legacy layout)."""
+        pointer = self.storage_path / self.CHECKPOINT_POINTER
+        if not pointer.exists():
+            return self.storage_path
+        name = pointer.read_text().strip()
+        self._checkpoint_generation = int(name.rsplit("-", 1)[1])
+        return self.storage_path / name
     
     def _load_from_disk(self):
-        """Load episodic memory from disk."""
-        episodes_file = self.storage_path / "episodes.json"
-        if not episodes_file.exists():
-            return
-        
-        with open(episodes_file, "r") as f:
-            data = json.load(f)
-        
-        for eid, edata in data.items():
-            self.episodes[eid] = Episode(
-                id=eid,
-                content=edata["content"],
-                context=edata.get("context", {}),
-                importance=edata.get("importance", 0.5),
-                timestamp=edata.get("timestamp", time.time()),
-                source=edata.get("source", "loaded"),
-                access_count=edata.get("access_count", 0)
-            )
-        
-        # Load embeddings
-        embeddings_file = self.storage_path / "embeddings.npy"
-        if embeddings_file.exists():
-            self.embeddings = np.load(embeddings_file)
+        """Load episodic memory from disk: checkpoint, then log replay."""
+        directory = self._checkpoint_dir()
+        episodes_file = directory / "episodes.json"
+        if episodes_file.exists():
+            with open(episodes_file, "r") as f:
+                data = json.load(f)
+            
+            for eid, edata in data.items():
+                self.episodes[eid] = self._episode_from_record(eid, edata)
             
-            ids_file = self.storage_path / "episode_ids.json"
-            if ids_file.exists():
+            # Load embeddings
+            embeddings_file = directory / "embeddings.npy"
+            ids_file = directory / "episode_ids.json"
+            if embeddings_file.exists() and ids_file.exists():
+                embeddings = np.load(embeddings_file).astype(np.float32)
                 with open(ids_file, "r") as f:
-                    self.episode_ids = json.load(f)
+                    episode_ids = json.load(f)
+                self._reserve_rows(2 * len(embeddings), embeddings.shape[1])
+                for eid, embedding in zip(episode_ids, embeddings):
+                    if eid in self.episodes:
+                        self._append_embedding(eid, embedding)
+        
+        self._replay_log()
+    
+    @staticmethod
+    def _episode_from_record(eid: str, edata: Dict[str, Any]) -> Episode:
+        return Episode(
+            id=eid,
+            content=edata["content"],
+            context=edata.get("context", {}),
+            importance=edata.get("importance", 0.5),
+            timestamp=edata.get("timestamp", time.time()),
+            source=edata.get("source", "loaded"),
+            access_count=edata.get("access_count", 0)
+        )
+    
+    def _replay_log(self):
+        """Apply episodes logged after the checkpoint."""
+        log_file = self.storage_path / self.LOG_FILE
+        if not log_file.exists():
+            return
+        
+        embedding_file = self.storage_path / self.EMBEDDING_LOG_FILE
+        raw = np.zeros(0, dtype=np.float32)
+        if embedding_file.exists():
+            raw = np.fromfile(embedding_file, dtype=np.float32)
+            if embedding_file.stat().st_size != raw.nbytes:
+                os.truncate(embedding_file, raw.nbytes)  # Drop a torn row
+        self._embedding_log_floats = len(raw)
+        
+        valid_bytes = 0
+        with open(log_file, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                valid_bytes += len(line)
+                self._logged_since_checkpoint += 1
+                
+                eid = record.pop("id")
+                if eid in self.episodes:
+                    continue  # Already in the checkpoint
+                self.episodes[eid] = self._episode_from_record(eid, record)
+                
+                offset = record.get("embedding_offset")
+                if offset is not None:
+                    dim = record["embedding_dim"]
+                    if offset + dim <= len(raw):
+                        self._append_embedding(eid, raw[offset:offset + dim])
+        
+        if log_file.stat().st_size != valid_bytes:
+            os.truncate(log_file, valid_bytes)  # Drop a torn final record
+
+
+_MISSING = object()
+
+
+def _atomic_write(path: Path, data: bytes):
+    """Write a file through a synced temporary and an atomic rename."""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
 
 
 class MemoryConsolidation:
@@ -633,6 +934,10 @@ class EternalMemory:
         """Run memory consolidation (episodic → semantic)."""
         self.consolidation.consolidate()
     
+    def close(self):
+        """Flush buffered episodic writes."""
+        self.episodic.close()
+    
     def get_stats(self) -> Dict:
         """Get memory statistics."""
         return {
@@ -0,0 +1,503 @@
+"""
+NANOSILHOUETTE - HNSW On-Disk Format
+====================================
+Binary, memory-mappable storage for HNSWIndex:
+- Two header copies (magic, version, shapes, counts, CRC32 checksums,
+  generation); the newest valid one is current
+- Page-aligned blocks (vectors, levels, tombstones, neighbor lists),
+  sized for the index capacity so new rows are written in place
+- Two graph slots; generation g uses slot g % 2
+- JSON-lines metadata sidecar with a row offset table, parsed lazily
+
+Opening an index maps the blocks with np.memmap instead of reading
+them, so startup cost does not grow with the number of memories.
+Saving to the path an index was loaded from (or last saved to) only
+appends the new vectors and metadata rows and rewrites the graph
+blocks; anything else (compaction, capacity growth, another path)
+rewrites both files atomically.
+
+An append only writes past the current row count (vectors, offsets,
+sidecar), rewrites the graph into the slot the current header does not
+use, fsyncs, and then publishes it by overwriting the older header copy
+with generation + 1. A crash at any point leaves the previous
+generation intact, and read-only readers keep a consistent view until
+the next append after that (reopen to pick up new rows).
+
+Layout:
+    [header copies: 2 x 2048 bytes]
+    vectors          float32 (capacity, d_embedding)
+    levels           int8    (capacity,)              \
+    deleted          bool    (capacity,)               |
+    upper_row        int32   (capacity,)               |
+    counts0          int32   (capacity,)               | graph slot 0
+    neighbors0       int32   (capacity, 2*M)           |
+    upper_counts     int32   (upper_capacity, max_levels)
+    upper_neighbors  int32   (upper_capacity, max_levels, M)
+    meta_offsets     uint64  (capacity + 1,)
+    levels.1 ... upper_neighbors.1                       graph slot 1
+
+Version 1 files (one header, one graph slot) are still read; saving
+rewrites them as version 2.
+"""
+import os
+import json
+import mmap
+import struct
+import zlib
+import numpy as np
+from pathlib import Path
+from typing import Optional, List, Dict, Any
+
+
+MAGIC = b"SILHNSW\x00"
+FORMAT_VERSION = 2
+HEADER_SIZE = 4096
+HEADER_SLOT_SIZE = 2048
+BLOCK_ALIGN = 4096
+
+# magic, version, d_embedding, M, max_levels, capacity, upper_capacity,
+# count, num_upper, num_deleted, entry_point, max_level,
+# crc_vectors, crc_graph, crc_meta, meta_bytes, generation
+_HEADER_FIELDS_V1 = (
+    "magic", "version", "d_embedding", "M", "max_levels", "capacity",
+    "upper_capacity", "count", "num_upper", "num_deleted", "entry_point",
+    "max_level", "crc_vectors", "crc_graph", "crc_meta", "meta_bytes"
+)
+_HEADER_FIELDS = _HEADER_FIELDS_V1 + ("generation",)
+_HEADER_V1 = struct.Struct("<8sIIIIQQQQQqiIIIQ")
+_HEADER = struct.Struct("<8sIIIIQQQQQqiIIIQQ")
+_HEADER_CRC = struct.Struct("<I")
+
+GRAPH_BLOCKS = (
+    "levels", "deleted", "upper_row", "counts0", "neighbors0", "upper_counts", "upper_neighbors"
+)
+
+
+class StorageFormatError(ValueError):
+    """Raised when an index file is not a valid (or supported) HNSW file."""
+
+
+def is_index_file(path: Path) -> bool:
+    """Whether path starts with the binary index magic."""
+    try:
+        with open(path, "rb") as f:
+            raw = f.read(HEADER_SIZE)
+    except OSError:
+        return False
+    return raw[:len(MAGIC)] == MAGIC or raw[HEADER_SLOT_SIZE:HEADER_SLOT_SIZE + len(MAGIC)] == MAGIC
+
+
+def metadata_path(path: Path) -> Path:
+    """Sidecar holding the JSON-lines metadata of an index file."""
+    path = Path(path)
+    return path.with_name(path.name + ".meta")
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def _encode_metadata(rows) -> List[bytes]:
+    return [json.dumps(row, default=_json_default).encode("utf-8") + b"\n" for row in rows]
+
+
+class MetadataSidecar:
+    """
+    List-like view over a JSON-lines metadata file.
+
+    Stored rows are parsed on first access (and cached); rows appended
+    after loading stay in memory until the next save.
+    """
+
+    def __init__(self, path: Path, offsets: np.ndarray):
+        self.path = Path(path)
+        self._offsets = offsets  # (num_stored + 1,) byte offsets
+        self._num_stored = len(offsets) - 1
+        self._cache: Dict[int, Dict] = {}
+        self._appended: List[Dict] = []
+
+        self._file = None
+        self._map = None
+        if self._num_stored > 0:
+            self._file = open(self.path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return self._num_stored + len(self._appended)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError("metadata index out of range")
+        if idx >= self._num_stored:
+            return self._appended[idx - self._num_stored]
+        row = self._cache.get(idx)
+        if row is None:
+            start, end = int(self._offsets[idx]), int(self._offsets[idx + 1])
+            row = json.loads(self._map[start:end])
+            self._cache[idx] = row
+        return row
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def append(self, row: Dict):
+        self._appended.append(row)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
+
+
+def _graph_block(name: str, slot: int) -> str:
+    return name if slot == 0 else f"{name}.{slot}"
+
+
+def _graph_slot(header: Dict[str, Any]) -> int:
+    """Graph slot used by a header's generation."""
+    return header["generation"] % 2
+
+
+def _layout(
+    d_embedding: int,
+    M: int,
+    max_levels: int,
+    capacity: int,
+    upper_capacity: int,
+    graph_slots: int = 2
+):
+    """Block name -> (offset, dtype, shape), plus the total file size."""
+    graph = [
+        ("levels", np.int8, (capacity,)),
+        ("deleted", np.bool_, (capacity,)),
+        ("upper_row", np.int32, (capacity,)),
+        ("counts0", np.int32, (capacity,)),
+        ("neighbors0", np.int32, (capacity, 2 * M)),
+        ("upper_counts", np.int32, (upper_capacity, max_levels)),
+        ("upper_neighbors", np.int32, (upper_capacity, max_levels, M)),
+    ]
+    # Slot 0 sits where version 1 files keep their only graph
+    blocks = [("vectors", np.float32, (capacity, d_embedding))] + graph
+    blocks.append(("meta_offsets", np.uint64, (capacity + 1,)))
+    for slot in range(1, graph_slots):
+        blocks += [(_graph_block(name, slot), dtype, shape) for name, dtype, shape in graph]
+    layout = {}
+    offset = HEADER_SIZE
+    for name, dtype, shape in blocks:
+        layout[name] = (offset, np.dtype(dtype), shape)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        offset += -(-size // BLOCK_ALIGN) * BLOCK_ALIGN
+    return layout, offset
+
+
+def _graph_arrays(index, full: bool = False) -> List[np.ndarray]:
+    """Graph blocks in GRAPH_BLOCKS order (used rows, or whole arrays with full)."""
+    n, num_upper = (None, None) if full else (index._count, index._num_upper)
+    return [
+        index._levels[:n], index._deleted[:n], index._upper_row[:n],
+        index._counts0[:n], index._neighbors0[:n],
+        index._upper_counts[:num_upper], index._upper_neighbors[:num_upper]
+    ]
+
+
+def _crc(arrays, crc: int = 0) -> int:
+    for array in arrays:
+        crc = zlib.crc32(np.ascontiguousarray(array).reshape(-1).view(np.uint8), crc)
+    return crc
+
+
+def read_header(path: Path) -> Dict[str, Any]:
+    """
+    Read and validate the current header of an index file: the header
+    copy with the highest generation whose checksum matches.
+
+    Raises:
+        StorageFormatError: Bad magic, unsupported version or no intact header
+    """
+    with open(path, "rb") as f:
+        raw = f.read(HEADER_SIZE)
+
+    headers, versions = [], []
+    for offset in (0, HEADER_SLOT_SIZE):
+        copy = raw[offset:offset + HEADER_SLOT_SIZE]
+        if copy[:len(MAGIC)] != MAGIC:
+            continue
+        (version,) = struct.unpack_from("<I", copy, len(MAGIC))
+        versions.append(version)
+        if version == FORMAT_VERSION:
+            fmt, names = _HEADER, _HEADER_FIELDS
+        elif version == 1 and offset == 0:
+            fmt, names = _HEADER_V1, _HEADER_FIELDS_V1
+        else:
+            continue
+        if len(copy) < fmt.size + _HEADER_CRC.size:
+            continue
+        (stored_crc,) = _HEADER_CRC.unpack_from(copy, fmt.size)
+        if zlib.crc32(copy[:fmt.size]) != stored_crc:
+            continue
+        header = dict(zip(names, fmt.unpack_from(copy)))
+        header.setdefault("generation", 0)
+        headers.append(header)
+
+    if not versions:
+        raise StorageFormatError(f"Not an HNSW index file: {path}")
+    if not headers:
+        unsupported = [v for v in versions if v not in (1, FORMAT_VERSION)]
+        if unsupported:
+            raise StorageFormatError(
+                f"Unsupported index format version {unsupported[0]} (expected {FORMAT_VERSION})"
+            )
+        raise StorageFormatError(f"Header checksum mismatch: {path}")
+    return max(headers, key=lambda header: header["generation"])
+
+
+def _write_header(f, header: Dict[str, Any]):
+    """Write header into the copy its generation owns (the older of the two)."""
+    packed = _HEADER.pack(
+        MAGIC, FORMAT_VERSION, header["d_embedding"], header["M"], header["max_levels"],
+        header["capacity"], header["upper_capacity"], header["count"], header["num_upper"],
+        header["num_deleted"], header["entry_point"], header["max_level"],
+        header["crc_vectors"], header["crc_graph"], header["crc_meta"], header["meta_bytes"],
+        header["generation"]
+    )
+    f.seek((header["generation"] % 2) * HEADER_SLOT_SIZE)
+    f.write(packed + _HEADER_CRC.pack(zlib.crc32(packed)))
+
+
+def _write_block(f, layout, name: str, array: np.ndarray, start_row: int = 0):
+    offset, dtype, shape = layout[name]
+    row_bytes = int(np.prod(shape[1:], dtype=np.int64)) * dtype.itemsize
+    f.seek(offset + start_row * row_bytes)
+    f.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+
+
+def _index_header(index, capacity: int, upper_capacity: int) -> Dict[str, Any]:
+    return {
+        "d_embedding": index.d_embedding,
+        "M": index.M,
+        "max_levels": index.MAX_LEVEL,
+        "capacity": capacity,
+        "upper_capacity": upper_capacity,
+        "count": index._count,
+        "num_upper": index._num_upper,
+        "num_deleted": index._num_deleted,
+        "entry_point": -1 if index.entry_point is None else index.entry_point,
+        "max_level": index.max_level,
+    }
+
+
+def save_index(index, path: Path) -> bool:
+    """
+    Write an HNSWIndex to path (+ metadata sidecar).
+
+    Returns: True if the save appended to the existing files in place,
+        False if both files were rewritten
+    """
+    path = Path(path)
+    if index._persisted_path == str(path.resolve()) and path.exists():
+        try:
+            header = read_header(path)
+        except StorageFormatError:
+            header = None
+        if (
+            header is not None
+            and header["version"] == FORMAT_VERSION
+            and header["count"] == index._persisted_count <= index._count
+            and header["capacity"] == len(index._vectors)
+            and header["upper_capacity"] == len(index._upper_neighbors)
+            and header["d_embedding"] == index.d_embedding
+            and header["M"] == index.M
+        ):
+            _append_index(index, path, header)
+            return True
+
+    _write_index(index, path)
+    return False
+
+
+def _write_index(index, path: Path):
+    """Rewrite both files through temporaries and atomic renames."""
+    capacity, upper_capacity = len(index._vectors), len(index._upper_neighbors)
+    layout, total_size = _layout(index.d_embedding, index.M, index.MAX_LEVEL, capacity, upper_capacity)
+    n = index._count
+
+    # Metadata sidecar
+    lines = _encode_metadata(index.metadata[:n])
+    offsets = np.zeros(n + 1, dtype=np.uint64)
+    offsets[1:] = np.cumsum([len(line) for line in lines], dtype=np.uint64)
+    meta_tmp = metadata_path(path).with_name(metadata_path(path).name + ".tmp")
+    crc_meta = 0
+    with open(meta_tmp, "wb") as f:
+        for line in lines:
+            f.write(line)
+            crc_meta = zlib.crc32(line, crc_meta)
+        f.flush()
+        os.fsync(f.fileno())
+
+    header = _index_header(index, capacity, upper_capacity)
+    header.update(
+        crc_vectors=_crc([index._vectors[:n]]),
+        crc_graph=_crc(_graph_arrays(index)),
+        crc_meta=crc_meta,
+        meta_bytes=int(offsets[-1]),
+        generation=0
+    )
+
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.truncate(total_size)
+        _write_block(f, layout, "vectors", index._vectors[:n])
+        # Both graph slots are written in full so unused rows keep their -1 padding
+        for slot in (0, 1):
+            for name, array in zip(GRAPH_BLOCKS, _graph_arrays(index, full=True)):
+                _write_block(f, layout, _graph_block(name, slot), array)
+        _write_block(f, layout, "meta_offsets", offsets)
+        _write_header(f, header)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(meta_tmp, metadata_path(path))
+    os.replace(tmp, path)
+    index._persisted_path = str(path.resolve())
+    index._persisted_count = n
+
+
+def _append_index(index, path: Path, header: Dict[str, Any]):
+    """
+    Append new rows to files written for this index.
+
+    Everything before the header write is invisible to the current
+    header: new vector, offset and metadata rows lie past its counts, and
+    the graph goes into the other slot. The new header then overwrites
+    the older copy, so a torn write still leaves the current one.
+    """
+    layout, _ = _layout(
+        header["d_embedding"], header["M"], header["max_levels"],
+        header["capacity"], header["upper_capacity"]
+    )
+    start, n = header["count"], index._count
+
+    # New metadata rows
+    lines = _encode_metadata(index.metadata[start:n])
+    offsets = header["meta_bytes"] + np.cumsum([len(line) for line in lines], dtype=np.uint64)
+    crc_meta = header["crc_meta"]
+    with open(metadata_path(path), "r+b") as f:
+        f.seek(header["meta_bytes"])
+        for line in lines:
+            f.write(line)
+            crc_meta = zlib.crc32(line, crc_meta)
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+
+    new_header = _index_header(index, header["capacity"], header["upper_capacity"])
+    new_header.update(
+        crc_vectors=_crc([index._vectors[start:n]], header["crc_vectors"]),
+        crc_graph=_crc(_graph_arrays(index)),
+        crc_meta=crc_meta,
+        meta_bytes=int(offsets[-1]) if len(lines) else header["meta_bytes"],
+        generation=header["generation"] + 1
+    )
+    slot = _graph_slot(new_header)
+
+    with open(path, "r+b") as f:
+        _write_block(f, layout, "vectors", index._vectors[start:n], start_row=start)
+        # Back-links and tombstones also touch old rows, so the whole graph is rewritten
+        for name, array in zip(GRAPH_BLOCKS, _graph_arrays(index)):
+            _write_block(f, layout, _graph_block(name, slot), array)
+        if len(lines):
+            _write_block(f, layout, "meta_offsets", offsets, start_row=start + 1)
+        f.flush()
+        os.fsync(f.fileno())
+        _write_header(f, new_header)
+        f.flush()
+        os.fsync(f.fileno())
+
+    index._persisted_count = n
+
+
+def load_index(index, path: Path, mmap_mode: Optional[str] = "c", verify: bool = False):
+    """
+    Open an index file into an HNSWIndex.
+
+    Args:
+        mmap_mode: np.memmap mode for the blocks. "c" (default) maps them
+            copy-on-write, so the index stays writable in memory; "r"
+            maps them read-only for serving; None reads them into RAM.
+        verify: Also check the vector, graph and metadata checksums
+            (reads every block once)
+
+    Raises:
+        StorageFormatError: Invalid file, unsupported version or checksum mismatch
+    """
+    path = Path(path)
+    header = read_header(path)
+    layout, total_size = _layout(
+        header["d_embedding"], header["M"], header["max_levels"],
+        header["capacity"], header["upper_capacity"],
+        graph_slots=2 if header["version"] >= 2 else 1
+    )
+    if os.path.getsize(path) < total_size:
+        raise StorageFormatError(f"Index file is truncated: {path}")
+    if header["max_levels"] != index.MAX_LEVEL:
+        raise StorageFormatError(f"Index file has {header['max_levels']} levels, expected {index.MAX_LEVEL}")
+
+    slot = _graph_slot(header)
+
+    def block(name: str) -> np.ndarray:
+        if name in GRAPH_BLOCKS:
+            name = _graph_block(name, slot)
+        offset, dtype, shape = layout[name]
+        if mmap_mode is None:
+            count = int(np.prod(shape))
+            return np.fromfile(path, dtype=dtype, count=count, offset=offset).reshape(shape)
+        return np.memmap(path, dtype=dtype, mode=mmap_mode, offset=offset, shape=shape)
+
+    n, num_upper = header["count"], header["num_upper"]
+
+    index.d_embedding = header["d_embedding"]
+    index.M = header["M"]
+    index.M0 = 2 * header["M"]
+    index._vectors = block("vectors")
+    index._levels = block("levels")
+    index._deleted = block("deleted")
+    index._upper_row = block("upper_row")
+    index._counts0 = block("counts0")
+    index._neighbors0 = block("neighbors0")
+    index._upper_counts = block("upper_counts")
+    index._upper_neighbors = block("upper_neighbors")
+    index._visited = np.zeros(header["capacity"], dtype=np.int32)
+    index._visit_epoch = 0
+    index._count = n
+    index._num_upper = num_upper
+    index._num_deleted = header["num_deleted"]
+    index.entry_point = None if header["entry_point"] < 0 else header["entry_point"]
+    index.max_level = header["max_level"]
+
+    offsets = np.array(block("meta_offsets")[:n + 1])
+    if int(offsets[-1]) != header["meta_bytes"]:
+        raise StorageFormatError(f"Metadata offsets do not match the header: {path}")
+    index.metadata = MetadataSidecar(metadata_path(path), offsets)
+
+    if verify:
+        if _crc([index._vectors[:n]]) != header["crc_vectors"]:
+            raise StorageFormatError(f"Vector block checksum mismatch: {path}")
+        if _crc(_graph_arrays(index)) != header["crc_graph"]:
+            raise StorageFormatError(f"Graph block checksum mismatch: {path}")
+        with open(metadata_path(path), "rb") as f:
+            if zlib.crc32(f.read(header["meta_bytes"])) != header["crc_meta"]:
+                raise StorageFormatError(f"Metadata checksum mismatch: {path}")
+
+    index._read_only = mmap_mode == "r"
+    index._persisted_path = str(path.resolve())
+    index._persisted_count = n
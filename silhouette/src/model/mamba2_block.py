@@ -36,6 +36,7 @@ class Mamba2Config:
     expand: int = 2
     headdim: int = 64  # New in Mamba-2
     chunk_size: int = 64  # For chunked processing
+    scan_mode: str = "auto"  # "auto", "chunked" or "sequential"
     use_bias: bool = False
     conv_bias: bool = True
     
@@ -45,6 +46,26 @@ class Mamba2Config:
         self.nheads = self.d_inner // self.headdim
 
 
+def segsum(x: torch.Tensor) -> torch.Tensor:
+    """
+    Stable segment sum of log decays.
+    
+    Args:
+        x: (..., T)
+    
+    Returns:
+        (..., T, T) with out[..., i, j] = sum(x[..., j+1:i+1]) for j <= i and
+        -inf above the diagonal, so exp(out) is the causal decay matrix.
+    """
+    T = x.size(-1)
+    x = repeat(x, "... t -> ... t e", e=T)
+    mask = torch.tril(torch.ones(T, T, device=x.device, dtype=torch.bool), diagonal=-1)
+    x = x.masked_fill(~mask, 0)
+    x_segsum = torch.cumsum(x, dim=-2)
+    mask = torch.tril(torch.ones(T, T, device=x.device, dtype=torch.bool), diagonal=0)
+    return x_segsum.masked_fill(~mask, float("-inf"))
+
+
 class Mamba2BlockPure(nn.Module):
     """
     Pure PyTorch Mamba-2 Block implementation.
@@ -140,8 +161,15 @@ class Mamba2BlockPure(nn.Module):
         # A is scalar * identity in Mamba-2 (key simplification from SSD)
         A = -torch.exp(self.A_log)  # (nheads,)
         
-        # SSD scan (simplified)
-        y, new_cache = self._ssd_scan(x, dt, A, B, C, cache)
+        # SSD scan: chunked (matmul) form for prefill/training, recurrence for decoding
+        scan_mode = self.config.scan_mode
+        if scan_mode == "auto":
+            scan_mode = "chunked" if seq_len > 1 else "sequential"
+        
+        if scan_mode == "chunked":
+            y, new_cache = self._ssd_chunked(x, dt, A, B, C, cache)
+        else:
+            y, new_cache = self._ssd_scan(x, dt, A, B, C, cache)
         
         # Reshape back
         y = rearrange(y, "b l h d -> b l (h d)")
@@ -196,7 +224,7 @@ class Mamba2BlockPure(nn.Module):
             A_bar = torch.exp(A.view(1, -1, 1, 1) * dt_t)  # (batch, heads, 1, 1)
             
             # B_bar = dt * B (simplified)
-            B_bar = dt_t.squeeze(-1) * B_t.unsqueeze(2)  # (batch, heads, 1, d_state)
+            B_bar = dt_t * B_t.unsqueeze(2)  # (batch, heads, 1, d_state)
             
             # State update: h = A_bar * h + B_bar * x
             x_t_expanded = x_t.unsqueeze(-1)  # (batch, heads, headdim, 1)
@@ -211,6 +239,73 @@ class Mamba2BlockPure(nn.Module):
         y = torch.stack(outputs, dim=1)  # (batch, seq, heads, headdim)
         
         return y, h
+    
+    def _ssd_chunked(
+        self,
+        x: torch.Tensor,      # (batch, seq, heads, headdim)
+        dt: torch.Tensor,     # (batch, seq, heads)
+        A: torch.Tensor,      # (heads,)
+        B: torch.Tensor,      # (batch, seq, heads, d_state)
+        C: torch.Tensor,      # (batch, seq, heads, d_state)
+        cache: Optional[torch.Tensor] = None
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Chunked SSD scan (state space duality).
+        
+        Since A is scalar per head, the decays inside a chunk form a
+        (chunk, chunk) matrix exp(segsum(A * dt)) built from log-space
+        cumulative sums, so intra-chunk outputs are plain matmuls. Chunk
+        end states are passed between chunks with the same segsum trick.
+        Matches _ssd_scan up to floating point error.
+        """
+        batch, seq_len, nheads, headdim = x.shape
+        chunk_size = self.chunk_size
+        
+        # Pad to a multiple of chunk_size (dt = 0 leaves the state untouched)
+        pad = (chunk_size - seq_len % chunk_size) % chunk_size
+        x_in = x
+        if pad:
+            x = F.pad(x, (0, 0, 0, 0, 0, pad))
+            dt = F.pad(dt, (0, 0, 0, pad))
+            B = F.pad(B, (0, 0, 0, 0, 0, pad))
+            C = F.pad(C, (0, 0, 0, 0, 0, pad))
+        
+        # Discretize: B_bar * x = dt * B * x, log(A_bar) = A * dt
+        X = x * dt.unsqueeze(-1)
+        A_dt = A.view(1, 1, -1) * dt  # (batch, seq, heads)
+        
+        X, B, C = [
+            rearrange(t, "b (c l) h d -> b c l h d", l=chunk_size) for t in (X, B, C)
+        ]
+        A_dt = rearrange(A_dt, "b (c l) h -> b h c l", l=chunk_size)
+        A_cumsum = torch.cumsum(A_dt, dim=-1)  # (batch, heads, chunks, l)
+        
+        # 1. Intra-chunk outputs (diagonal blocks)
+        L = torch.exp(segsum(A_dt))  # (batch, heads, chunks, l, l)
+        y_diag = torch.einsum("bclhn,bcshn,bhcls,bcshp->bclhp", C, B, L, X)
+        
+        # 2. State at the end of each chunk (zero initial state)
+        decay_states = torch.exp(A_cumsum[..., -1:] - A_cumsum)
+        states = torch.einsum("bclhn,bhcl,bclhp->bchpn", B, decay_states, X)
+        
+        # 3. Pass states between chunks, starting from the cached state
+        if cache is None:
+            initial_state = torch.zeros_like(states[:, :1])
+        else:
+            initial_state = cache.unsqueeze(1)
+        states = torch.cat([initial_state, states], dim=1)
+        decay_chunk = torch.exp(segsum(F.pad(A_cumsum[..., -1], (1, 0))))
+        states = torch.einsum("bhzc,bchpn->bzhpn", decay_chunk, states)
+        states, final_state = states[:, :-1], states[:, -1]
+        
+        # 4. Contribution of each chunk's incoming state
+        state_decay_out = torch.exp(A_cumsum)
+        y_off = torch.einsum("bclhn,bchpn,bhcl->bclhp", C, states, state_decay_out)
+        
+        y = rearrange(y_diag + y_off, "b c l h p -> b (c l) h p")[:, :seq_len]
+        y = y + self.D.view(1, 1, -1, 1) * x_in
+        
+        return y, final_state
 
 
 class Mamba2Block(nn.Module):
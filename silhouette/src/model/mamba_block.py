@@ -9,6 +9,7 @@ This implementation provides:
 1. Selective scan mechanism (input-dependent A, B, C, Δ)
 2. Hardware-aware parallel scan (when mamba-ssm is available)
 3. Pure PyTorch fallback for compatibility
+4. Chunked parallel (associative) scan for the fallback, state carried between chunks
 """
 
 import math
@@ -45,6 +46,8 @@ class MambaConfig:
     dt_init_floor: float = 1e-4
     bias: bool = False
     conv_bias: bool = True
+    scan_mode: str = "auto"     # "auto", "chunked" or "sequential"
+    chunk_size: int = 16        # Chunk length for the chunked scan
     
     def __post_init__(self):
         self.d_inner = int(self.expand * self.d_model)
@@ -52,6 +55,33 @@ class MambaConfig:
             self.dt_rank = math.ceil(self.d_model / 16)
 
 
+def associative_scan(
+    a: torch.Tensor,
+    b: torch.Tensor
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Parallel (Hillis-Steele) scan of the linear recurrence h_t = a_t * h_{t-1} + b_t.
+    
+    Runs in log2(T) vectorized steps using the associative operator
+    (a1, b1) o (a2, b2) = (a1 * a2, a2 * b1 + b2).
+    
+    Args:
+        a: (batch, T, ...) per-step decays in [0, 1]
+        b: (batch, T, ...) per-step inputs
+    
+    Returns:
+        a_cum: (batch, T, ...) cumulative decay products a_0 * ... * a_t
+        h: (batch, T, ...) states assuming h_{-1} = 0
+    """
+    seq_len = a.shape[1]
+    step = 1
+    while step < seq_len:
+        b = torch.cat([b[:, :step], a[:, step:] * b[:, :-step] + b[:, step:]], dim=1)
+        a = torch.cat([a[:, :step], a[:, step:] * a[:, :-step]], dim=1)
+        step *= 2
+    return a, b
+
+
 class MambaBlockPure(nn.Module):
     """
     Pure PyTorch Mamba Block implementation.
@@ -125,7 +155,8 @@ class MambaBlockPure(nn.Module):
     def forward(
         self, 
         hidden_states: torch.Tensor,
-        cache: Optional[Tuple[torch.Tensor, torch.Tensor]] = None
+        cache: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+        use_cache: bool = False
     ) -> Tuple[torch.Tensor, Optional[Tuple[torch.Tensor, torch.Tensor]]]:
         """
         Forward pass of Mamba block.
@@ -133,12 +164,17 @@ class MambaBlockPure(nn.Module):
         Args:
             hidden_states: (batch, seq_len, d_model)
             cache: Optional tuple of (conv_state, ssm_state) for inference
+                conv_state: (batch, d_inner, d_conv - 1) last raw conv inputs
+                ssm_state: (batch, d_inner, d_state) recurrent SSM state
+            use_cache: Return the updated cache even when no cache was given
+                (used for the prefill step of incremental decoding)
         
         Returns:
             output: (batch, seq_len, d_model)
-            new_cache: Updated cache for next step
+            new_cache: Updated cache for next step (None unless requested)
         """
         batch, seq_len, _ = hidden_states.shape
+        conv_width = self.config.d_conv - 1
         
         # Input projection -> x and z (gate)
         xz = self.in_proj(hidden_states)
@@ -152,10 +188,18 @@ class MambaBlockPure(nn.Module):
         
         if cache is not None:
             conv_state, ssm_state = cache
-            # Prepend cached conv state
-            x = torch.cat([conv_state, x], dim=-1)
+            # Prepend cached conv inputs so the causal window spans the step boundary
+            conv_input = torch.cat([conv_state, x], dim=-1)
+            x = F.conv1d(
+                conv_input,
+                self.conv1d.weight,
+                self.conv1d.bias,
+                groups=self.config.d_inner
+            )
+        else:
+            conv_input = x
+            x = self.conv1d(x)[:, :, :seq_len]  # Causal: trim to seq_len
         
-        x = self.conv1d(x)[:, :, :seq_len]  # Causal: trim to seq_len
         x = rearrange(x, "b d l -> b l d")
         
         # Activation
@@ -175,8 +219,15 @@ class MambaBlockPure(nn.Module):
         # Get A from log parameterization
         A = -torch.exp(self.A_log)  # (d_inner, d_state)
         
-        # Run selective scan
-        y, new_ssm_state = self._selective_scan(x, dt, A, B, C, self.D, ssm_state)
+        # Run selective scan (chunked for prefill/training, sequential for decoding)
+        scan_mode = self.config.scan_mode
+        if scan_mode == "auto":
+            scan_mode = "chunked" if seq_len > 1 else "sequential"
+        
+        if scan_mode == "chunked":
+            y, new_ssm_state = self._chunked_scan(x, dt, A, B, C, self.D, ssm_state)
+        else:
+            y, new_ssm_state = self._selective_scan(x, dt, A, B, C, self.D, ssm_state)
         
         # Gate with z
         y = y * F.silu(z)
@@ -184,9 +235,11 @@ class MambaBlockPure(nn.Module):
         # Output projection
         output = self.out_proj(y)
         
-        # Prepare new cache
-        if cache is not None:
-            new_conv_state = rearrange(x, "b l d -> b d l")[:, :, -self.config.d_conv + 1:]
+        # Prepare new cache (conv state holds the raw, pre-convolution inputs)
+        if cache is not None or use_cache:
+            if conv_input.shape[-1] < conv_width:
+                conv_input = F.pad(conv_input, (conv_width - conv_input.shape[-1], 0))
+            new_conv_state = conv_input[:, :, conv_input.shape[-1] - conv_width:]
             new_cache = (new_conv_state, new_ssm_state)
         else:
             new_cache = None
@@ -247,6 +300,65 @@ class MambaBlockPure(nn.Module):
         y = torch.stack(outputs, dim=1)  # (batch, seq_len, d_inner)
         
         return y, h
+    
+    def _chunked_scan(
+        self,
+        x: torch.Tensor,           # (batch, seq_len, d_inner)
+        dt: torch.Tensor,          # (batch, seq_len, d_inner)
+        A: torch.Tensor,           # (d_inner, d_state)
+        B: torch.Tensor,           # (batch, seq_len, d_state)
+        C: torch.Tensor,           # (batch, seq_len, d_state)
+        D: torch.Tensor,           # (d_inner,)
+        ssm_state: Optional[torch.Tensor] = None
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Chunked parallel selective scan (pure PyTorch).
+        
+        Each chunk is solved with a log-depth associative scan, giving the
+        cumulative decay products and zero-init states for every step at
+        once; the state entering the chunk is then added back through the
+        cumulative decays and carried to the next chunk. Mamba-1 has a
+        per-channel A, so the SSD quadratic (T x T) form would need a
+        decay matrix per (d_inner, d_state) pair; the scan keeps memory at
+        O(T * d_inner * d_state) per chunk. Matches _selective_scan up to
+        floating point error.
+        """
+        batch, seq_len, d_inner = x.shape
+        d_state = A.shape[1]
+        chunk_size = self.config.chunk_size
+        
+        # Initialize state
+        if ssm_state is None:
+            h = torch.zeros(batch, d_inner, d_state, device=x.device, dtype=x.dtype)
+        else:
+            h = ssm_state
+        
+        outputs = []
+        
+        for start in range(0, seq_len, chunk_size):
+            x_c = x[:, start:start + chunk_size]    # (batch, T, d_inner)
+            dt_c = dt[:, start:start + chunk_size]  # (batch, T, d_inner)
+            B_c = B[:, start:start + chunk_size]    # (batch, T, d_state)
+            C_c = C[:, start:start + chunk_size]    # (batch, T, d_state)
+            
+            # Discretize for the whole chunk (ZOH, same as the sequential path)
+            A_bar = torch.exp(dt_c.unsqueeze(-1) * A)  # (batch, T, d_inner, d_state)
+            Bx = (dt_c * x_c).unsqueeze(-1) * B_c.unsqueeze(2)  # (batch, T, d_inner, d_state)
+            
+            # Parallel scan within the chunk, then add the carried-in state
+            A_cum, h_c = associative_scan(A_bar, Bx)
+            h_c = h_c + A_cum * h.unsqueeze(1)
+            
+            # Output: y = C * h + D * x
+            y_c = torch.einsum("btds,bts->btd", h_c, C_c) + D * x_c
+            outputs.append(y_c)
+            
+            # Carry final state into next chunk
+            h = h_c[:, -1]
+        
+        y = torch.cat(outputs, dim=1)  # (batch, seq_len, d_inner)
+        
+        return y, h
 
 
 class MambaBlock(nn.Module):
@@ -278,7 +390,8 @@ class MambaBlock(nn.Module):
     def forward(
         self,
         hidden_states: torch.Tensor,
-        cache: Optional[Tuple[torch.Tensor, torch.Tensor]] = None
+        cache: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+        use_cache: bool = False
     ) -> Tuple[torch.Tensor, Optional[Tuple[torch.Tensor, torch.Tensor]]]:
         """
         Forward pass.
@@ -286,6 +399,7 @@ class MambaBlock(nn.Module):
         Args:
             hidden_states: (batch, seq_len, d_model)
             cache: Optional cache for incremental decoding
+            use_cache: Return the updated (conv_state, ssm_state) cache
         
         Returns:
             output: (batch, seq_len, d_model)
@@ -296,7 +410,12 @@ class MambaBlock(nn.Module):
             output = self.mamba(hidden_states)
             return output, None
         else:
-            return self.mamba(hidden_states, cache)
+            return self.mamba(hidden_states, cache, use_cache)
+    
+    @property
+    def supports_cache(self) -> bool:
+        """Whether forward() can carry recurrent state between calls."""
+        return not self.use_optimized
     
     @property
     def is_optimized(self) -> bool:
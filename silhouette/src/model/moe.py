@@ -5,11 +5,13 @@ Based on Jamba architecture (AI21 Labs).
 - 16 experts per layer
 - Top-2 expert selection per token
 - Load balancing loss for even distribution
+- Sort-by-expert dispatch with optional expert capacity
 """
+import math
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from typing import Tuple, Optional
+from typing import Tuple, Optional, Dict, Any
 from dataclasses import dataclass
 
 
@@ -20,6 +22,8 @@ class MoEConfig:
     num_experts: int = 16
     num_experts_per_tok: int = 2
     aux_loss_coef: float = 0.01  # Load balancing coefficient
+    capacity_factor: float = 0.0  # Max assignments per expert = factor * tokens * k / experts (0 = unlimited)
+    dispatch: str = "grouped"  # "grouped" (per-expert slices) or "stacked" (batched matmul over stacked weights)
 
 
 class Expert(nn.Module):
@@ -53,6 +57,11 @@ class MoELayer(nn.Module):
     
     Each token is routed to top-k experts.
     Outputs are weighted by router probabilities.
+    
+    Token/expert assignments are sorted by expert once, so every expert
+    sees one contiguous slice of its tokens, and results are combined
+    with a single index_add_. With a capacity factor, assignments past an
+    expert's capacity are dropped (the token keeps its residual path).
     """
     def __init__(self, config: MoEConfig):
         super().__init__()
@@ -71,6 +80,10 @@ class MoELayer(nn.Module):
         
         # For auxiliary loss
         self.aux_loss_coef = config.aux_loss_coef
+        
+        # Routing statistics (accumulated on device, read via get_stats)
+        self._routed_per_expert: Optional[torch.Tensor] = None
+        self._dropped_per_expert: Optional[torch.Tensor] = None
     
     def forward(self, x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
         """
@@ -96,34 +109,11 @@ class MoELayer(nn.Module):
         # Normalize weights
         topk_weights = topk_weights / topk_weights.sum(dim=-1, keepdim=True)
         
-        # Compute expert outputs
-        # Reshape for processing: (batch * seq, d_model)
+        # Dispatch: (batch * seq, d_model)
         x_flat = x.view(-1, d_model)
-        
-        # Initialize output
-        output = torch.zeros_like(x_flat)
-        
-        # Process each expert
-        for expert_idx in range(self.num_experts):
-            # Find tokens routed to this expert
-            expert_mask = (topk_indices == expert_idx).any(dim=-1)
-            expert_mask_flat = expert_mask.view(-1)
-            
-            if expert_mask_flat.any():
-                # Get tokens for this expert
-                expert_input = x_flat[expert_mask_flat]
-                
-                # Compute expert output
-                expert_output = self.experts[expert_idx](expert_input)
-                
-                # Get weights for this expert
-                # Find which position in top-k this expert is
-                weight_mask = (topk_indices == expert_idx)
-                weights = (topk_weights * weight_mask.float()).sum(dim=-1)
-                weights_flat = weights.view(-1)[expert_mask_flat]
-                
-                # Add weighted output
-                output[expert_mask_flat] += expert_output * weights_flat.unsqueeze(-1)
+        output = self._dispatch(x_flat, topk_indices.view(-1, self.num_experts_per_tok),
+                                topk_weights.view(-1, self.num_experts_per_tok),
+                                router_probs.shape[-1])
         
         output = output.view(batch, seq_len, d_model)
         
@@ -132,6 +122,136 @@ class MoELayer(nn.Module):
         
         return output, aux_loss
     
+    def expert_capacity(self, num_tokens: int, num_experts: int) -> Optional[int]:
+        """Max assignments per expert for a batch of num_tokens (None = unlimited)."""
+        if self.config.capacity_factor <= 0:
+            return None
+        return max(1, math.ceil(
+            self.config.capacity_factor * num_tokens * self.num_experts_per_tok / num_experts
+        ))
+    
+    def _dispatch(
+        self,
+        x_flat: torch.Tensor,
+        topk_indices: torch.Tensor,
+        topk_weights: torch.Tensor,
+        num_experts: int
+    ) -> torch.Tensor:
+        """
+        Run every token through its selected experts.
+        
+        Args:
+            x_flat: (tokens, d_model)
+            topk_indices: (tokens, k) expert ids
+            topk_weights: (tokens, k) normalized routing weights
+            num_experts: Router width (may grow with spawned experts)
+        
+        Returns:
+            (tokens, d_model) weighted sum of expert outputs
+        """
+        num_tokens = x_flat.shape[0]
+        device = x_flat.device
+        
+        # Sort all (token, expert) assignments by expert once
+        flat_experts = topk_indices.reshape(-1)
+        order = torch.argsort(flat_experts, stable=True)
+        sorted_experts = flat_experts[order]
+        sorted_tokens = order // self.num_experts_per_tok
+        sorted_weights = topk_weights.reshape(-1)[order]
+        
+        counts = torch.bincount(flat_experts, minlength=num_experts)
+        starts = counts.cumsum(0) - counts
+        slot = torch.arange(len(order), device=device) - starts[sorted_experts]  # Rank within expert
+        
+        # Drop assignments beyond expert capacity
+        capacity = self.expert_capacity(num_tokens, num_experts)
+        kept_counts = counts
+        if capacity is not None:
+            keep = slot < capacity
+            sorted_experts = sorted_experts[keep]
+            sorted_tokens = sorted_tokens[keep]
+            sorted_weights = sorted_weights[keep]
+            slot = slot[keep]
+            kept_counts = counts.clamp(max=capacity)
+        self._record_routing(counts, kept_counts)
+        
+        expert_inputs = x_flat[sorted_tokens]
+        if self.config.dispatch == "stacked" and self._stackable(num_experts):
+            expert_outputs = self._run_stacked(expert_inputs, sorted_experts, slot, kept_counts, capacity)
+        else:
+            expert_outputs = self._run_grouped(expert_inputs, kept_counts)
+        
+        # Combine in one scatter
+        output = torch.zeros_like(x_flat)
+        output.index_add_(0, sorted_tokens, expert_outputs * sorted_weights.unsqueeze(-1).to(x_flat.dtype))
+        return output
+    
+    def _run_grouped(self, expert_inputs: torch.Tensor, kept_counts: torch.Tensor) -> torch.Tensor:
+        """Run each expert on its contiguous slice (only experts that received tokens)."""
+        outputs = []
+        for expert_idx, chunk in enumerate(expert_inputs.split(kept_counts.tolist())):
+            outputs.append(self.experts[expert_idx](chunk) if len(chunk) > 0 else chunk)
+        return torch.cat(outputs, dim=0)
+    
+    def _stackable(self, num_experts: int) -> bool:
+        # Stacking reads .weight of plain Linear projections (not quantized replacements)
+        return len(self.experts) == num_experts and all(
+            isinstance(e, Expert) and all(
+                type(proj) is nn.Linear for proj in (e.gate_proj, e.up_proj, e.down_proj)
+            )
+            for e in self.experts
+        )
+    
+    def _run_stacked(
+        self,
+        expert_inputs: torch.Tensor,
+        sorted_experts: torch.Tensor,
+        slot: torch.Tensor,
+        kept_counts: torch.Tensor,
+        capacity: Optional[int]
+    ) -> torch.Tensor:
+        """Pad slices to (experts, capacity, d_model) and run all experts as batched matmuls."""
+        num_experts = len(self.experts)
+        width = capacity if capacity is not None else int(kept_counts.max())
+        padded = expert_inputs.new_zeros(num_experts, width, expert_inputs.shape[-1])
+        padded[sorted_experts, slot] = expert_inputs
+        
+        gate = torch.stack([e.gate_proj.weight for e in self.experts])  # (E, I, d)
+        up = torch.stack([e.up_proj.weight for e in self.experts])
+        down = torch.stack([e.down_proj.weight for e in self.experts])  # (E, d, I)
+        
+        hidden = F.silu(torch.bmm(padded, gate.transpose(1, 2))) * torch.bmm(padded, up.transpose(1, 2))
+        return torch.bmm(hidden, down.transpose(1, 2))[sorted_experts, slot]
+    
+    @torch.no_grad()
+    def _record_routing(self, counts: torch.Tensor, kept_counts: torch.Tensor):
+        if self._routed_per_expert is None or self._routed_per_expert.shape != counts.shape \
+                or self._routed_per_expert.device != counts.device:
+            self.reset_stats(len(counts), counts.device)
+        self._routed_per_expert += counts
+        self._dropped_per_expert += counts - kept_counts
+    
+    def reset_stats(self, num_experts: Optional[int] = None, device=None):
+        """Zero the accumulated routing statistics."""
+        num_experts = num_experts or self.num_experts
+        self._routed_per_expert = torch.zeros(num_experts, dtype=torch.long, device=device)
+        self._dropped_per_expert = torch.zeros(num_experts, dtype=torch.long, device=device)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Assignments routed/dropped per expert since the last reset."""
+        if self._routed_per_expert is None:
+            return {"routed": 0, "dropped": 0, "drop_rate": 0.0,
+                    "routed_per_expert": [], "dropped_per_expert": []}
+        routed = int(self._routed_per_expert.sum())
+        dropped = int(self._dropped_per_expert.sum())
+        return {
+            "routed": routed,
+            "dropped": dropped,
+            "drop_rate": dropped / routed if routed else 0.0,
+            "routed_per_expert": self._routed_per_expert.tolist(),
+            "dropped_per_expert": self._dropped_per_expert.tolist()
+        }
+    
     def _compute_aux_loss(
         self, 
         router_probs: torch.Tensor,
@@ -166,14 +286,18 @@ def create_moe_layer(
     d_model: int = 512,
     intermediate_size: int = 1376,
     num_experts: int = 16,
-    num_experts_per_tok: int = 2
+    num_experts_per_tok: int = 2,
+    capacity_factor: float = 0.0,
+    dispatch: str = "grouped"
 ) -> MoELayer:
     """Factory function for MoE layer."""
     config = MoEConfig(
         d_model=d_model,
         intermediate_size=intermediate_size,
         num_experts=num_experts,
-        num_experts_per_tok=num_experts_per_tok
+        num_experts_per_tok=num_experts_per_tok,
+        capacity_factor=capacity_factor,
+        dispatch=dispatch
     )
     return MoELayer(config)
 
@@ -198,4 +322,10 @@ if __name__ == "__main__":
     params = sum(p.numel() for p in moe.parameters())
     print(f"Parameters: {params:,}")
     
+    # Capacity-limited stacked dispatch
+    moe.config.capacity_factor = 1.0
+    moe.config.dispatch = "stacked"
+    output, _ = moe(x)
+    print(f"Stacked output: {output.shape}, drop rate: {moe.get_stats()['drop_rate']:.3f}")
+    
     print("✅ MoE test passed!")
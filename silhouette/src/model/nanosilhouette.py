@@ -10,7 +10,7 @@ import math
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from typing import Optional, Dict, List, Tuple, Any
+from typing import Optional, Dict, List, Tuple, Any, Iterator
 from dataclasses import dataclass, field
 
 from .mamba_block import MambaBlock, MambaConfig
@@ -43,6 +43,11 @@ class SilhouetteConfig:
     # Hybrid ratio (Mamba : Transformer)
     mamba_ratio: int = 7  # 7 Mamba blocks per 1 Transformer
     
+    # Pure PyTorch Mamba scan: "auto" (chunked for prefill, sequential for
+    # single-token decoding), "chunked" or "sequential"
+    mamba_scan_mode: str = "auto"
+    mamba_chunk_size: int = 16
+    
     # Component toggles (ALWAYS True in homeostatic mode - scaled, not disabled)
     use_mamba: bool = True
     use_transformer: bool = True
@@ -56,6 +61,7 @@ class SilhouetteConfig:
     num_experts: int = 16
     num_experts_per_tok: int = 2
     moe_interval: int = 2  # Apply MoE every N layers
+    moe_capacity_factor: float = 0.0  # Expert capacity (0 = no token dropping)
     
     # CMS settings
     cms_timescales: Tuple[float, ...] = (1.0, 10.0, 100.0, 1000.0)
@@ -155,6 +161,21 @@ class SilhouetteConfig:
         return cls.from_homeostasis('unlimited')
 
 
+@dataclass
+class DecodingState:
+    """
+    Per-layer recurrent state carried between incremental decoding steps.
+    
+    - layer_caches[i]: (conv_state, ssm_state) for Mamba layers,
+      (keys, values) for Transformer layers
+    - cms_states: CMS memory (keys, values) per timescale
+    - seq_len: Number of tokens already consumed
+    """
+    layer_caches: List[Optional[Tuple[torch.Tensor, torch.Tensor]]] = field(default_factory=list)
+    cms_states: Optional[List[Tuple[torch.Tensor, torch.Tensor]]] = None
+    seq_len: int = 0
+
+
 class RMSNorm(nn.Module):
     def __init__(self, dim: int, eps: float = 1e-5):
         super().__init__()
@@ -187,16 +208,26 @@ class HybridBlock(nn.Module):
                 d_model=config.d_model,
                 d_state=16,
                 d_conv=4,
-                expand=2
+                expand=2,
+                scan_mode=config.mamba_scan_mode,
+                chunk_size=config.mamba_chunk_size
             ))
             self.block_type = "mamba"
     
-    def forward(self, x, **kwargs):
+    def forward(self, x, cache=None, use_cache: bool = False, **kwargs):
         if self.block_type == "transformer":
-            return self.block(x, **kwargs)
+            return self.block(x, past_key_value=cache, use_cache=use_cache, **kwargs)
         else:
-            out, cache = self.block(x)
+            # Mamba state is per row, so masks/positions are not needed
+            out, cache = self.block(x, cache=cache, use_cache=use_cache)
             return out, cache
+    
+    @property
+    def supports_cache(self) -> bool:
+        """Whether this block can run incrementally from a cache."""
+        if self.block_type == "transformer":
+            return True
+        return self.block.supports_cache
 
 
 class SilhouetteModel(nn.Module):
@@ -266,7 +297,8 @@ class SilhouetteModel(nn.Module):
                         d_model=self.config.d_model,
                         intermediate_size=self.config.intermediate_size,
                         num_experts=self.config.num_experts,
-                        num_experts_per_tok=self.config.num_experts_per_tok
+                        num_experts_per_tok=self.config.num_experts_per_tok,
+                        capacity_factor=self.config.moe_capacity_factor
                     ))
         
         # Deep Optimizer (Hope architecture)
@@ -295,12 +327,22 @@ class SilhouetteModel(nn.Module):
     def num_parameters(self, trainable_only: bool = True) -> int:
         return sum(p.numel() for p in self.parameters() if not trainable_only or p.requires_grad)
     
+    @property
+    def supports_incremental_decoding(self) -> bool:
+        """True when every layer can carry state (False with mamba-ssm kernels)."""
+        return all(layer.supports_cache for layer in self.layers)
+    
     def forward(
         self,
         input_ids: torch.Tensor,
         labels: Optional[torch.Tensor] = None,
-        return_introspection: bool = False
-    ) -> Dict[str, torch.Tensor]:
+        return_introspection: bool = False,
+        past_state: Optional[DecodingState] = None,
+        use_cache: bool = False,
+        attention_mask: Optional[torch.Tensor] = None,
+        position_ids: Optional[torch.Tensor] = None,
+        exit_layer: Optional[int] = None
+    ) -> Dict[str, Any]:
         """
         Forward pass.
         
@@ -308,21 +350,40 @@ class SilhouetteModel(nn.Module):
             input_ids: (batch, seq_len) token IDs
             labels: Optional (batch, seq_len) for training
             return_introspection: Whether to return introspection data
+            past_state: Optional DecodingState from a previous call; input_ids
+                then only holds the tokens that follow it
+            use_cache: Whether to return the updated DecodingState
+            attention_mask: Optional additive mask for the Transformer layers
+                (e.g. to hide left padding of batched KV caches)
+            position_ids: Optional (batch, seq_len) rotary positions
+            exit_layer: Run only the first exit_layer blocks, then the final
+                norm and LM head (early-exit self-drafting); past_state then
+                only needs, and only returns, caches for those blocks
         
         Returns:
-            Dict with logits, loss, and optional introspection data
+            Dict with logits, loss, optional introspection data and
+            "past_state" when use_cache is set
         """
         h = self.embed_tokens(input_ids)
+        use_cache = use_cache or past_state is not None
         
-        # CMS state
-        cms_states = None
+        # CMS state (carried across decoding steps when a past state is given)
+        cms_states = past_state.cms_states if past_state is not None else None
+        layer_caches = past_state.layer_caches if past_state is not None else None
+        new_layer_caches = []
         
         # Auxiliary losses from MoE
         moe_aux_loss = 0.0
         
         # Process through hybrid layers
-        for i, layer in enumerate(self.layers):
-            h, _ = layer(h)
+        layers = self.layers if exit_layer is None else self.layers[:exit_layer]
+        for i, layer in enumerate(layers):
+            layer_cache = layer_caches[i] if layer_caches is not None else None
+            h, new_cache = layer(
+                h, cache=layer_cache, use_cache=use_cache,
+                attention_mask=attention_mask, position_ids=position_ids
+            )
+            new_layer_caches.append(new_cache)
             
             # Apply MoE at intervals (Jamba style)
             if self.config.use_moe and str(i) in self.moe_layers:
@@ -336,7 +397,7 @@ class SilhouetteModel(nn.Module):
         
         # Apply Deep Optimizer (Hope architecture)
         deep_opt_info = None
-        if self.config.use_deep_optimizer:
+        if self.config.use_deep_optimizer and exit_layer is None:
             h, deep_opt_info = self.deep_optimizer(h)
         
         h = self.norm(h)
@@ -377,8 +438,44 @@ class SilhouetteModel(nn.Module):
         if return_introspection and self.config.use_introspection:
             outputs["introspection"] = self.introspection(h)
         
+        if use_cache:
+            outputs["past_state"] = DecodingState(
+                layer_caches=new_layer_caches,
+                cms_states=cms_states,
+                seq_len=(past_state.seq_len if past_state is not None else 0) + input_ids.shape[1]
+            )
+        
         return outputs
     
+    @staticmethod
+    def _sample_next_token(
+        logits: torch.Tensor,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        top_k: int = 50
+    ) -> torch.Tensor:
+        """Sample (batch, 1) token ids from last-position logits (batch, vocab)."""
+        logits = logits / temperature
+        
+        # Top-k filtering
+        if top_k > 0:
+            indices_to_remove = logits < logits.topk(top_k)[0][..., -1, None]
+            logits[indices_to_remove] = float('-inf')
+        
+        # Top-p (nucleus) filtering
+        if top_p < 1.0:
+            sorted_logits, sorted_indices = torch.sort(logits, descending=True)
+            cumulative_probs = torch.cumsum(F.softmax(sorted_logits, dim=-1), dim=-1)
+            sorted_mask = cumulative_probs > top_p
+            sorted_mask[..., 1:] = sorted_mask[..., :-1].clone()
+            sorted_mask[..., 0] = False
+            indices_to_remove = sorted_mask.scatter(1, sorted_indices, sorted_mask)
+            logits[indices_to_remove] = float('-inf')
+        
+        # Sample
+        probs = F.softmax(logits, dim=-1)
+        return torch.multinomial(probs, num_samples=1)
+    
     @torch.no_grad()
     def generate(
         self,
@@ -386,38 +483,72 @@ class SilhouetteModel(nn.Module):
         max_new_tokens: int = 100,
         temperature: float = 0.7,
         top_p: float = 0.9,
-        top_k: int = 50
+        top_k: int = 50,
+        use_cache: bool = True
     ) -> torch.Tensor:
-        """Simple autoregressive generation."""
+        """
+        Autoregressive generation.
+        
+        With use_cache (default) the prompt is prefilled once and every new
+        token only runs through the layers with the carried DecodingState
+        (Mamba conv/SSM state, GQA KV cache, CMS memory). Falls back to
+        re-running the full context when a layer cannot carry state
+        (e.g. mamba-ssm CUDA kernels).
+        """
+        new_tokens = list(self.generate_stream(
+            input_ids, max_new_tokens, temperature, top_p, top_k, use_cache
+        ))
+        return torch.cat([input_ids] + new_tokens, dim=1)
+    
+    @torch.no_grad()
+    def generate_stream(
+        self,
+        input_ids: torch.Tensor,
+        max_new_tokens: int = 100,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        top_k: int = 50,
+        use_cache: bool = True
+    ) -> Iterator[torch.Tensor]:
+        """
+        Generator variant of generate().
+        
+        Yields each (batch, 1) tensor of new token ids as soon as it is
+        sampled, so callers can stream tokens while decoding continues.
+        """
+        if max_new_tokens <= 0:
+            return
+        
+        if use_cache and self.supports_incremental_decoding:
+            # Prefill with the (truncated) prompt
+            outputs = self(input_ids[:, -self.config.max_seq_len:], use_cache=True)
+            past_state = outputs["past_state"]
+            
+            for step in range(max_new_tokens):
+                next_token = self._sample_next_token(
+                    outputs["logits"][:, -1, :], temperature, top_p, top_k
+                )
+                yield next_token
+                
+                if step == max_new_tokens - 1:
+                    break
+                
+                # Only the new token goes through the layers
+                outputs = self(next_token, past_state=past_state)
+                past_state = outputs["past_state"]
+            return
+        
         for _ in range(max_new_tokens):
             # Truncate if too long
             idx_cond = input_ids[:, -self.config.max_seq_len:]
             
             # Forward
             outputs = self(idx_cond)
-            logits = outputs["logits"][:, -1, :] / temperature
-            
-            # Top-k filtering
-            if top_k > 0:
-                indices_to_remove = logits < logits.topk(top_k)[0][..., -1, None]
-                logits[indices_to_remove] = float('-inf')
-            
-            # Top-p (nucleus) filtering
-            if top_p < 1.0:
-                sorted_logits, sorted_indices = torch.sort(logits, descending=True)
-                cumulative_probs = torch.cumsum(F.softmax(sorted_logits, dim=-1), dim=-1)
-                sorted_mask = cumulative_probs > top_p
-                sorted_mask[..., 1:] = sorted_mask[..., :-1].clone()
-                sorted_mask[..., 0] = False
-                indices_to_remove = sorted_mask.scatter(1, sorted_indices, sorted_mask)
-                logits[indices_to_remove] = float('-inf')
-            
-            # Sample
-            probs = F.softmax(logits, dim=-1)
-            next_token = torch.multinomial(probs, num_samples=1)
+            next_token = self._sample_next_token(
+                outputs["logits"][:, -1, :], temperature, top_p, top_k
+            )
             input_ids = torch.cat([input_ids, next_token], dim=1)
-        
-        return input_ids
+            yield next_token
 
 
 def create_model(variant: str = "auto") -> SilhouetteModel:
@@ -472,8 +603,10 @@ if __name__ == "__main__":
     if "introspection" in outputs:
         print(f"  Introspection anomaly: {outputs['introspection']['anomaly_score'].mean():.4f}")
     
-    # Test generation
+    # Test generation (incremental and full-context)
     gen = model.generate(x[:1, :10], max_new_tokens=20)
     print(f"  Generated shape: {gen.shape}")
+    gen = model.generate(x[:1, :10], max_new_tokens=20, use_cache=False)
+    print(f"  Generated shape (no cache): {gen.shape}")
     
     print("\n✅ SILHOUETTE homeostatic model test passed!")
@@ -13,7 +13,7 @@ Based on: Knowledge Graphs, GNNs, Relation Networks, ConceptNet
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from typing import Optional, Dict, Any, List, Tuple, Set
+from typing import Optional, Dict, Any, List, Tuple, Set, Union
 from dataclasses import dataclass, field
 from collections import defaultdict
 import numpy as np
@@ -32,6 +32,7 @@ class SemanticKGConfig:
     gnn_layers: int = 4
     max_nodes: int = 100000
     attention_heads: int = 8
+    cache_gnn_output: bool = True  # Reuse GNN output in eval, recomputing only changed neighborhoods
 
 
 @dataclass
@@ -86,11 +87,61 @@ class RelationEmbedding(nn.Module):
         return self.name_to_idx.get(relation_name, 0)
 
 
+def segment_softmax(
+    scores: torch.Tensor,
+    segment_ids: torch.Tensor,
+    num_segments: int
+) -> torch.Tensor:
+    """
+    Softmax of scores within each segment.
+    
+    Args:
+        scores: (num_items, ...) unnormalized scores
+        segment_ids: (num_items,) segment of each item
+        num_segments: Number of segments
+    
+    Returns:
+        (num_items, ...) weights summing to 1 within every segment
+    """
+    index = segment_ids.view(-1, *([1] * (scores.dim() - 1))).expand_as(scores)
+    
+    # Subtract the per-segment max for numerical stability
+    seg_max = scores.new_full((num_segments,) + scores.shape[1:], float("-inf"))
+    seg_max = seg_max.scatter_reduce(0, index, scores.detach(), reduce="amax", include_self=True)
+    exp = torch.exp(scores - seg_max.gather(0, index))
+    
+    seg_sum = scores.new_zeros((num_segments,) + scores.shape[1:]).index_add_(0, segment_ids, exp)
+    return exp / seg_sum.gather(0, index)
+
+
+def _append_rows(
+    buffer: Optional[torch.Tensor],
+    used: int,
+    rows: torch.Tensor,
+    dim: int = 0
+) -> torch.Tensor:
+    """Write rows after the first used entries of buffer along dim, doubling capacity when full."""
+    needed = used + rows.shape[dim]
+    if buffer is None or buffer.shape[dim] < needed or buffer.device != rows.device:
+        capacity = max(64, needed, 2 * (0 if buffer is None else buffer.shape[dim]))
+        shape = list(rows.shape)
+        shape[dim] = capacity
+        grown = rows.new_zeros(shape)
+        if used:
+            grown.narrow(dim, 0, used).copy_(buffer.narrow(dim, 0, used))
+        buffer = grown
+    buffer.narrow(dim, used, rows.shape[dim]).copy_(rows)
+    return buffer
+
+
 class GraphAttentionLayer(nn.Module):
     """
     Graph Attention Network layer.
     
-    Aggregates information from neighbors with attention.
+    Aggregates information from neighbors with attention. Scores are
+    softmax-normalized per head over each source node's outgoing edges
+    and messages are summed with index_add_, so a layer is a fixed
+    number of vectorized kernels regardless of edge count.
     """
     
     def __init__(
@@ -101,6 +152,8 @@ class GraphAttentionLayer(nn.Module):
         dropout: float = 0.1
     ):
         super().__init__()
+        if d_node % num_heads != 0:
+            raise ValueError(f"d_node ({d_node}) must be divisible by num_heads ({num_heads})")
         self.num_heads = num_heads
         self.head_dim = d_node // num_heads
         
@@ -147,26 +200,25 @@ class GraphAttentionLayer(nn.Module):
         src_nodes = edge_index[0]
         tgt_nodes = edge_index[1]
         
-        src_features = query[src_nodes]  # (num_edges, d_node)
-        tgt_features = key[tgt_nodes]    # (num_edges, d_node)
-        
-        # Attention input: source, target, edge
-        attn_input = torch.cat([src_features, tgt_features, edge_h], dim=-1)
-        attn_scores = self.attention(attn_input)  # (num_edges, num_heads)
-        
-        # Softmax over neighbors
+        # Attention input is [source query, target key, edge]; the first
+        # linear is split so the node terms are projected once per node
+        # and gathered, instead of once per edge
+        first, act, last = self.attention
+        w_src, w_tgt, w_edge = first.weight.chunk(3, dim=-1)
+        src_proj = F.linear(query, w_src)[src_nodes]  # (num_edges, d_node)
+        tgt_proj = F.linear(key, w_tgt)[tgt_nodes]    # (num_edges, d_node)
+        edge_proj = F.linear(edge_h, w_edge, first.bias)
+        attn_scores = last(act(src_proj + tgt_proj + edge_proj))  # (num_edges, num_heads)
+        
+        # Softmax over each source node's neighbors, per head
         attn_scores = F.leaky_relu(attn_scores, 0.2)
+        attn_weights = segment_softmax(attn_scores, src_nodes, num_nodes)
         
-        # Aggregate with attention
-        tgt_values = value[tgt_nodes]  # (num_edges, d_node)
-        
-        # Weighted aggregation (simplified - in practice use scatter)
-        output = torch.zeros_like(node_features)
-        attn_weights = F.softmax(attn_scores.mean(dim=-1), dim=0)
-        
-        for i in range(edge_index.shape[1]):
-            src = src_nodes[i]
-            output[src] = output[src] + attn_weights[i] * tgt_values[i]
+        # Per-head weighted aggregation of neighbor values
+        tgt_values = value[tgt_nodes].view(-1, self.num_heads, self.head_dim)
+        messages = (attn_weights.unsqueeze(-1) * tgt_values).view(-1, self.num_heads * self.head_dim)
+        output = torch.zeros_like(h)
+        output.index_add_(0, src_nodes, messages)
         
         # Residual + norm
         output = self.layer_norm(h + self.dropout(output))
@@ -245,9 +297,72 @@ class KnowledgeExtractor(nn.Module):
         return relation_id.item(), confidence.mean().item(), relation_emb
 
 
+@dataclass
+class CSRAdjacency:
+    """
+    Compressed sparse row adjacency.
+    
+    Outgoing edges of node i are col_index[row_ptr[i]:row_ptr[i + 1]],
+    with relation ids (rows of a relation embedding table) alongside.
+    """
+    row_ptr: torch.Tensor       # (num_nodes + 1,)
+    col_index: torch.Tensor     # (num_edges,)
+    relation_ids: torch.Tensor  # (num_edges,)
+    
+    @classmethod
+    def from_edge_index(
+        cls,
+        edge_index: torch.Tensor,
+        relation_ids: torch.Tensor,
+        num_nodes: int
+    ) -> "CSRAdjacency":
+        src, tgt = edge_index
+        order = torch.argsort(src, stable=True)
+        counts = torch.bincount(src, minlength=num_nodes)
+        row_ptr = torch.zeros(num_nodes + 1, dtype=torch.long, device=src.device)
+        row_ptr[1:] = counts.cumsum(0)
+        return cls(row_ptr, tgt[order], relation_ids[order])
+    
+    @classmethod
+    def from_dict(
+        cls,
+        adjacency: Dict[int, List[Tuple[int, torch.Tensor]]],
+        num_nodes: int,
+        device: torch.device
+    ) -> Tuple["CSRAdjacency", Optional[torch.Tensor]]:
+        """Convert a node -> [(neighbor, edge_embedding)] dict; returns the CSR and its per-edge table."""
+        src, tgt, edge_embs = [], [], []
+        for node_idx, neighbors in adjacency.items():
+            for neighbor_idx, edge_emb in neighbors:
+                if node_idx < num_nodes and neighbor_idx < num_nodes:
+                    src.append(node_idx)
+                    tgt.append(neighbor_idx)
+                    edge_embs.append(edge_emb.reshape(-1))
+        
+        edge_index = torch.tensor([src, tgt], dtype=torch.long, device=device).view(2, -1)
+        table = torch.stack(edge_embs) if edge_embs else None
+        ids = torch.arange(len(src), device=device)
+        return cls.from_edge_index(edge_index, ids, num_nodes), table
+    
+    def gather(self, nodes: torch.Tensor) -> torch.Tensor:
+        """Positions (into col_index/relation_ids) of all outgoing edges of nodes."""
+        starts = self.row_ptr[nodes]
+        counts = self.row_ptr[nodes + 1] - starts
+        offsets = counts.cumsum(0) - counts
+        total = int(counts.sum())
+        return (
+            torch.arange(total, device=nodes.device)
+            - torch.repeat_interleave(offsets, counts, output_size=total)
+            + torch.repeat_interleave(starts, counts, output_size=total)
+        )
+
+
 class MultiHopReasoner(nn.Module):
     """
     Reasons over the knowledge graph with multi-hop attention.
+    
+    Each hop gathers every outgoing edge of the visited set from a CSR
+    adjacency and scores all candidates in a single MLP call.
     """
     
     def __init__(self, d_node: int, d_edge: int, max_hops: int = 3):
@@ -275,47 +390,57 @@ class MultiHopReasoner(nn.Module):
         self,
         query_node: torch.Tensor,
         graph_nodes: torch.Tensor,  # (num_nodes, d_node)
-        adjacency: Dict[int, List[Tuple[int, torch.Tensor]]]  # node -> [(neighbor, edge)]
+        adjacency: Union[CSRAdjacency, Dict[int, List[Tuple[int, torch.Tensor]]]],
+        relation_table: Optional[torch.Tensor] = None,  # (num_relations, d_edge)
+        start_node: int = 0
     ) -> Dict[str, Any]:
         """
         Multi-hop reasoning from query node.
+        
+        Args:
+            query_node: (1, d_node) embedding of the start node
+            graph_nodes: (num_nodes, d_node) node features
+            adjacency: CSRAdjacency, or a node -> [(neighbor, edge_embedding)] dict
+            relation_table: Embeddings indexed by adjacency.relation_ids
+            start_node: Index of the start node
         """
+        if not isinstance(adjacency, CSRAdjacency):
+            adjacency, relation_table = CSRAdjacency.from_dict(
+                adjacency, graph_nodes.shape[0], graph_nodes.device
+            )
+        
         current = query_node
         path_embeddings = [current]
-        visited = {0}  # Start node
+        visited = {start_node}
         attention_history = []
         
         for hop in range(self.max_hops):
-            # Score neighbors
-            neighbors = []
-            scores = []
-            
-            for node_idx in visited:
-                if node_idx in adjacency:
-                    for neighbor_idx, edge_emb in adjacency[node_idx]:
-                        if neighbor_idx < graph_nodes.shape[0]:
-                            neighbor_emb = graph_nodes[neighbor_idx]
-                            combined = torch.cat([current, neighbor_emb, edge_emb], dim=-1)
-                            score = self.neighbor_scorer(combined)
-                            neighbors.append((neighbor_idx, neighbor_emb))
-                            scores.append(score)
-            
-            if not neighbors:
+            # Gather all outgoing edges of the visited set
+            frontier = torch.tensor(sorted(visited), dtype=torch.long, device=graph_nodes.device)
+            edges = adjacency.gather(frontier)
+            if len(edges) == 0:
                 break
             
+            # Score every candidate in one call
+            neighbor_ids = adjacency.col_index[edges]
+            neighbor_embs = graph_nodes[neighbor_ids]
+            edge_embs = relation_table[adjacency.relation_ids[edges]]
+            combined = torch.cat([current.expand(len(edges), -1), neighbor_embs, edge_embs], dim=-1)
+            scores = self.neighbor_scorer(combined).squeeze(-1)
+            
             # Select best neighbor
-            scores_tensor = torch.cat(scores)
-            best_idx = scores_tensor.argmax()
-            next_node_idx, next_emb = neighbors[best_idx]
+            best_idx = int(scores.argmax())
+            next_node_idx = int(neighbor_ids[best_idx])
+            next_emb = neighbor_embs[best_idx]
             
             # Update state
-            current = self.hop_controller(next_emb.squeeze(0), current.squeeze(0)).unsqueeze(0)
+            current = self.hop_controller(next_emb, current.squeeze(0)).unsqueeze(0)
             path_embeddings.append(current)
             visited.add(next_node_idx)
             attention_history.append({
                 "hop": hop,
                 "node": next_node_idx,
-                "score": scores_tensor[best_idx].item()
+                "score": scores[best_idx].item()
             })
         
         # Aggregate path
@@ -341,6 +466,11 @@ class SemanticKnowledgeGraph(nn.Module):
     
     Maintains a graph of concepts and relations,
     enabling semantic reasoning and memory.
+    
+    Node and edge tensors live in growable buffers; mutations only mark
+    rows dirty and the next query materializes just the new rows. In eval
+    mode the GNN output is cached and only the k-hop neighborhood of
+    changed nodes (k = number of GNN layers) is recomputed.
     """
     
     def __init__(self, config: Optional[SemanticKGConfig] = None):
@@ -386,10 +516,28 @@ class SemanticKnowledgeGraph(nn.Module):
         self.adjacency: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
         self.node_counter = 0
         
-        # Tensor storage for GNN
+        # Tensor storage for GNN (views into the growable buffers below)
         self.node_embeddings: Optional[torch.Tensor] = None
         self.edge_index: Optional[torch.Tensor] = None
         self.edge_embeddings: Optional[torch.Tensor] = None
+        
+        # Row i of the node tensors belongs to _node_order[i]
+        self.id_to_idx: Dict[str, int] = {}
+        self._node_order: List[str] = []
+        self._node_buffer: Optional[torch.Tensor] = None
+        self._edge_index_buffer: Optional[torch.Tensor] = None  # (2, capacity)
+        self._edge_buffer: Optional[torch.Tensor] = None
+        self._edge_relation_buffer: Optional[torch.Tensor] = None
+        self.edge_relation_ids: Optional[torch.Tensor] = None
+        self._csr: Optional[CSRAdjacency] = None  # Rebuilt lazily when edges change
+        self._nodes_built = 0  # Dirty range is [built, len) for nodes and edges
+        self._edges_built = 0
+        self._num_edge_rows = 0
+        
+        # Cached GNN output and the rows whose neighborhood changed since
+        self._gnn_cache: Optional[torch.Tensor] = None
+        self._gnn_cache_version: Optional[int] = None
+        self._gnn_dirty: Set[int] = set()
     
     def add_concept(
         self,
@@ -416,11 +564,23 @@ class SemanticKnowledgeGraph(nn.Module):
             importance=importance
         )
         
-        self.nodes[node_id] = node
-        self._invalidate_cache()
+        self._register_node(node)
         
         return node_id
     
+    def _register_node(self, node: KnowledgeNode):
+        """Store a node and reserve its tensor row."""
+        if node.id in self.id_to_idx:
+            # Replacing a node rewrites its row, so rebuild from scratch
+            self.nodes[node.id] = node
+            self._invalidate_cache()
+            return
+        
+        self.nodes[node.id] = node
+        self.id_to_idx[node.id] = len(self._node_order)
+        self._gnn_dirty.add(len(self._node_order))
+        self._node_order.append(node.id)
+    
     def add_relation(
         self,
         source_id: str,
@@ -447,55 +607,187 @@ class SemanticKnowledgeGraph(nn.Module):
         
         self.edges.append(edge)
         self.adjacency[source_id].append((target_id, relation_type))
-        self._invalidate_cache()
+        
+        # Attention is over the source's outgoing edges, so only the source changes
+        self._gnn_dirty.add(self.id_to_idx[source_id])
         
         return True
     
     def _invalidate_cache(self):
-        """Invalidate cached tensors."""
+        """Drop all cached tensors; the next query rebuilds them."""
         self.node_embeddings = None
         self.edge_index = None
         self.edge_embeddings = None
+        self._node_buffer = None
+        self._edge_index_buffer = None
+        self._edge_buffer = None
+        self._edge_relation_buffer = None
+        self.edge_relation_ids = None
+        self._csr = None
+        self._nodes_built = 0
+        self._edges_built = 0
+        self._num_edge_rows = 0
+        self._gnn_cache = None
+        self._gnn_dirty = set()
+        
+        self.id_to_idx = {}
+        self._node_order = list(self.nodes)
+        for i, node_id in enumerate(self._node_order):
+            self.id_to_idx[node_id] = i
     
     def _build_tensors(self, device: torch.device):
-        """Build tensors for GNN operations."""
-        if self.node_embeddings is not None:
-            return
-        
+        """Materialize nodes and edges added since the last call."""
         if not self.nodes:
             return
         
-        # Node embeddings
-        node_list = list(self.nodes.values())
-        node_embs = np.stack([n.embedding for n in node_list])
-        self.node_embeddings = torch.tensor(node_embs, dtype=torch.float32, device=device)
+        if self._node_buffer is not None and self._node_buffer.device != device:
+            self._invalidate_cache()
+        
+        # New node rows
+        new_nodes = self._node_order[self._nodes_built:]
+        if new_nodes:
+            rows = torch.tensor(
+                np.stack([self.nodes[node_id].embedding for node_id in new_nodes]),
+                dtype=torch.float32,
+                device=device
+            )
+            self._node_buffer = _append_rows(self._node_buffer, self._nodes_built, rows)
+            self._nodes_built += len(new_nodes)
+        
+        # New edge rows
+        new_edges = [
+            edge for edge in self.edges[self._edges_built:]
+            if edge.source_id in self.id_to_idx and edge.target_id in self.id_to_idx
+        ]
+        self._edges_built = len(self.edges)
+        if new_edges:
+            pairs = torch.tensor(
+                [[self.id_to_idx[e.source_id] for e in new_edges],
+                 [self.id_to_idx[e.target_id] for e in new_edges]],
+                dtype=torch.long,
+                device=device
+            )
+            rows = torch.tensor(
+                np.stack([e.embedding for e in new_edges]),
+                dtype=torch.float32,
+                device=device
+            )
+            relation_ids = torch.tensor(
+                [self.relation_embedding.get_relation_id(e.relation_type) for e in new_edges],
+                dtype=torch.long,
+                device=device
+            )
+            self._edge_index_buffer = _append_rows(self._edge_index_buffer, self._num_edge_rows, pairs, dim=1)
+            self._edge_buffer = _append_rows(self._edge_buffer, self._num_edge_rows, rows)
+            self._edge_relation_buffer = _append_rows(self._edge_relation_buffer, self._num_edge_rows, relation_ids)
+            self._num_edge_rows += len(new_edges)
+            self._csr = None
+        
+        self.node_embeddings = self._node_buffer[:self._nodes_built]
+        if self._num_edge_rows:
+            self.edge_index = self._edge_index_buffer[:, :self._num_edge_rows]
+            self.edge_embeddings = self._edge_buffer[:self._num_edge_rows]
+            self.edge_relation_ids = self._edge_relation_buffer[:self._num_edge_rows]
+    
+    def csr_adjacency(self, device: torch.device = torch.device("cpu")) -> CSRAdjacency:
+        """CSR view of the graph (rows follow id_to_idx), rebuilt only after edges change."""
+        self._build_tensors(device)
+        if self._csr is None or self._csr.row_ptr.shape[0] != self._nodes_built + 1:
+            if self.edge_index is None:
+                edge_index = torch.zeros(2, 0, dtype=torch.long, device=device)
+                relation_ids = torch.zeros(0, dtype=torch.long, device=device)
+            else:
+                edge_index, relation_ids = self.edge_index, self.edge_relation_ids
+            self._csr = CSRAdjacency.from_edge_index(edge_index, relation_ids, self._nodes_built)
+        return self._csr
+    
+    def _run_gnn(
+        self,
+        node_features: torch.Tensor,
+        edge_index: torch.Tensor,
+        edge_features: torch.Tensor
+    ) -> torch.Tensor:
+        for gnn_layer in self.gnn_layers:
+            node_features = gnn_layer(node_features, edge_index, edge_features)
+        return node_features
+    
+    def _gnn_weights_version(self) -> int:
+        """Changes whenever a GNN parameter is updated in place (e.g. by an optimizer step)."""
+        return sum(p._version for p in self.gnn_layers.parameters())
+    
+    def _gnn_output(self) -> torch.Tensor:
+        """GNN node features, reusing the cached output where the graph is unchanged."""
+        if self.edge_index is None:
+            return self.node_embeddings
+        
+        if self.training or not self.config.cache_gnn_output:
+            self._gnn_cache = None
+            return self._run_gnn(self.node_embeddings, self.edge_index, self.edge_embeddings)
+        
+        num_nodes = self.node_embeddings.shape[0]
+        version = self._gnn_weights_version()
+        dirty = [i for i in self._gnn_dirty if i < num_nodes]
+        
+        if self._gnn_cache is None or self._gnn_cache_version != version \
+                or self._gnn_cache.device != self.node_embeddings.device:
+            dirty = range(num_nodes)
+        
+        if dirty:
+            with torch.no_grad():
+                cache = self.node_embeddings.new_empty(self.node_embeddings.shape)
+                if self._gnn_cache is not None and len(dirty) < num_nodes:
+                    cache[:len(self._gnn_cache)] = self._gnn_cache
+                    self._update_gnn_rows(cache, dirty)
+                else:
+                    cache = self._run_gnn(self.node_embeddings, self.edge_index, self.edge_embeddings)
+            self._gnn_cache = cache
+            self._gnn_cache_version = version
+        
+        self._gnn_dirty = set()
+        return self._gnn_cache
+    
+    def _update_gnn_rows(self, cache: torch.Tensor, dirty: List[int]):
+        """
+        Recompute the cached GNN output around dirty nodes.
+        
+        A node's output after k layers depends on nodes up to k hops along
+        its outgoing edges, so the affected rows are the dirty nodes plus
+        everything reaching them within k hops. Those rows are recomputed
+        on the subgraph of nodes within k hops downstream of them.
+        """
+        num_nodes = cache.shape[0]
+        num_layers = len(self.gnn_layers)
+        src, tgt = self.edge_index
         
-        # Node ID to index mapping
-        self.id_to_idx = {n.id: i for i, n in enumerate(node_list)}
+        affected = torch.zeros(num_nodes, dtype=torch.bool, device=cache.device)
+        affected[torch.tensor(list(dirty), device=cache.device)] = True
+        for _ in range(num_layers):
+            affected[src[affected[tgt]]] = True
         
-        # Edge index and embeddings
-        if self.edges:
-            src_indices = []
-            tgt_indices = []
-            edge_embs = []
-            
-            for edge in self.edges:
-                if edge.source_id in self.id_to_idx and edge.target_id in self.id_to_idx:
-                    src_indices.append(self.id_to_idx[edge.source_id])
-                    tgt_indices.append(self.id_to_idx[edge.target_id])
-                    edge_embs.append(edge.embedding)
-            
-            if src_indices:
-                self.edge_index = torch.tensor(
-                    [src_indices, tgt_indices],
-                    dtype=torch.long,
-                    device=device
-                )
-                self.edge_embeddings = torch.tensor(
-                    np.stack(edge_embs),
-                    dtype=torch.float32,
-                    device=device
-                )
+        if affected.sum() * 2 >= num_nodes:
+            cache.copy_(self._run_gnn(self.node_embeddings, self.edge_index, self.edge_embeddings))
+            return
+        
+        # Nodes within k - 1 hops keep all their outgoing edges
+        inner = affected.clone()
+        for _ in range(num_layers - 1):
+            inner[tgt[inner[src]]] = True
+        edge_mask = inner[src]
+        needed = inner.clone()
+        needed[tgt[edge_mask]] = True
+        
+        # Relabel the subgraph and run the GNN on it
+        sub_nodes = needed.nonzero(as_tuple=True)[0]
+        local = torch.full((num_nodes,), -1, dtype=torch.long, device=cache.device)
+        local[sub_nodes] = torch.arange(len(sub_nodes), device=cache.device)
+        sub_out = self._run_gnn(
+            self.node_embeddings[sub_nodes],
+            local[self.edge_index[:, edge_mask]],
+            self.edge_embeddings[edge_mask]
+        )
+        
+        rows = affected.nonzero(as_tuple=True)[0]
+        cache[rows] = sub_out[local[rows]]
     
     def forward(
         self,
@@ -516,15 +808,7 @@ class SemanticKnowledgeGraph(nn.Module):
         )
         
         # Apply GNN layers
-        node_features = self.node_embeddings
-        
-        if self.edge_index is not None and self.edge_embeddings is not None:
-            for gnn_layer in self.gnn_layers:
-                node_features = gnn_layer(
-                    node_features,
-                    self.edge_index,
-                    self.edge_embeddings
-                )
+        node_features = self._gnn_output()
         
         # Find most similar nodes
         similarities = F.cosine_similarity(
@@ -537,12 +821,11 @@ class SemanticKnowledgeGraph(nn.Module):
         top_scores, top_indices = similarities.topk(top_k, dim=-1)
         
         # Get node info
-        node_list = list(self.nodes.values())
         retrieved_nodes = []
         for i in range(top_k):
             idx = top_indices[0, i].item()
-            if idx < len(node_list):
-                node = node_list[idx]
+            if idx < len(self._node_order):
+                node = self.nodes[self._node_order[idx]]
                 node.access_count += 1
                 retrieved_nodes.append({
                     "id": node.id,
@@ -557,25 +840,12 @@ class SemanticKnowledgeGraph(nn.Module):
             best_node_idx = top_indices[0, 0].item()
             best_node_emb = node_features[best_node_idx].unsqueeze(0)
             
-            # Build adjacency for reasoner
-            idx_adjacency = {}
-            for src_id, neighbors in self.adjacency.items():
-                if src_id in self.id_to_idx:
-                    src_idx = self.id_to_idx[src_id]
-                    idx_adjacency[src_idx] = []
-                    for tgt_id, rel_type in neighbors:
-                        if tgt_id in self.id_to_idx:
-                            tgt_idx = self.id_to_idx[tgt_id]
-                            rel_id = self.relation_embedding.get_relation_id(rel_type)
-                            rel_emb = self.relation_embedding(
-                                torch.tensor([rel_id], device=device)
-                            )
-                            idx_adjacency[src_idx].append((tgt_idx, rel_emb.squeeze(0)))
-            
             reasoning_result = self.reasoner.reason(
                 best_node_emb,
                 node_features,
-                idx_adjacency
+                self.csr_adjacency(device),
+                relation_table=self.relation_embedding.embeddings.weight,
+                start_node=best_node_idx
             )
         
         return {
@@ -687,7 +957,12 @@ class SemanticKnowledgeGraph(nn.Module):
                     importance=data["importance"],
                     access_count=data["access_count"]
                 )
-                self.nodes[node_id] = node
+                self._register_node(node)
+                
+                # Keep new ids from colliding with loaded ones
+                suffix = node_id.rsplit("_", 1)[-1]
+                if suffix.isdigit():
+                    self.node_counter = max(self.node_counter, int(suffix))
         
         if (path / "edges.json").exists():
             with open(path / "edges.json") as f:
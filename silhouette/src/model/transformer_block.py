@@ -5,11 +5,12 @@ Efficient Transformer implementation featuring:
 - Grouped Query Attention (GQA) for memory efficiency
 - Rotary Position Embeddings (RoPE) for position encoding
 - FlashAttention-2 support when available
+- Fused scaled_dot_product_attention path that never copies KV heads
 - Pre-norm architecture (more stable training)
 """
 
 import math
-from typing import Optional, Tuple
+from typing import Optional, Tuple, Dict
 from dataclasses import dataclass
 
 import torch
@@ -25,6 +26,11 @@ except ImportError:
     FLASH_ATTN_AVAILABLE = False
     print("[NANOSILHOUETTE] flash-attn not found. Using standard attention.")
 
+# scaled_dot_product_attention broadcasts grouped KV heads itself from torch 2.5
+SDPA_ENABLE_GQA = tuple(int(v) for v in torch.__version__.split(".")[:2]) >= (2, 5)
+
+ATTENTION_BACKENDS = ("auto", "flash", "sdpa", "eager")
+
 
 @dataclass
 class TransformerConfig:
@@ -40,6 +46,9 @@ class TransformerConfig:
     hidden_dropout: float = 0.0
     rms_norm_eps: float = 1e-5
     use_flash_attention: bool = True
+    # "auto": flash-attn when usable, else sdpa; "eager" is the explicit
+    # matmul/softmax reference path that repeats KV heads
+    attention_backend: str = "auto"
     bias: bool = False
 
 
@@ -85,25 +94,76 @@ class RotaryEmbedding(nn.Module):
         )
         self.register_buffer("inv_freq", inv_freq, persistent=False)
         
+        # Cast copies of the float32 tables: (device, dtype) -> (cos, sin)
+        self._tables: Dict[Tuple[torch.device, torch.dtype], Tuple[torch.Tensor, torch.Tensor]] = {}
+        
         # Build cos/sin cache
         self._set_cos_sin_cache(max_position_embeddings, device)
     
     def _set_cos_sin_cache(self, seq_len: int, device: Optional[torch.device] = None):
+        # Always float32: half-precision positions lose integer precision past 2048
         self.max_seq_len_cached = seq_len
-        t = torch.arange(seq_len, device=device, dtype=self.inv_freq.dtype)
-        freqs = torch.outer(t, self.inv_freq)
+        inv_freq = 1.0 / (
+            self.base ** (torch.arange(0, self.dim, 2, device=device, dtype=torch.float32) / self.dim)
+        )
+        t = torch.arange(seq_len, device=device, dtype=torch.float32)
+        freqs = torch.outer(t, inv_freq)
         emb = torch.cat((freqs, freqs), dim=-1)
         self.register_buffer("cos_cached", emb.cos(), persistent=False)
         self.register_buffer("sin_cached", emb.sin(), persistent=False)
+        self._tables = {}
     
-    def forward(self, x: torch.Tensor, seq_len: int) -> Tuple[torch.Tensor, torch.Tensor]:
-        # Extend cache if needed
-        if seq_len > self.max_seq_len_cached:
-            self._set_cos_sin_cache(seq_len, x.device)
+    def _table(self, needed: int, device: torch.device, dtype: torch.dtype) -> Tuple[torch.Tensor, torch.Tensor]:
+        """cos/sin tables covering `needed` positions on device in dtype."""
+        if needed > self.max_seq_len_cached:
+            # Grow geometrically so decoding past the limit rebuilds rarely
+            self._set_cos_sin_cache(max(needed, 2 * self.max_seq_len_cached), self.cos_cached.device)
+        
+        key = (device, dtype)
+        if key not in self._tables:
+            self._tables[key] = (
+                self.cos_cached.to(device=device, dtype=dtype),
+                self.sin_cached.to(device=device, dtype=dtype)
+            )
+        return self._tables[key]
+    
+    def _apply(self, fn, *args, **kwargs):
+        # Tables follow the module on .to()/.half(); drop the cast copies and
+        # keep the master tables in float32
+        self._tables = {}
+        module = super()._apply(fn, *args, **kwargs)
+        if self.cos_cached.dtype != torch.float32:
+            self._set_cos_sin_cache(self.max_seq_len_cached, self.cos_cached.device)
+        return module
+    
+    def forward(
+        self,
+        x: torch.Tensor,
+        seq_len: Optional[int] = None,
+        position_ids: Optional[torch.Tensor] = None,
+        offset: int = 0
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        cos/sin for the positions being rotated, in x's dtype and device.
+        
+        Args:
+            x: Tensor whose dtype/device the tables are returned in
+            seq_len: Number of positions, starting at offset
+            position_ids: Optional (batch, seq) absolute positions; if given,
+                returns (batch, seq, dim) tables gathered per row
+            offset: First position (e.g. the cached length while decoding)
         
+        Returns:
+            (cos, sin), each (seq_len, dim) or (batch, seq, dim)
+        """
+        if position_ids is not None:
+            cos, sin = self._table(int(position_ids.max()) + 1, x.device, x.dtype)
+            return cos[position_ids], sin[position_ids]
+        
+        cos, sin = self._table(offset + seq_len, x.device, x.dtype)
         return (
-            self.cos_cached[:seq_len],
-            self.sin_cached[:seq_len]
+            cos[offset:offset + seq_len],
+            sin[offset:offset + seq_len]
         )
 
 
@@ -122,7 +182,8 @@ def apply_rotary_pos_emb(
 ) -> Tuple[torch.Tensor, torch.Tensor]:
     """Apply rotary position embeddings to queries and keys."""
     # q/k: (batch, heads, seq, head_dim)
-    # cos/sin: (seq, dim) where dim = head_dim
+    # cos/sin: (seq, dim) where dim = head_dim, or (batch, seq, dim)
+    # when gathered per row from position_ids
     
     # Get the rotary dimension (might be smaller than head_dim)
     rotary_dim = cos.shape[-1]
@@ -133,9 +194,12 @@ def apply_rotary_pos_emb(
     k_rot = k[..., :rotary_dim]
     k_pass = k[..., rotary_dim:]
     
-    # Reshape cos/sin: (seq, dim) -> (1, 1, seq, dim)
-    cos = cos.unsqueeze(0).unsqueeze(0)
-    sin = sin.unsqueeze(0).unsqueeze(0)
+    # Reshape cos/sin: (seq, dim) -> (1, 1, seq, dim), (batch, seq, dim) -> (batch, 1, seq, dim)
+    if cos.dim() == 2:
+        cos = cos.unsqueeze(0)
+        sin = sin.unsqueeze(0)
+    cos = cos.unsqueeze(1)
+    sin = sin.unsqueeze(1)
     
     # Apply rotation
     q_embed = (q_rot * cos) + (rotate_half(q_rot) * sin)
@@ -177,7 +241,13 @@ class GroupedQueryAttention(nn.Module):
         )
         
         self.attention_dropout = config.attention_dropout
-        self.use_flash = config.use_flash_attention and FLASH_ATTN_AVAILABLE
+        if config.attention_backend not in ATTENTION_BACKENDS:
+            raise ValueError(f"attention_backend must be one of {ATTENTION_BACKENDS}")
+        self.attention_backend = config.attention_backend
+        self.use_flash = (
+            config.use_flash_attention and FLASH_ATTN_AVAILABLE
+            and config.attention_backend in ("auto", "flash")
+        )
     
     def forward(
         self,
@@ -187,6 +257,18 @@ class GroupedQueryAttention(nn.Module):
         past_key_value: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
         use_cache: bool = False
     ) -> Tuple[torch.Tensor, Optional[Tuple[torch.Tensor, torch.Tensor]]]:
+        """
+        Args:
+            hidden_states: (batch, seq, d_model)
+            attention_mask: Optional additive mask broadcastable to
+                (batch, heads, seq, kv_len); replaces the causal mask
+            position_ids: Optional (batch, seq) absolute positions for RoPE;
+                defaults to positions following the cached length
+            past_key_value: Either a (keys, values) tuple that gets extended
+                by concatenation, or a cache handle with update() and
+                get_seq_length() (e.g. StaticKVCacheLayer) written in place
+            use_cache: Return the updated cache
+        """
         batch, seq_len, _ = hidden_states.shape
         
         # Project to Q, K, V
@@ -199,68 +281,154 @@ class GroupedQueryAttention(nn.Module):
         k = k.view(batch, seq_len, self.num_kv_heads, self.head_dim)
         v = v.view(batch, seq_len, self.num_kv_heads, self.head_dim)
         
-        # Apply rotary embeddings
-        cos, sin = self.rotary_emb(q, seq_len)
+        # Static caches (e.g. StaticKVCacheLayer) write in place via update()
+        cache_object = past_key_value is not None and hasattr(past_key_value, "update")
+        
+        # Apply rotary embeddings (offset by cached length so new tokens
+        # are rotated at their true positions during incremental decoding;
+        # per-row position_ids cover sequences of different lengths in one batch)
+        if cache_object:
+            past_len = past_key_value.get_seq_length()
+        elif past_key_value is not None:
+            past_len = past_key_value[0].shape[2]
+        else:
+            past_len = 0
+        cos, sin = self.rotary_emb(q, seq_len, position_ids=position_ids, offset=past_len)
         q = rearrange(q, "b s h d -> b h s d")
         k = rearrange(k, "b s h d -> b h s d")
         q, k = apply_rotary_pos_emb(q, k, cos, sin)
         
         # Handle KV cache
-        if past_key_value is not None:
+        v = rearrange(v, "b s h d -> b h s d")
+        if cache_object:
+            k, v = past_key_value.update(k, v)
+        elif past_key_value is not None:
             past_k, past_v = past_key_value
             k = torch.cat([past_k, k], dim=2)
-            v = torch.cat([past_v, rearrange(v, "b s h d -> b h s d")], dim=2)
-        else:
-            v = rearrange(v, "b s h d -> b h s d")
+            v = torch.cat([past_v, v], dim=2)
         
         if use_cache:
-            new_cache = (k, v)
+            new_cache = past_key_value if cache_object else (k, v)
         else:
             new_cache = None
         
+        # Compute attention
+        if self.use_flash and q.is_cuda and attention_mask is None:
+            attn_output = self._flash_attention(q, k, v)
+        elif self.attention_backend == "eager":
+            attn_output = self._eager_attention(q, k, v, attention_mask)
+        else:
+            attn_output = self._sdpa_attention(q, k, v, attention_mask)
+        
+        # Output projection
+        attn_output = self.o_proj(attn_output)
+        
+        return attn_output, new_cache
+    
+    def _causal_mask(self, seq_len: int, kv_len: int, device: torch.device) -> torch.Tensor:
+        """Boolean (seq, kv_len) mask; the new queries sit at the end of the keys."""
+        return torch.ones(seq_len, kv_len, dtype=torch.bool, device=device).tril(kv_len - seq_len)
+    
+    def _flash_attention(self, q: torch.Tensor, k: torch.Tensor, v: torch.Tensor) -> torch.Tensor:
+        # FlashAttention expects (batch, seq, heads, dim) and handles fewer KV
+        # heads natively; causal masking is aligned to the end of the keys
+        q = rearrange(q, "b h s d -> b s h d")
+        k = rearrange(k, "b h s d -> b s h d")
+        v = rearrange(v, "b h s d -> b s h d")
+        
+        attn_output = flash_attn_func(
+            q, k, v,
+            dropout_p=self.attention_dropout if self.training else 0.0,
+            causal=True
+        )
+        return rearrange(attn_output, "b s h d -> b s (h d)")
+    
+    def _sdpa_attention(
+        self,
+        q: torch.Tensor,
+        k: torch.Tensor,
+        v: torch.Tensor,
+        attention_mask: Optional[torch.Tensor]
+    ) -> torch.Tensor:
+        """
+        Fused attention without materializing repeated KV heads.
+        
+        Query heads sharing a KV head are either broadcast by SDPA itself
+        (torch >= 2.5) or folded into the query sequence dimension.
+        """
+        batch, _, seq_len, _ = q.shape
+        kv_len = k.shape[2]
+        dropout_p = self.attention_dropout if self.training else 0.0
+        
+        # Masking: explicit mask replaces causal; a full prefill is plain causal;
+        # a single decode token sees every key; a chunk after a cache needs an offset mask
+        is_causal = False
+        mask = attention_mask
+        if mask is None and seq_len > 1:
+            if seq_len == kv_len:
+                is_causal = True
+            else:
+                mask = self._causal_mask(seq_len, kv_len, q.device)
+        
+        if self.num_groups == 1 or SDPA_ENABLE_GQA:
+            attn_output = F.scaled_dot_product_attention(
+                q, k, v,
+                attn_mask=mask,
+                dropout_p=dropout_p,
+                is_causal=is_causal,
+                **({"enable_gqa": True} if self.num_groups > 1 else {})
+            )
+            return rearrange(attn_output, "b h s d -> b s (h d)")
+        
+        # Fold: (b, kv_heads * groups, s, d) -> (b, kv_heads, groups * s, d)
+        q = q.reshape(batch, self.num_kv_heads, self.num_groups * seq_len, self.head_dim)
+        if is_causal:
+            mask = self._causal_mask(seq_len, kv_len, q.device)
+        if mask is not None:
+            if mask.dim() == 2:
+                mask = mask.repeat(self.num_groups, 1)
+            else:
+                mask = mask.expand(mask.shape[0], self.num_heads, seq_len, kv_len).reshape(
+                    mask.shape[0], self.num_kv_heads, self.num_groups * seq_len, kv_len
+                )
+        
+        attn_output = F.scaled_dot_product_attention(q, k, v, attn_mask=mask, dropout_p=dropout_p)
+        attn_output = attn_output.view(batch, self.num_heads, seq_len, self.head_dim)
+        return rearrange(attn_output, "b h s d -> b s (h d)")
+    
+    def _eager_attention(
+        self,
+        q: torch.Tensor,
+        k: torch.Tensor,
+        v: torch.Tensor,
+        attention_mask: Optional[torch.Tensor]
+    ) -> torch.Tensor:
+        """Reference path: repeat KV heads, explicit mask, matmul/softmax/matmul."""
+        seq_len = q.shape[2]
+        
         # Expand KV for GQA: repeat each KV head for its group of query heads
         k = repeat(k, "b h s d -> b (h g) s d", g=self.num_groups)
         v = repeat(v, "b h s d -> b (h g) s d", g=self.num_groups)
         
-        # Compute attention
-        if self.use_flash and q.is_cuda:
-            # FlashAttention expects (batch, seq, heads, dim)
-            q = rearrange(q, "b h s d -> b s h d")
-            k = rearrange(k, "b h s d -> b s h d")
-            v = rearrange(v, "b h s d -> b s h d")
-            
-            attn_output = flash_attn_func(
-                q, k, v,
-                dropout_p=self.attention_dropout if self.training else 0.0,
-                causal=True
+        scale = 1.0 / math.sqrt(self.head_dim)
+        attn_weights = torch.matmul(q, k.transpose(-2, -1)) * scale
+        
+        # Causal mask
+        if attention_mask is None:
+            kv_len = k.shape[2]
+            causal_mask = torch.triu(
+                torch.full((seq_len, kv_len), float("-inf"), device=q.device),
+                diagonal=kv_len - seq_len + 1
             )
-            attn_output = rearrange(attn_output, "b s h d -> b s (h d)")
+            attn_weights = attn_weights + causal_mask
         else:
-            # Standard scaled dot-product attention
-            scale = 1.0 / math.sqrt(self.head_dim)
-            attn_weights = torch.matmul(q, k.transpose(-2, -1)) * scale
-            
-            # Causal mask
-            if attention_mask is None:
-                kv_len = k.shape[2]
-                causal_mask = torch.triu(
-                    torch.full((seq_len, kv_len), float("-inf"), device=q.device),
-                    diagonal=kv_len - seq_len + 1
-                )
-                attn_weights = attn_weights + causal_mask
-            else:
-                attn_weights = attn_weights + attention_mask
-            
-            attn_weights = F.softmax(attn_weights, dim=-1, dtype=torch.float32).to(q.dtype)
-            attn_weights = F.dropout(attn_weights, p=self.attention_dropout, training=self.training)
-            
-            attn_output = torch.matmul(attn_weights, v)
-            attn_output = rearrange(attn_output, "b h s d -> b s (h d)")
+            attn_weights = attn_weights + attention_mask
         
-        # Output projection
-        attn_output = self.o_proj(attn_output)
+        attn_weights = F.softmax(attn_weights, dim=-1, dtype=torch.float32).to(q.dtype)
+        attn_weights = F.dropout(attn_weights, p=self.attention_dropout, training=self.training)
         
-        return attn_output, new_cache
+        attn_output = torch.matmul(attn_weights, v)
+        return rearrange(attn_output, "b h s d -> b s (h d)")
 
 
 class SwiGLU(nn.Module):
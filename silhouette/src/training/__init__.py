@@ -1,6 +1,6 @@
 # NANOSILHOUETTE Training Package
 from .losses import NanoSilhouetteLoss
-from .data_loader import TextDataset, StreamingTextDataset, create_dataloader
+from .data_loader import TextDataset, StreamingDataset as StreamingTextDataset, create_dataloader
 from .trainer import Trainer, TrainerConfig
 from .memory_utils import (
     GradientCheckpointWrapper,
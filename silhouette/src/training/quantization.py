@@ -5,10 +5,15 @@ Implements memory-efficient quantization for training and inference:
 - 4-bit quantization (NF4/FP4)
 - 8-bit quantization
 - QLoRA compatibility
+- Native (pure PyTorch, CPU-friendly) weight-only int8/int4 when
+  bitsandbytes is unavailable
 """
 import torch
 import torch.nn as nn
-from typing import Optional, Dict, Any, Union
+import torch.nn.functional as F
+from pathlib import Path
+from collections import Counter
+from typing import Optional, Dict, Any, Union, Callable
 from dataclasses import dataclass
 
 # Check for bitsandbytes
@@ -34,6 +39,13 @@ class QuantizationConfig:
     load_in_8bit: bool = False
     llm_int8_threshold: float = 6.0
     
+    # Backend: "auto" (bitsandbytes if installed, else native),
+    # "bitsandbytes" or "native" (pure PyTorch weight-only int8/int4)
+    backend: str = "auto"
+    native_group_size: int = 128  # Input columns per int4 scale/zero
+    min_in_features: int = 256    # Only quantize large layers
+    skip_modules: tuple = ()      # Name fragments of Linears to keep in full precision
+    
     # QLoRA settings
     use_lora: bool = False
     lora_r: int = 8
@@ -115,6 +127,112 @@ def quantize_linear_8bit(
     return quantized
 
 
+class NativeQuantizedLinear(nn.Module):
+    """
+    Weight-only quantized Linear in pure PyTorch (no bitsandbytes).
+    
+    - bits=8: symmetric per-output-channel int8. The scale is applied to
+      the matmul output, so the weight is only cast on the fly.
+    - bits=4: asymmetric group-wise (group_size input columns share a
+      scale and zero point), two values packed per uint8 and dequantized
+      on the fly.
+    
+    Activations and bias stay in the input dtype.
+    """
+    
+    def __init__(
+        self,
+        in_features: int,
+        out_features: int,
+        bias: bool = True,
+        bits: int = 8,
+        group_size: int = 128,
+        device: Optional[torch.device] = None
+    ):
+        super().__init__()
+        if bits not in (4, 8):
+            raise ValueError(f"bits must be 4 or 8, got {bits}")
+        
+        self.in_features = in_features
+        self.out_features = out_features
+        self.bits = bits
+        
+        if bits == 8:
+            self.group_size = in_features
+            self.register_buffer("qweight", torch.zeros(out_features, in_features, dtype=torch.int8, device=device))
+            self.register_buffer("scales", torch.ones(out_features, device=device))
+        else:
+            # Pad columns to whole groups of even size (two values per byte)
+            self.group_size = min(group_size, in_features)
+            self.group_size += self.group_size % 2
+            num_groups = -(-in_features // self.group_size)
+            padded = num_groups * self.group_size
+            self.register_buffer("qweight", torch.zeros(out_features, padded // 2, dtype=torch.uint8, device=device))
+            self.register_buffer("scales", torch.ones(out_features, num_groups, device=device))
+            self.register_buffer("zeros", torch.zeros(out_features, num_groups, device=device))
+        
+        if bias:
+            self.bias = nn.Parameter(torch.zeros(out_features, device=device))
+        else:
+            self.register_parameter("bias", None)
+    
+    @classmethod
+    def from_linear(cls, linear: nn.Linear, bits: int = 8, group_size: int = 128) -> "NativeQuantizedLinear":
+        """Quantize an existing Linear layer."""
+        weight = linear.weight.detach().float()
+        quantized = cls(
+            linear.in_features,
+            linear.out_features,
+            bias=linear.bias is not None,
+            bits=bits,
+            group_size=group_size,
+            device=weight.device
+        )
+        
+        if bits == 8:
+            scales = weight.abs().amax(dim=1).clamp_min(1e-8) / 127
+            quantized.qweight.copy_(torch.round(weight / scales[:, None]).clamp(-127, 127).to(torch.int8))
+            quantized.scales.copy_(scales)
+        else:
+            padded = quantized.qweight.shape[1] * 2
+            weight = F.pad(weight, (0, padded - linear.in_features))
+            groups = weight.view(linear.out_features, -1, quantized.group_size)
+            w_min = groups.amin(dim=-1)
+            scales = (groups.amax(dim=-1) - w_min).clamp_min(1e-8) / 15
+            q = torch.round((groups - w_min[..., None]) / scales[..., None]).clamp(0, 15).to(torch.uint8)
+            q = q.view(linear.out_features, -1)
+            quantized.qweight.copy_(q[:, 0::2] | (q[:, 1::2] << 4))
+            quantized.scales.copy_(scales)
+            quantized.zeros.copy_(w_min)
+        
+        if linear.bias is not None:
+            quantized.bias.data.copy_(linear.bias.detach().float())
+        return quantized
+    
+    def dequantize(self, dtype: torch.dtype = torch.float32) -> torch.Tensor:
+        """Full-precision (out_features, in_features) weight."""
+        if self.bits == 8:
+            return self.qweight.to(dtype) * self.scales.to(dtype)[:, None]
+        
+        q = torch.stack([self.qweight & 0xF, self.qweight >> 4], dim=-1).view(self.out_features, -1, self.group_size)
+        weight = q.to(dtype) * self.scales.to(dtype)[..., None] + self.zeros.to(dtype)[..., None]
+        return weight.view(self.out_features, -1)[:, :self.in_features]
+    
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        bias = self.bias.to(x.dtype) if self.bias is not None else None
+        if self.bits == 8:
+            # Per-channel scale commutes with the matmul
+            out = F.linear(x, self.qweight.to(x.dtype)) * self.scales.to(x.dtype)
+            return out + bias if bias is not None else out
+        return F.linear(x, self.dequantize(x.dtype), bias)
+    
+    def extra_repr(self) -> str:
+        return (
+            f"in_features={self.in_features}, out_features={self.out_features}, "
+            f"bias={self.bias is not None}, bits={self.bits}, group_size={self.group_size}"
+        )
+
+
 class LoRALayer(nn.Module):
     """
     Low-Rank Adaptation (LoRA) layer.
@@ -224,9 +342,46 @@ def apply_lora(
     return model
 
 
+def _replace_linears(
+    model: nn.Module,
+    convert: Callable[[nn.Linear], nn.Module],
+    min_in_features: int = 256,
+    skip_modules: tuple = ()
+) -> list:
+    """
+    Swap every eligible nn.Linear for convert(linear); returns the replaced names.
+    
+    Linears whose weight is shared with another module (e.g. an lm_head
+    tied to the token embedding) are skipped: converting them would break
+    the tie and keep a full-precision copy alongside the quantized one.
+    """
+    owners = Counter(id(p) for m in model.modules() for p in m.parameters(recurse=False))
+    targets = [
+        (name, module) for name, module in model.named_modules()
+        if isinstance(module, nn.Linear) and not isinstance(module, (LinearWithLoRA,))
+        and module.in_features >= min_in_features
+        and not any(skip in name for skip in skip_modules)
+        and owners[id(module.weight)] == 1
+    ]
+    
+    for name, module in targets:
+        parent_name = ".".join(name.split(".")[:-1])
+        module_name = name.split(".")[-1]
+        
+        parent = model
+        for part in parent_name.split("."):
+            if part:
+                parent = getattr(parent, part)
+        
+        setattr(parent, module_name, convert(module))
+    
+    return [name for name, _ in targets]
+
+
 def quantize_model(
     model: nn.Module,
-    config: Optional[QuantizationConfig] = None
+    config: Optional[QuantizationConfig] = None,
+    backend: Optional[str] = None
 ) -> nn.Module:
     """
     Apply quantization to a model based on configuration.
@@ -234,46 +389,51 @@ def quantize_model(
     Args:
         model: The model to quantize
         config: Quantization configuration
+        backend: Overrides config.backend ("auto", "bitsandbytes", "native")
     
     Returns:
         Quantized model
     """
     config = config or QuantizationConfig()
-    
-    if not BNB_AVAILABLE and (config.load_in_4bit or config.load_in_8bit):
-        print("[WARNING] bitsandbytes not available, skipping quantization")
+    backend = backend or config.backend
+    if backend not in ("auto", "bitsandbytes", "native"):
+        raise ValueError(f"Unknown quantization backend: {backend}")
+    if backend == "auto":
+        backend = "bitsandbytes" if BNB_AVAILABLE else "native"
+    
+    if backend == "bitsandbytes" and not BNB_AVAILABLE and (config.load_in_4bit or config.load_in_8bit):
+        print("[WARNING] bitsandbytes not available, skipping quantization (use backend='native')")
         return model
     
-    if config.load_in_4bit:
-        print(f"[QUANTIZATION] Applying 4-bit quantization ({config.bnb_4bit_quant_type})")
-        quantized_count = 0
+    bits = 4 if config.load_in_4bit else 8 if config.load_in_8bit else None
+    if bits is not None:
+        if backend == "native":
+            print(f"[QUANTIZATION] Applying native {bits}-bit weight-only quantization")
+            convert = lambda linear: NativeQuantizedLinear.from_linear(
+                linear, bits=bits, group_size=config.native_group_size
+            )
+        elif bits == 4:
+            print(f"[QUANTIZATION] Applying 4-bit quantization ({config.bnb_4bit_quant_type})")
+            convert = lambda linear: quantize_linear_4bit(
+                linear,
+                quant_type=config.bnb_4bit_quant_type,
+                compute_dtype=config.bnb_4bit_compute_dtype,
+                double_quant=config.bnb_4bit_use_double_quant
+            )
+        else:
+            print("[QUANTIZATION] Applying 8-bit quantization")
+            convert = lambda linear: quantize_linear_8bit(linear, threshold=config.llm_int8_threshold)
         
-        for name, module in model.named_modules():
-            if isinstance(module, nn.Linear) and not isinstance(module, (LinearWithLoRA,)):
-                if module.in_features >= 256:  # Only quantize large layers
-                    parent_name = ".".join(name.split(".")[:-1])
-                    module_name = name.split(".")[-1]
-                    
-                    parent = model
-                    for part in parent_name.split("."):
-                        if part:
-                            parent = getattr(parent, part)
-                    
-                    quantized = quantize_linear_4bit(
-                        module,
-                        quant_type=config.bnb_4bit_quant_type,
-                        compute_dtype=config.bnb_4bit_compute_dtype,
-                        double_quant=config.bnb_4bit_use_double_quant
-                    )
-                    setattr(parent, module_name, quantized)
-                    quantized_count += 1
+        replaced = _replace_linears(model, convert, config.min_in_features, config.skip_modules)
+        print(f"[QUANTIZATION] Quantized {len(replaced)} layers to {bits}-bit")
         
-        print(f"[QUANTIZATION] Quantized {quantized_count} layers to 4-bit")
-    
-    elif config.load_in_8bit:
-        print("[QUANTIZATION] Applying 8-bit quantization")
-        # Similar logic for 8-bit
-        pass
+        if backend == "native":
+            # Recorded so save/load_quantized_model can rebuild the layout
+            model.native_quantization = {
+                "bits": bits,
+                "group_size": config.native_group_size,
+                "modules": replaced
+            }
     
     if config.use_lora:
         model = apply_lora(
@@ -287,6 +447,50 @@ def quantize_model(
     return model
 
 
+def save_quantized_model(model: nn.Module, path: Union[str, Path]):
+    """Save a natively quantized model (int weights, scales and layout)."""
+    layout = getattr(model, "native_quantization", None)
+    if layout is None:
+        raise ValueError("Model was not quantized with backend='native'")
+    
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    torch.save({"model_state_dict": model.state_dict(), "native_quantization": layout}, path)
+
+
+def load_quantized_model(model: nn.Module, path: Union[str, Path]) -> nn.Module:
+    """
+    Load a checkpoint written by save_quantized_model.
+    
+    Args:
+        model: Freshly constructed full-precision model with the same config
+        path: Checkpoint path
+    
+    Returns:
+        The model with quantized layers in place and weights loaded
+    """
+    checkpoint = torch.load(path, map_location="cpu")
+    layout = checkpoint["native_quantization"]
+    modules = set(layout["modules"])
+    
+    for name, module in list(model.named_modules()):
+        if name in modules and isinstance(module, nn.Linear):
+            parent_name, _, module_name = name.rpartition(".")
+            parent = model.get_submodule(parent_name) if parent_name else model
+            setattr(parent, module_name, NativeQuantizedLinear(
+                module.in_features,
+                module.out_features,
+                bias=module.bias is not None,
+                bits=layout["bits"],
+                group_size=layout["group_size"],
+                device=module.weight.device
+            ))
+    
+    model.load_state_dict(checkpoint["model_state_dict"])
+    model.native_quantization = layout
+    return model
+
+
 def get_trainable_params(model: nn.Module) -> Dict[str, int]:
     """Get count of trainable vs total parameters."""
     trainable = sum(p.numel() for p in model.parameters() if p.requires_grad)
@@ -314,6 +518,14 @@ if __name__ == "__main__":
     params = get_trainable_params(lora_linear)
     print(f"Trainable: {params['trainable']:,} / {params['total']:,} ({params['trainable_percent']:.2f}%)")
     
+    # Test native weight-only quantization
+    linear = nn.Linear(512, 256)
+    x = torch.randn(4, 512)
+    for bits in (8, 4):
+        quantized = NativeQuantizedLinear.from_linear(linear, bits=bits, group_size=128)
+        error = (quantized(x) - linear(x)).abs().max().item()
+        print(f"Native int{bits}: max abs error {error:.4f}")
+    
     if BNB_AVAILABLE:
         print("[bitsandbytes] Available - 4-bit/8-bit quantization supported")
     else: